@@ -0,0 +1,323 @@
+## -*- coding: UTF8 -*-
+## async_manager.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Optional, Any, Callable, Iterable, List, AsyncIterator, TypeVar
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from threading import Event
+
+from sqlalchemy.orm import Session
+
+from .manager import DBManager
+from .utils import BulkInsertResult
+
+T = TypeVar('T')    #pylint: disable=C0103
+
+
+class AsyncDBManager:
+    """Asyncio front-end for DBManager.  Runs session work on a bounded
+    thread pool so that database calls never block the event loop.  Each
+    awaited operation runs in its own session (unit of work), which is
+    committed (for writes) or rolled back (on error) and closed before
+    the operation completes.  When max_pending operations are already in
+    flight, further calls wait for a slot instead of queueing unbounded work.
+    """
+
+    def __init__(self,
+        manager: DBManager,
+        max_workers: int = 4,
+        max_pending: Optional[int] = None,
+        stream_buffer: int = 2
+    ) -> None:
+        self.manager = manager
+        self.max_workers = max_workers
+        self.max_pending = max_pending if max_pending is not None else 2 * max_workers
+        self.stream_buffer = stream_buffer
+        self.__executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='AsyncDBManager'
+        )
+        self.__semaphore = None
+
+    @property
+    def manager(self) -> DBManager:
+        """Getter for manager."""
+        return self.__manager
+
+    @manager.setter
+    def manager(self, value: DBManager) -> None:
+        """Setter for manager."""
+        self.__manager = value
+
+    @property
+    def max_workers(self) -> int:
+        """Getter for max_workers."""
+        return self.__max_workers
+
+    @max_workers.setter
+    def max_workers(self, value: int) -> None:
+        """Setter for max_workers."""
+        self.__max_workers = value
+
+    @property
+    def max_pending(self) -> int:
+        """Getter for max_pending."""
+        return self.__max_pending
+
+    @max_pending.setter
+    def max_pending(self, value: int) -> None:
+        """Setter for max_pending."""
+        self.__max_pending = value
+
+    @property
+    def stream_buffer(self) -> int:
+        """Getter for stream_buffer."""
+        return self.__stream_buffer
+
+    @stream_buffer.setter
+    def stream_buffer(self, value: int) -> None:
+        """Setter for stream_buffer."""
+        self.__stream_buffer = value
+
+    def __new_session(self) -> Session:
+        """
+        Args:
+            N/A
+        Returns:
+            New (non-scoped) session from self.manager.session_factory, which
+            does not expire instances on commit, so that instances returned by
+            operations keep their (committed) attribute values once detached.
+        Preconditions:
+            self.manager has been initialized (see: DBManager.initialize)
+        """
+        session_factory = self.manager.session_factory
+        if self.manager.scoped_sessions:
+            session_factory = session_factory.session_factory
+        return session_factory(expire_on_commit=False)
+
+    def __unit_of_work(self,
+        func: Callable[..., T],
+        commit: bool,
+        args: Any,
+        kwargs: Any
+    ) -> T:
+        """
+        Args:
+            func    => callable to run, taking a session as first argument
+            commit  => whether to commit the session if func succeeds
+            args    => additional positional arguments to func
+            kwargs  => additional keyword arguments to func
+        Returns:
+            Result of func.
+        Procedure:
+            Run func with a new session, committing if specified and rolling back
+            if func raises, then close the session.  Runs on an executor thread.
+        Preconditions:
+            N/A
+        """
+        session = self.__new_session()
+        try:
+            result = func(session, *args, **kwargs)
+            if commit:
+                session.commit()
+            return result
+        except BaseException:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    async def run(self,
+        func: Callable[..., T],
+        *args: Any,
+        commit: bool = True,
+        **kwargs: Any
+    ) -> T:
+        """
+        Args:
+            func    => callable to run, taking a session as first argument
+            args    => additional positional arguments to func
+            commit  => whether to commit the session if func succeeds
+            kwargs  => additional keyword arguments to func
+        Returns:
+            Result of func, run with its own session on the thread pool.
+        Preconditions:
+            N/A
+        """
+        if self.__semaphore is None:
+            self.__semaphore = asyncio.Semaphore(self.max_pending)
+        async with self.__semaphore:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.__executor,
+                self.__unit_of_work,
+                func,
+                commit,
+                args,
+                kwargs
+            )
+
+    async def add(self, record: Any) -> Any:
+        """
+        Args:
+            record  => record to add
+        Returns:
+            record, after it has been added and committed in its own session.
+            NOTE:
+                The record is detached once the session is closed, but keeps the
+                values of its attributes (including its primary key).  Server-side
+                defaults other than the primary key (i.e. created_at) are not
+                loaded.
+        Preconditions:
+            N/A
+        """
+        def add(session: Session) -> Any:
+            self.manager.add(record, session=session)
+            return record
+        return await self.run(add)
+
+    async def add_many(self,
+        model: Any,
+        records: Iterable[Any],
+        batch_size: int = 1000,
+        commit_every: Optional[int] = None
+    ) -> BulkInsertResult:
+        """
+        Args:
+            model           => model of table to insert records into
+            records         => iterable of ORM instances of model and/or dicts
+            batch_size      => number of records to insert per statement execution
+            commit_every    => number of batches after which to commit
+        Returns:
+            Result of DBManager.add_many, run in its own session and committed.
+        Preconditions:
+            See: DBManager.add_many
+        """
+        return await self.run(
+            lambda session: self.manager.add_many(
+                model,
+                records,
+                batch_size=batch_size,
+                commit_every=commit_every,
+                session=session
+            )
+        )
+
+    async def fetch(self, model: Any, **kwargs: Any) -> List[Any]:
+        """
+        Args:
+            model   => model of table to query
+            kwargs  => fields to filter on
+        Returns:
+            List of (detached) instances of model with field filters from
+            kwargs applied (see: DBManager.fetch).
+        Preconditions:
+            N/A
+        """
+        return await self.run(
+            lambda session: self.manager.fetch(model, session=session, **kwargs),
+            commit=False
+        )
+
+    async def stream(self,
+        model: Any,
+        chunk_size: int = 1000,
+        as_rows: bool = False,
+        **kwargs: Any
+    ) -> AsyncIterator[List[Any]]:
+        """
+        Args:
+            model       => model of table to query
+            chunk_size  => number of rows to fetch from the cursor at a time
+            as_rows     => whether to yield raw result rows instead of ORM instances
+            kwargs      => fields to filter on
+        Returns:
+            Async iterator of lists of at most chunk_size (detached) instances of
+            model, or result rows if as_rows is True (see: DBManager.stream).
+            NOTE:
+                The whole query runs on a single executor thread, which reads
+                at most self.stream_buffer chunks ahead of the consumer.  If the
+                consumer stops early, the cursor is closed once the async iterator
+                is closed (i.e. with aclose()).
+        Preconditions:
+            chunk_size is greater than 0
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.stream_buffer)
+        stopped = Event()
+
+        def put(item: Any) -> bool:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while True:
+                try:
+                    future.result(timeout=0.1)
+                    return True
+                except FutureTimeoutError:
+                    if stopped.is_set():
+                        future.cancel()
+                        return False
+
+        def produce(session: Session) -> None:
+            try:
+                for chunk in self.manager.stream(
+                    model,
+                    chunk_size,
+                    as_rows,
+                    session=session,
+                    **kwargs
+                ):
+                    if stopped.is_set() or not put((chunk, None)):
+                        return
+            except Exception as exc: #pylint: disable=W0703
+                put((None, exc))
+                return
+            put((None, None))
+
+        producer = asyncio.ensure_future(self.run(produce, commit=False))
+        try:
+            while True:
+                chunk, error = await queue.get()
+                if error is not None:
+                    raise error
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            stopped.set()
+            await producer
+
+    async def close(self) -> None:
+        """
+        Args:
+            N/A
+        Procedure:
+            Wait for pending operations to finish and shut down the thread pool.
+        Preconditions:
+            N/A
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self.__executor.shutdown)
+
+    async def __aenter__(self) -> 'AsyncDBManager':
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
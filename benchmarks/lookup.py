@@ -0,0 +1,100 @@
+## -*- coding: UTF8 -*-
+## benchmarks/lookup.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Any, Callable, Dict
+import json
+from argparse import ArgumentParser
+from time import perf_counter
+
+from ..manager import DBManager
+from .models import BenchmarkTable, FileLedger, Record
+
+
+def _per_call(func: Callable[[], Any], calls: int) -> float:
+    """
+    Args:
+        func    => function to time
+        calls   => number of times to call func
+    Returns:
+        Mean number of microseconds per call of func.
+    Preconditions:
+        calls is greater than 0
+    """
+    start = perf_counter()
+    for _ in range(calls):
+        func()
+    return (perf_counter() - start) / calls * 1e6
+
+def run(calls: int = 5000, rows: int = 10000) -> Dict[str, Any]:
+    """
+    Args:
+        calls   => number of lookups to time per path
+        rows    => number of records to load before timing lookups
+    Returns:
+        Dict of mean per-call latency (in microseconds) of primary key lookups through
+        DBManager.query (statement rebuilt and recompiled on every call) and
+        DBManager.lookup (baked statement, only parameters bound per call),
+        against an in-memory SQLite database.
+    Preconditions:
+        N/A
+    """
+    manager = DBManager().initialize(
+        'sqlite://',
+        BenchmarkTable.metadata,
+        bootstrap=True,
+        create_session=True
+    )
+    manager.add(
+        FileLedger(file_name='ledger', file_path='/ledger', file_size=0),
+        commit=True
+    )
+    manager.add_many(Record, (
+        dict(ledger_id=1, record_number=i, name='record_%d'%i) \
+        for i in range(rows)
+    ), commit=True)
+    def query() -> Any:
+        return manager.query(Record, id=rows // 2, ledger_id=1).first()
+    def lookup() -> Any:
+        return manager.lookup(Record, id=rows // 2, ledger_id=1).first()
+    query()
+    lookup()
+    query_us = _per_call(query, calls)
+    lookup_us = _per_call(lookup, calls)
+    return dict(
+        benchmark='lookup',
+        calls=calls,
+        rows=rows,
+        query_us_per_call=query_us,
+        lookup_us_per_call=lookup_us,
+        saving_us_per_call=query_us - lookup_us,
+        speedup=query_us / lookup_us if lookup_us else None
+    )
+
+if __name__ == '__main__':
+    PARSER = ArgumentParser(
+        description='Compare DBManager.query and DBManager.lookup latency'
+    )
+    PARSER.add_argument('--calls', type=int, default=5000)
+    PARSER.add_argument('--rows', type=int, default=10000)
+    ARGS = PARSER.parse_args()
+    print(json.dumps(run(ARGS.calls, ARGS.rows), indent=2))
@@ -0,0 +1,45 @@
+## -*- coding: UTF8 -*-
+## benchmarks/models.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from sqlalchemy.types import Integer
+from sqlalchemy.schema import Column
+from sqlalchemy.ext.declarative import declarative_base
+
+from ..models import BaseTableTemplate, TableMixin, FileLedgerMixin, FileLedgerLinkedMixin
+from ..utils import DialectSpecificText
+
+BenchmarkTable = declarative_base(cls=BaseTableTemplate) #pylint: disable=C0103
+
+
+class FileLedger(BenchmarkTable, FileLedgerMixin):
+    """Synthetic file ledger table."""
+
+
+class Record(BenchmarkTable, TableMixin, FileLedgerLinkedMixin):
+    """Synthetic table of parsed records linked to the file ledger table."""
+    record_number = Column(Integer, nullable=False)
+    sequence_number = Column(Integer)
+    record_type = Column(DialectSpecificText())
+    name = Column(DialectSpecificText())
+    path = Column(DialectSpecificText())
+    size = Column(Integer)
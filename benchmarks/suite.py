@@ -0,0 +1,409 @@
+## -*- coding: UTF8 -*-
+## benchmarks/suite.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Optional, Any, Callable, Dict, List, Sequence
+import json
+import os
+import platform
+import sqlite3
+import tracemalloc
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+from time import perf_counter, time
+
+import sqlalchemy
+from sqlalchemy import event, func, select
+from sqlalchemy.types import Integer
+from sqlalchemy.schema import Column
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from ..manager import DBManager
+from ..models import BaseTableTemplate, TableMixin, FileLedgerLinkedMixin
+from ..utils import DialectSpecificText
+from . import lookup
+from .models import BenchmarkTable, FileLedger, Record
+
+
+def _timed(call: Callable[[], Any]) -> float:
+    """
+    Args:
+        call    => function to time
+    Returns:
+        Number of seconds call took to run.
+    Preconditions:
+        N/A
+    """
+    start = perf_counter()
+    call()
+    return perf_counter() - start
+
+def _throughput(rows: int, seconds: float) -> Dict[str, float]:
+    """
+    Args:
+        rows    => number of rows processed
+        seconds => number of seconds taken to process rows
+    Returns:
+        Dict of rows, seconds and rows_per_second.
+    Preconditions:
+        N/A
+    """
+    return dict(
+        rows=rows,
+        seconds=seconds,
+        rows_per_second=rows / seconds if seconds > 0 else None
+    )
+
+def _parsed_records(ledger_id: int, count: int, offset: int = 0) -> List[Dict[str, Any]]:
+    """
+    Args:
+        ledger_id   => ledger id of records
+        count       => number of records to generate
+        offset      => record number of first record
+    Returns:
+        Synthetic parser output (camel case keyed dicts) for Record.
+    Preconditions:
+        N/A
+    """
+    return [
+        dict(
+            ledgerId=ledger_id,
+            recordNumber=i,
+            sequenceNumber=i % 16,
+            recordType='FILE' if i % 4 else 'DIRECTORY',
+            name='file_%d.bin'%i,
+            path='/evidence/%d/file_%d.bin'%(i // 100, i),
+            size=i * 512
+        ) for i in range(offset, offset + count)
+    ]
+
+def _create_manager(conn_string: str) -> DBManager:
+    """
+    Args:
+        conn_string => database connection string
+    Returns:
+        Bootstrapped DBManager with a persisted session, with SQLite foreign key
+        enforcement enabled so that ledger deletes cascade.
+    Preconditions:
+        N/A
+    """
+    manager = DBManager(conn_string, BenchmarkTable.metadata)
+    manager.create_engine()
+    @event.listens_for(manager.engine, 'connect')
+    def connect(dbapi_connection: Any, connection_record: Any) -> None: #pylint: disable=W0612,W0613
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys = ON')
+        cursor.close()
+    manager.bootstrap()
+    manager.session_factory = sessionmaker(bind=manager.engine, autoflush=False)
+    manager.create_session()
+    return manager
+
+def _add_ledger(manager: DBManager, name: str) -> int:
+    """
+    Args:
+        manager => database manager to add ledger with
+        name    => file name of ledger
+    Returns:
+        Id of new, committed ledger row.
+    Preconditions:
+        N/A
+    """
+    ledger = FileLedger(file_name=name, file_path='/%s'%name, file_size=0, completed=True)
+    manager.add(ledger, commit=True)
+    return ledger.id
+
+def bench_populate_fields(records: int) -> Dict[str, Any]:
+    """
+    Args:
+        records => number of records to populate
+    Returns:
+        Cost per record of BaseTableTemplate.populate_fields (creating ORM
+        instances) and BaseTableTemplate.to_mappings (creating insert mappings).
+    Preconditions:
+        N/A
+    """
+    data = _parsed_records(1, records)
+    populate = _timed(
+        lambda: [Record().populate_fields(item) for item in data]   #pylint: disable=E1101
+    )
+    mappings = _timed(lambda: Record.to_mappings(data))             #pylint: disable=E1101
+    return dict(
+        records=records,
+        populate_fields_us_per_record=populate / records * 1e6,
+        to_mappings_us_per_record=mappings / records * 1e6
+    )
+
+def bench_inserts(manager: DBManager, records: int, batch_size: int) -> Dict[str, Any]:
+    """
+    Args:
+        manager     => database manager to insert with
+        records     => number of records to insert per method
+        batch_size  => batch size of DBManager.add_many
+    Returns:
+        Throughput of DBManager.add (per-record ORM instances) followed by a single
+        commit versus DBManager.add_many (batched Core inserts) of the same records.
+    Preconditions:
+        N/A
+    """
+    ledger_id = _add_ledger(manager, 'inserts')
+    data = _parsed_records(ledger_id, records)
+    def add() -> None:
+        for item in data:
+            manager.add(Record().populate_fields(item))  #pylint: disable=E1101
+        manager.commit()
+    add_seconds = _timed(add)
+    manager.session.expunge_all()
+    mappings = Record.to_mappings(  #pylint: disable=E1101
+        _parsed_records(ledger_id, records, records)
+    )
+    add_many_seconds = _timed(
+        lambda: manager.add_many(Record, mappings, batch_size=batch_size, commit=True)
+    )
+    return dict(
+        add_commit=_throughput(records, add_seconds),
+        add_many=dict(batch_size=batch_size, **_throughput(records, add_many_seconds))
+    )
+
+def bench_query(manager: DBManager, calls: int) -> Dict[str, Any]:
+    """
+    Args:
+        manager => database manager to query with
+        calls   => number of queries to time
+    Returns:
+        Mean latency of filtered DBManager.query and DBManager.lookup calls on
+        the (indexed) ledger_id column and the (unindexed) record_number column.
+    Preconditions:
+        Records have been inserted (see: bench_inserts)
+    """
+    ledger_id = manager.session.query(func.max(Record.ledger_id)).scalar()
+    count = manager.query(Record, ledger_id=ledger_id).count()
+    results = dict(calls=calls)
+    for name, filters in (
+        ('indexed', dict(ledger_id=ledger_id)),
+        ('unindexed', dict(record_number=count // 2))
+    ):
+        results['query_%s_us'%name] = _timed(
+            lambda: [manager.query(Record, **filters).first() for _ in range(calls)] #pylint: disable=W0640
+        ) / calls * 1e6
+        results['lookup_%s_us'%name] = _timed(
+            lambda: [manager.lookup(Record, **filters).first() for _ in range(calls)] #pylint: disable=W0640
+        ) / calls * 1e6
+    return results
+
+def bench_fetch(manager: DBManager) -> Dict[str, Any]:
+    """
+    Args:
+        manager => database manager to query with
+    Returns:
+        Time and memory (traced allocations still held) per row to fetch every
+        record as ORM instances (DBManager.query) versus read-only records
+        (DBManager.records).
+    Preconditions:
+        Records have been inserted (see: bench_inserts)
+    """
+    results = dict()
+    def new_session() -> Any:
+        return manager.create_session(persist=False)
+    for name, fetch in (
+        ('instances', lambda: manager.query(Record, session=new_session()).all()),
+        ('records', lambda: manager.records(Record, session=new_session()))
+    ):
+        rows = list()
+        seconds = _timed(lambda: rows.extend(fetch()))  #pylint: disable=W0640
+        results['%s_us_per_row'%name] = seconds / len(rows) * 1e6
+        rows.clear()
+        tracemalloc.start()
+        rows.extend(fetch())
+        results['%s_bytes_per_row'%name] = tracemalloc.get_traced_memory()[0] / len(rows)
+        tracemalloc.stop()
+    results['rows'] = len(rows)
+    return results
+
+def bench_bootstrap(conn_string: str, tables: int) -> Dict[str, Any]:
+    """
+    Args:
+        conn_string => database connection string
+        tables      => number of linked tables in metadata
+    Returns:
+        Time taken by DBManager.bootstrap to create metadata containing a file
+        ledger table and tables linked tables (each with indexes).
+    Preconditions:
+        N/A
+    """
+    base = declarative_base(cls=BaseTableTemplate)
+    type('FileLedger', (base, TableMixin), dict(
+        file_name=Column(DialectSpecificText())
+    ))
+    for i in range(tables):
+        type('Linked%d'%i, (base, TableMixin, FileLedgerLinkedMixin), dict(
+            value=Column(Integer, index=True),
+            name=Column(DialectSpecificText())
+        ))
+    manager = DBManager(conn_string, base.metadata)
+    manager.create_engine()
+    seconds = _timed(manager.bootstrap)
+    manager.engine.dispose()
+    return dict(tables=tables + 1, seconds=seconds)
+
+def bench_cascade_delete(
+    manager: DBManager,
+    records: int,
+    batch_size: int
+) -> Dict[str, Any]:
+    """
+    Args:
+        manager     => database manager to delete with
+        records     => number of linked records of ledger to delete
+        batch_size  => batch size used to insert records
+    Returns:
+        Time taken to delete a ledger and (through ON DELETE CASCADE) its linked
+        records with DBManager.delete.
+    Preconditions:
+        N/A
+    """
+    ledger_id = _add_ledger(manager, 'cascade')
+    manager.add_many(
+        Record,
+        Record.to_mappings(_parsed_records(ledger_id, records)),   #pylint: disable=E1101
+        batch_size=batch_size,
+        commit=True
+    )
+    ledger = manager.query(FileLedger, id=ledger_id).one()
+    seconds = _timed(lambda: manager.delete(ledger, commit=True))
+    table = Record.__table__    #pylint: disable=E1101
+    remaining = manager.session.execute(
+        select([func.count()]).select_from(table).where(table.c.ledger_id == ledger_id)
+    ).scalar()
+    return dict(cascaded=remaining == 0, **_throughput(records, seconds))
+
+def run(
+    databases: Sequence[str] = ('memory', 'file'),
+    records: int = 20000,
+    batch_size: int = 1000,
+    calls: int = 1000,
+    tables: int = 200,
+    directory: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Args:
+        databases   => SQLite databases to run against ('memory' and/or 'file')
+        records     => number of records per ingestion/deletion benchmark
+        batch_size  => batch size of DBManager.add_many
+        calls       => number of calls per latency benchmark
+        tables      => number of linked tables in bootstrap benchmark metadata
+        directory   => directory to create file databases in (defaults to a
+                       temporary directory)
+    Returns:
+        Machine-readable (JSON serializable) benchmark results, including the
+        environment they were collected in.
+    Preconditions:
+        N/A
+    """
+    results = dict(
+        timestamp=time(),
+        environment=dict(
+            python=platform.python_version(),
+            sqlalchemy=sqlalchemy.__version__,
+            sqlite=sqlite3.sqlite_version,
+            platform=platform.platform()
+        ),
+        parameters=dict(
+            records=records,
+            batch_size=batch_size,
+            calls=calls,
+            tables=tables
+        ),
+        populate_fields=bench_populate_fields(records),
+        lookup=lookup.run(calls, records),
+        databases=dict()
+    )
+    with TemporaryDirectory() as tmp_directory:
+        directory = directory if directory is not None else tmp_directory
+        for database in databases:
+            if database == 'memory':
+                conn_string = 'sqlite://'
+                bootstrap_conn_string = 'sqlite://'
+            else:
+                path = os.path.join(directory, 'benchmark.db')
+                if os.path.exists(path):
+                    os.remove(path)
+                conn_string = 'sqlite:///%s'%path
+                bootstrap_conn_string = 'sqlite:///%s'%os.path.join(
+                    directory,
+                    'bootstrap.db'
+                )
+            manager = _create_manager(conn_string)
+            results['databases'][database] = dict(
+                inserts=bench_inserts(manager, records, batch_size),
+                query=bench_query(manager, calls),
+                fetch=bench_fetch(manager),
+                cascade_delete=bench_cascade_delete(manager, records, batch_size),
+                bootstrap=bench_bootstrap(bootstrap_conn_string, tables)
+            )
+            manager.close_session()
+            manager.engine.dispose()
+    return results
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """
+    Args:
+        argv    => command line arguments (defaults to sys.argv)
+    Procedure:
+        Run the benchmark suite and write its results as JSON to stdout
+        or the file given by --output.
+    Preconditions:
+        N/A
+    """
+    parser = ArgumentParser(
+        description='Run ingestion and query benchmarks against SQLite'
+    )
+    parser.add_argument(
+        '--databases',
+        nargs='+',
+        choices=('memory', 'file'),
+        default=['memory', 'file']
+    )
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--tables', type=int, default=200)
+    parser.add_argument('--directory', default=None)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+    results = run(
+        args.databases,
+        args.records,
+        args.batch_size,
+        args.calls,
+        args.tables,
+        args.directory
+    )
+    if args.output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+## -*- coding: UTF8 -*-
+## bounded.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Optional, Any, Dict, Union
+import os
+
+from sqlalchemy.orm import Session, scoped_session
+
+try:
+    import psutil
+except ImportError:
+    psutil = None   #pylint: disable=C0103
+
+
+def current_memory() -> Optional[int]:
+    """
+    Args:
+        N/A
+    Returns:
+        Resident memory of this process in bytes, from psutil if it is installed
+        or /proc/self/statm otherwise, or None if neither is available.
+    Preconditions:
+        N/A
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class SessionBounds:
+    """Keeps the memory held by a long-lived session bounded, by flushing (and
+    optionally expunging) it every max_objects added objects or whenever the
+    resident memory of the process exceeds max_memory, and expunging it after
+    each commit.  Flushed instances no longer referenced elsewhere are released
+    by the (weak-referencing) identity map, while expunging also releases those
+    the caller still references, which then have to be re-added (Session.add or
+    Session.merge) for further changes to be tracked.
+    Args:
+        max_objects     => number of objects to add between flushes (if None,
+                           sessions are only flushed at the memory threshold)
+        max_memory      => resident memory (in bytes) above which sessions are
+                           flushed (see: current_memory)
+        expunge         => whether to expunge every instance from sessions once
+                           they have been flushed or committed
+        memory_interval => number of objects to add between memory checks
+    """
+
+    def __init__(self,
+        max_objects: Optional[int] = 10000,
+        max_memory: Optional[int] = None,
+        expunge: bool = True,
+        memory_interval: int = 1000
+    ) -> None:
+        if max_objects is not None and max_objects < 1:
+            raise ValueError('max_objects must be greater than 0')
+        if memory_interval < 1:
+            raise ValueError('memory_interval must be greater than 0')
+        self.max_objects = max_objects
+        self.max_memory = max_memory
+        self.expunge = expunge
+        self.memory_interval = memory_interval
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset counters."""
+        self.__added = 0
+        self.__pending = 0
+        self.__flushes = 0
+        self.__expunged = 0
+        self.__peak_tracked = 0
+
+    def added(self, session: Session) -> bool:
+        """
+        Args:
+            session => session an object was just added to
+        Returns:
+            Whether session was released (see: release) because it reached
+            max_objects added objects or max_memory.
+        Preconditions:
+            N/A
+        """
+        self.__added += 1
+        self.__pending += 1
+        self.__peak_tracked = max(self.__peak_tracked, self.__pending)
+        if self.max_objects is not None and self.__pending >= self.max_objects:
+            self.release(session)
+            return True
+        if self.max_memory is not None and self.__added % self.memory_interval == 0:
+            memory = current_memory()
+            if memory is not None and memory > self.max_memory:
+                self.release(session)
+                return True
+        return False
+
+    def release(self, session: Session) -> None:
+        """
+        Args:
+            session => session to release
+        Procedure:
+            Flush session, then expunge every instance from it if self.expunge.
+        Preconditions:
+            N/A
+        """
+        self.__peak_tracked = max(self.__peak_tracked, self.tracked(session))
+        session.flush()
+        self.__flushes += 1
+        self.__pending = 0
+        if self.expunge:
+            self.__expunged += len(session.identity_map)
+            session.expunge_all()
+
+    def committed(self, session: Session) -> None:
+        """
+        Args:
+            session => session that was just committed
+        Procedure:
+            Expunge every (expired) instance from session if self.expunge.
+        Preconditions:
+            N/A
+        """
+        self.__pending = 0
+        if self.expunge:
+            self.__expunged += len(session.identity_map)
+            session.expunge_all()
+
+    @staticmethod
+    def tracked(session: Session) -> int:
+        """
+        Args:
+            session => session to count objects of
+        Returns:
+            Number of objects currently tracked by session (persistent, pending and
+            deleted).
+        Preconditions:
+            N/A
+        """
+        return len(session.identity_map) + len(session.new) + len(session.deleted)
+
+    def stats(self, session: Optional[Session] = None) -> Dict[str, Any]:
+        """
+        Args:
+            session => session to count tracked objects of
+        Returns:
+            Dict of counters: objects added, flushes, instances expunged, peak and
+            (if session is provided) current number of tracked objects, and current
+            resident memory.
+        Preconditions:
+            N/A
+        """
+        stats = dict(
+            added=self.__added,
+            flushes=self.__flushes,
+            expunged=self.__expunged,
+            peak_tracked=self.__peak_tracked,
+            memory=current_memory()
+        )
+        if session is not None:
+            stats['tracked'] = self.tracked(session)
+            stats['pending'] = len(session.new)
+        return stats
+
+
+class BoundedSessionMixin:
+    """Mixin for DBManager bounding the memory held by its sessions
+    (see: SessionBounds)."""
+
+    @property
+    def session_bounds(self) -> Optional[SessionBounds]:
+        """Getter for session_bounds."""
+        return self.__session_bounds
+
+    @session_bounds.setter
+    def session_bounds(self, value: Optional[SessionBounds]) -> None:
+        """Setter for session_bounds."""
+        self.__session_bounds = value
+
+    def enable_bounded_session(self,
+        max_objects: Optional[int] = 10000,
+        max_memory: Optional[int] = None,
+        expunge: bool = True
+    ) -> 'DBManager':
+        """
+        Args:
+            max_objects => number of objects to add between automatic flushes
+            max_memory  => resident memory (in bytes) above which to flush
+            expunge     => whether to expunge instances once flushed or committed
+        Procedure:
+            Bound the memory held by sessions written to with add: every max_objects
+            added objects, or once resident memory exceeds max_memory, the session is
+            flushed and (if expunge) cleared of instances, which are also cleared
+            after every commit (see: SessionBounds).
+            NOTE:
+                Expunged instances are no longer tracked, so changes made to them
+                afterwards (i.e. marking a ledger row completed) are only persisted
+                if they are added to the session again.
+        Preconditions:
+            N/A
+        """
+        self.session_bounds = SessionBounds(max_objects, max_memory, expunge)
+        return self
+
+    def disable_bounded_session(self) -> 'DBManager':
+        """
+        Args:
+            N/A
+        Procedure:
+            Stop automatically flushing and expunging sessions.
+        Preconditions:
+            N/A
+        """
+        self.session_bounds = None
+        return self
+
+    def session_stats(self,
+        session: Optional[Union[Session, scoped_session]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Args:
+            session => session to count tracked objects of (default: self.session)
+        Returns:
+            Bounded session counters, including the number of objects currently
+            tracked by session (see: SessionBounds.stats), or None if bounded
+            sessions are not enabled.
+        Preconditions:
+            N/A
+        """
+        if self.session_bounds is None:
+            return None
+        return self.session_bounds.stats(session if session is not None else self.session)
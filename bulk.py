@@ -0,0 +1,281 @@
+## -*- coding: UTF8 -*-
+## bulk.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Optional, Any, Callable, Union, Iterable, Dict, FrozenSet, Sequence
+from time import perf_counter
+
+from sqlalchemy import inspect
+from sqlalchemy.engine.interfaces import Dialect
+from sqlalchemy.schema import Table
+from sqlalchemy.orm import scoped_session, Session
+
+from .utils import BulkInsertResult, chunked
+from .loader import load
+from .upsert import upsert_statement
+from .writer import GroupCommitWriter
+
+
+def _record_to_mapping(record: Any) -> Dict[str, Any]:
+    """
+    Args:
+        record  => ORM instance or dict to convert
+    Returns:
+        Dict mapping column keys to values for record.  Dicts are returned
+        as-is, while for ORM instances unset (None) attributes are omitted
+        so that server-side defaults (i.e. created_at) still apply.
+    Preconditions:
+        record is either a dict or an instance of a mapped class
+    """
+    if isinstance(record, dict):
+        return record
+    mapping = dict()
+    for attr in inspect(record).mapper.column_attrs:
+        value = getattr(record, attr.key)
+        if value is not None:
+            mapping[attr.columns[0].key] = value
+    return mapping
+
+def _execute_grouped(
+    session: Union[Session, scoped_session],
+    mappings: Iterable[Dict[str, Any]],
+    statement: Callable[[FrozenSet[str]], Any]
+) -> None:
+    """
+    Args:
+        session     => session to execute statements with
+        mappings    => dicts mapping column keys to values
+        statement   => function returning the statement to execute for a set
+                       of column keys
+    Procedure:
+        Group mappings by their set of keys, and execute the statement for each
+        set of keys once (executemany-style) with its group of mappings, so that
+        each execution has a uniform parameter set.
+    Preconditions:
+        N/A
+    """
+    groups = dict()
+    for mapping in mappings:
+        groups.setdefault(frozenset(mapping), list()).append(mapping)
+    for keys, params in groups.items():
+        session.execute(statement(keys), params)
+
+def _upsert_statements(
+    dialect: Dialect,
+    table: Table,
+    conflict_keys: Sequence[str],
+    overwrite: bool
+) -> Callable[[FrozenSet[str]], Any]:
+    """
+    Args:
+        dialect         => dialect to build statements for
+        table           => table to upsert into
+        conflict_keys   => column keys identifying existing rows
+        overwrite       => whether to overwrite values of existing rows
+    Returns:
+        Function returning the upsert statement (see: upsert.upsert_statement)
+        for a set of column keys, building it once per set of keys.
+    Preconditions:
+        N/A
+    """
+    statements = dict()
+    def statement(keys: FrozenSet[str]) -> Any:
+        if keys not in statements:
+            statements[keys] = upsert_statement(
+                dialect,
+                table,
+                sorted(keys),
+                conflict_keys,
+                overwrite
+            )
+        return statements[keys]
+    return statement
+
+
+class BulkWriteMixin:
+    """Mixin for DBManager writing rows in bulk, bypassing the ORM unit of
+    work: batched Core inserts and upserts, native bulk loads, and group
+    commits of records submitted by concurrent producers."""
+
+    def add_many(self,
+        model: Any,
+        records: Iterable[Any],
+        batch_size: int = 1000,
+        commit_every: Optional[int] = None,
+        session: Optional[Union[Session, scoped_session]] = None,
+        commit: bool = False
+    ) -> BulkInsertResult:
+        """
+        Args:
+            model           => model of table to insert records into
+            records         => iterable of ORM instances of model and/or dicts
+                               mapping column names to values
+            batch_size      => number of records to insert per statement execution
+            commit_every    => number of batches after which to commit (if None,
+                               only commit at end if commit is True)
+            session         => session to execute inserts with
+            commit          => whether to commit and end the transaction block
+                               once all records are inserted
+        Returns:
+            BulkInsertResult containing number of rows inserted, batches executed,
+            commits issued and elapsed time (see BulkInsertResult.rows_per_second).
+        Procedure:
+            Insert records into the table of model in batches of batch_size using
+            executemany-style Core INSERT statements, bypassing the ORM unit of
+            work.  Records within a batch are grouped by their set of keys so that
+            each execution has a uniform parameter set.
+            NOTE:
+                Because inserts bypass the ORM, ORM instances passed in records
+                are not added to the session and will not have primary keys or
+                server defaults populated.
+        Preconditions:
+            batch_size is greater than 0
+            commit_every is None or greater than 0
+        """
+        if session is None:
+            session = self.session
+        self.invalidate_on_commit(session, model)
+        statement = inspect(model).local_table.insert()
+        rows = batches = commits = 0
+        start = perf_counter()
+        for batch in chunked(records, batch_size):
+            _execute_grouped(
+                session,
+                (_record_to_mapping(record) for record in batch),
+                lambda keys: statement
+            )
+            rows += len(batch)
+            batches += 1
+            if commit_every is not None and batches % commit_every == 0:
+                self.commit(session)
+                commits += 1
+        if (commit or commit_every is not None) and \
+           (commit_every is None or batches % commit_every != 0):
+            self.commit(session)
+            commits += 1
+        return BulkInsertResult(rows, batches, commits, perf_counter() - start)
+
+    def upsert(self,
+        model: Any,
+        mappings: Iterable[Dict[str, Any]],
+        conflict_keys: Sequence[str],
+        overwrite: bool = True,
+        batch_size: int = 1000,
+        session: Optional[Union[Session, scoped_session]] = None,
+        commit: bool = False
+    ) -> BulkInsertResult:
+        """
+        Args:
+            model           => model of table to upsert mappings into
+            mappings        => iterable of dicts mapping column keys to values
+            conflict_keys   => column keys identifying existing rows (i.e.
+                               ('ledger_id', 'structure_id'))
+            overwrite       => whether to overwrite values of existing rows, or
+                               only fill in their NULL values (mirroring
+                               BaseTableTemplate.populate_fields)
+            batch_size      => number of mappings to execute per statement execution
+            session         => session to execute upserts with
+            commit          => whether to commit and end the transaction block
+        Returns:
+            BulkInsertResult containing number of rows upserted, batches executed,
+            commits issued and elapsed time.
+        Procedure:
+            Insert mappings into the table of model, updating rows that already
+            exist instead, in a single round trip per batch using the dialect's
+            native upsert statement (see: upsert.upsert_statement).
+        Preconditions:
+            conflict_keys matches a primary key or unique constraint/index of the
+            table of model, and every mapping contains conflict_keys
+        """
+        if session is None:
+            session = self.session
+        self.invalidate_on_commit(session, model)
+        statement = _upsert_statements(
+            session.get_bind(mapper=inspect(model)).dialect,
+            inspect(model).local_table,
+            conflict_keys,
+            overwrite
+        )
+        rows = batches = 0
+        start = perf_counter()
+        for batch in chunked(mappings, batch_size):
+            _execute_grouped(session, batch, statement)
+            rows += len(batch)
+            batches += 1
+        if commit:
+            self.commit(session)
+        return BulkInsertResult(rows, batches, int(commit), perf_counter() - start)
+
+    def load(self,
+        model: Any,
+        mappings: Iterable[Dict[str, Any]],
+        batch_size: int = 10000
+    ) -> BulkInsertResult:
+        """
+        Args:
+            model       => model of table to load mappings into
+            mappings    => iterable of dicts mapping column keys to values
+            batch_size  => number of mappings to buffer and load at a time
+        Returns:
+            BulkInsertResult of loading mappings in a single transaction using
+            the fastest native path of self.engine's dialect (see: loader.load).
+        Preconditions:
+            self.engine is not None
+        """
+        try:
+            return load(self.engine, model, mappings, batch_size)
+        finally:
+            self.invalidate(model)
+
+    def create_writer(self,
+        max_batch_size: int = 10000,
+        max_delay: float = 0.05,
+        max_retries: int = 5,
+        backoff: float = 0.05,
+        max_pending: int = 0
+    ) -> GroupCommitWriter:
+        """
+        Args:
+            max_batch_size  => number of records after which to commit a group
+            max_delay       => maximum number of seconds to wait for further
+                               submissions before committing a group
+            max_retries     => number of times to retry a group after a lock or
+                               deadlock error
+            backoff         => initial delay in seconds between retries (doubled
+                               after each retry)
+            max_pending     => maximum number of waiting submissions before
+                               submit blocks (0 for unbounded)
+        Returns:
+            Started GroupCommitWriter that coalesces records submitted by
+            concurrent producers into one transaction per time window or size
+            threshold (see: writer.GroupCommitWriter).
+        Preconditions:
+            self.session_factory is not None
+        """
+        return GroupCommitWriter(
+            self,
+            max_batch_size=max_batch_size,
+            max_delay=max_delay,
+            max_retries=max_retries,
+            backoff=backoff,
+            max_pending=max_pending
+        ).start()
@@ -0,0 +1,584 @@
+## -*- coding: UTF8 -*-
+## cache.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Optional, Any, Callable, Hashable, Iterable, Dict, List, Set, Tuple, \
+    Union
+from collections import OrderedDict
+from hashlib import blake2b
+from itertools import chain
+from math import ceil, log
+from threading import RLock
+from time import monotonic
+
+from sqlalchemy import inspect, event
+from sqlalchemy.schema import Table
+from sqlalchemy.orm import Session, scoped_session, make_transient_to_detached
+
+from .records import record_class, record_fields
+from .utils import unscoped_sessionmaker, remove_listeners
+
+_MISSING = object()
+
+
+def _table_names(models: Iterable[Any]) -> Set[str]:
+    """
+    Args:
+        models  => models, tables or ORM instances
+    Returns:
+        Names of the tables of models.
+    Preconditions:
+        N/A
+    """
+    tables = set()
+    for model in models:
+        if isinstance(model, Table):
+            tables.add(model.name)
+        else:
+            tables.update(table.name for table in inspect(model).mapper.tables)
+    return tables
+
+
+class LRUCache:
+    """Thread-safe, size-bounded least-recently-used cache with optional
+    time-to-live (TTL) eviction and hit/miss statistics."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.__entries = OrderedDict()
+        self.__lock = RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self) -> int:
+        """Getter for maxsize."""
+        return self.__maxsize
+
+    @maxsize.setter
+    def maxsize(self, value: int) -> None:
+        """Setter for maxsize."""
+        self.__maxsize = value
+
+    @property
+    def ttl(self) -> Optional[float]:
+        """Getter for ttl."""
+        return self.__ttl
+
+    @ttl.setter
+    def ttl(self, value: Optional[float]) -> None:
+        """Setter for ttl."""
+        self.__ttl = value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Args:
+            key     => key to look up
+            default => value to return if key is not cached (or has expired)
+        Returns:
+            Cached value for key, or default.  Records a hit or miss.
+        Preconditions:
+            N/A
+        """
+        with self.__lock:
+            entry = self.__entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires = entry
+                if expires is None or expires > monotonic():
+                    self.__entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.__entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Args:
+            key     => key to cache value under
+            value   => value to cache
+        Procedure:
+            Cache value under key, evicting the least recently used
+            entry if the cache is full.
+        Preconditions:
+            N/A
+        """
+        expires = monotonic() + self.ttl if self.ttl is not None else None
+        with self.__lock:
+            self.__entries[key] = (value, expires)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Args:
+            key     => key to remove
+            default => value to return if key is not cached
+        Returns:
+            Value removed from the cache for key, or default.
+        Preconditions:
+            N/A
+        """
+        with self.__lock:
+            entry = self.__entries.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self) -> None:
+        """Remove all entries from the cache (statistics are kept)."""
+        with self.__lock:
+            self.__entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter for str values.  Membership tests never give
+    false negatives, and give false positives at (approximately) the configured
+    error rate once capacity values have been added."""
+
+    def __init__(self, capacity: int = 1000000, error_rate: float = 0.001) -> None:
+        self.__size = max(8, int(ceil(-capacity * log(error_rate) / (log(2)**2))))
+        self.__hashes = max(1, int(round(self.__size / capacity * log(2))))
+        self.__bits = bytearray((self.__size + 7) // 8)
+        self.__lock = RLock()
+
+    def __indexes(self, value: str) -> Tuple[int, ...]:
+        """
+        Args:
+            value   => value to compute bit indexes of
+        Returns:
+            Bit indexes of value, using double hashing over a single digest.
+        Preconditions:
+            N/A
+        """
+        digest = blake2b(value.encode('utf8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return tuple((first + i * second) % self.__size for i in range(self.__hashes))
+
+    def add(self, value: str) -> None:
+        """
+        Args:
+            value   => value to add
+        Procedure:
+            Add value to the filter.
+        Preconditions:
+            N/A
+        """
+        with self.__lock:
+            for index in self.__indexes(value):
+                self.__bits[index >> 3] |= 1 << (index & 7)
+
+    def clear(self) -> None:
+        """Remove all values from the filter."""
+        with self.__lock:
+            self.__bits = bytearray(len(self.__bits))
+
+    def __contains__(self, value: str) -> bool:
+        bits = self.__bits
+        return all(
+            bits[index >> 3] & (1 << (index & 7)) for index in self.__indexes(value)
+        )
+
+
+class QueryCache:
+    """Cache of query results keyed by model and (normalized) field filters,
+    with LRU and TTL eviction (see: LRUCache).  Each table has a generation
+    number that is part of the key of every entry for a model mapped to that
+    table, so invalidating a table is O(1): stale entries become unreachable
+    and are evicted as the cache fills.  Once attached to a sessionmaker, the
+    tables written by each of its sessions are invalidated when the session's
+    transaction ends."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None) -> None:
+        self.__results = LRUCache(maxsize, ttl)
+        self.__generations = dict()
+        self.__lock = RLock()
+        self.__listeners = list()   # type: List[Tuple[Any, str, Callable[..., None]]]
+        self.invalidations = 0
+
+    @property
+    def hits(self) -> int:
+        """Number of lookups answered from the cache."""
+        return self.__results.hits
+
+    @property
+    def misses(self) -> int:
+        """Number of lookups not answered from the cache."""
+        return self.__results.misses
+
+    def __key(
+        self,
+        model: Any,
+        filters: Dict[str, Any],
+        scope: Hashable = None
+    ) -> Optional[Hashable]:
+        """
+        Args:
+            model   => model of table queried
+            filters => field filters applied to query
+            scope   => additional key distinguishing results for the same model and
+                       filters (i.e. whether they were read from the primary)
+        Returns:
+            Cache key for model, filters and scope, or None if filters contain
+            unhashable values (and thus cannot be cached).
+        Preconditions:
+            model is a mapped class
+        """
+        tables = tuple(table.name for table in inspect(model).tables)
+        key = (
+            model,
+            scope,
+            tuple(self.__generations.get(table, 0) for table in tables),
+            tuple(sorted(filters.items()))
+        )
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, model: Any, filters: Dict[str, Any], scope: Hashable = None) -> Any:
+        """
+        Args:
+            model   => model of table queried
+            filters => field filters applied to query
+            scope   => additional key of result (see: QueryCache.__key)
+        Returns:
+            Cached result for model, filters and scope, or None.
+        Preconditions:
+            model is a mapped class
+        """
+        key = self.__key(model, filters, scope)
+        return self.__results.get(key) if key is not None else None
+
+    def put(
+        self,
+        model: Any,
+        filters: Dict[str, Any],
+        result: Any,
+        scope: Hashable = None
+    ) -> None:
+        """
+        Args:
+            model   => model of table queried
+            filters => field filters applied to query
+            result  => result to cache
+            scope   => additional key of result (see: QueryCache.__key)
+        Procedure:
+            Cache result for model, filters and scope (if filters are hashable).
+        Preconditions:
+            model is a mapped class
+        """
+        key = self.__key(model, filters, scope)
+        if key is not None:
+            self.__results.put(key, result)
+
+    def get_or_load(
+        self,
+        model: Any,
+        filters: Dict[str, Any],
+        load: Callable[[], Any],
+        scope: Hashable = None
+    ) -> Any:
+        """
+        Args:
+            model   => model of table queried
+            filters => field filters applied to query
+            load    => function returning the result if it is not cached
+            scope   => additional key of result (see: QueryCache.__key)
+        Returns:
+            Cached result for model, filters and scope, or the result of load,
+            which is cached under the key looked up (so that a result loaded while
+            its tables are invalidated is cached under the old generation, and
+            never served afterwards).
+        Preconditions:
+            model is a mapped class
+        """
+        key = self.__key(model, filters, scope)
+        if key is None:
+            return load()
+        result = self.__results.get(key, _MISSING)
+        if result is _MISSING:
+            result = load()
+            self.__results.put(key, result)
+        return result
+
+    def invalidate(self, tables: Iterable[str]) -> None:
+        """
+        Args:
+            tables  => names of tables to invalidate cached results of
+        Procedure:
+            Invalidate all cached results for models mapped to any of tables.
+        Preconditions:
+            N/A
+        """
+        with self.__lock:
+            for table in tables:
+                self.__generations[table] = self.__generations.get(table, 0) + 1
+                self.invalidations += 1
+
+    def invalidate_on_commit(self, session: Session, tables: Iterable[str]) -> None:
+        """
+        Args:
+            session => session writing to tables
+            tables  => names of tables to invalidate cached results of
+        Procedure:
+            Invalidate all cached results for models mapped to any of tables once
+            the transaction of session commits (or rolls back), so that results
+            read before the transaction ends are not cached as current.
+        Preconditions:
+            self is attached to the sessionmaker of session (see: attach)
+        """
+        session.info.setdefault('invalidated_tables', set()).update(tables)
+
+    def attach(self, session_factory: Any) -> 'QueryCache':
+        """
+        Args:
+            session_factory => sessionmaker to invalidate cached results on writes of
+        Procedure:
+            Install session listeners on session_factory that record the tables
+            written by each flush, and invalidate them (along with those passed to
+            invalidate_on_commit) once the session's transaction ends.
+        Preconditions:
+            N/A
+        """
+        if event.contains(session_factory, 'after_flush', self.__flushed):
+            return self
+        for identifier, listener in (
+            ('after_flush', self.__flushed),
+            ('after_commit', self.__committed),
+            ('after_rollback', self.__rolled_back)
+        ):
+            event.listen(session_factory, identifier, listener)
+            self.__listeners.append((session_factory, identifier, listener))
+        return self
+
+    def detach(self) -> 'QueryCache':
+        """
+        Args:
+            N/A
+        Procedure:
+            Remove all session listeners installed by attach.
+        Preconditions:
+            N/A
+        """
+        remove_listeners(self.__listeners)
+        return self
+
+    def __flushed(self, session: Session, _flush_context: Any) -> None:
+        self.invalidate_on_commit(
+            session,
+            _table_names(chain(session.new, session.dirty, session.deleted))
+        )
+
+    def __committed(self, session: Session) -> None:
+        tables = session.info.pop('invalidated_tables', None)
+        if tables:
+            self.invalidate(tables)
+
+    def __rolled_back(self, session: Session) -> None:
+        tables = session.info.get('invalidated_tables')
+        if tables:
+            self.invalidate(tables)
+
+    def clear(self) -> None:
+        """Remove all cached results (statistics are kept)."""
+        self.__results.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Args:
+            N/A
+        Returns:
+            Dict of cache statistics: hits, misses, hit_rate, size, maxsize, ttl
+            and invalidations.
+        Preconditions:
+            N/A
+        """
+        lookups = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / lookups if lookups else 0.0,
+            size=len(self.__results),
+            maxsize=self.__results.maxsize,
+            ttl=self.__results.ttl,
+            invalidations=self.invalidations
+        )
+
+
+class QueryCacheMixin:
+    """Mixin for DBManager caching the results of fetch (see: QueryCache)."""
+
+    @property
+    def query_cache(self) -> Optional[QueryCache]:
+        """Getter for query_cache."""
+        return self.__query_cache
+
+    @query_cache.setter
+    def query_cache(self, value: Optional[QueryCache]) -> None:
+        """Setter for query_cache."""
+        self.__query_cache = value
+
+    def enable_query_cache(self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None
+    ) -> 'DBManager':
+        """
+        Args:
+            maxsize => maximum number of cached results
+            ttl     => number of seconds after which cached results expire
+                       (if None, results only expire through invalidation)
+        Procedure:
+            Enable caching of DBManager.fetch results, keyed by model and
+            field filters.  Cached results for a table are invalidated once the
+            transaction of a session created by this manager that wrote to it
+            (through the ORM, add_many or upsert) ends, and after load and
+            purge_ledger.  If the manager has not been initialized yet, the
+            cache is attached to its sessions once it is.
+            NOTE:
+                Only writes made through this manager invalidate the cache.
+        Preconditions:
+            N/A
+        """
+        self.disable_query_cache()
+        self.query_cache = QueryCache(maxsize, ttl)
+        if self.session_factory is not None:
+            self.query_cache.attach(unscoped_sessionmaker(self.session_factory))
+        return self
+
+    def disable_query_cache(self) -> 'DBManager':
+        """
+        Args:
+            N/A
+        Procedure:
+            Disable (and discard) the query result cache.
+        Preconditions:
+            N/A
+        """
+        if self.query_cache is not None:
+            self.query_cache.detach()
+            self.query_cache = None
+        return self
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """
+        Args:
+            N/A
+        Returns:
+            Query result cache statistics (see: QueryCache.stats), or None if
+            the cache is not enabled.
+        Preconditions:
+            N/A
+        """
+        if self.query_cache is None:
+            return None
+        return self.query_cache.stats()
+
+    def invalidate(self, *models: Any) -> 'DBManager':
+        """
+        Args:
+            models  => models, tables or ORM instances to invalidate cached
+                       results of
+        Procedure:
+            Invalidate cached query results for the tables of models.
+        Preconditions:
+            N/A
+        """
+        if self.query_cache is not None:
+            self.query_cache.invalidate(_table_names(models))
+        return self
+
+    def invalidate_on_commit(self,
+        session: Union[Session, scoped_session],
+        *models: Any
+    ) -> 'DBManager':
+        """
+        Args:
+            session => session writing to the tables of models
+            models  => models, tables or ORM instances to invalidate cached
+                       results of
+        Procedure:
+            Invalidate cached query results for the tables of models once the
+            transaction of session commits (or rolls back), so that results read
+            before the transaction ends are not cached as current.
+        Preconditions:
+            session was created by this manager (see: DBManager.create_session)
+        """
+        if self.query_cache is not None:
+            self.query_cache.invalidate_on_commit(session, _table_names(models))
+        return self
+
+    def fetch(self,
+        model: Any,
+        session: Optional[Union[Session, scoped_session]] = None,
+        primary: bool = False,
+        **kwargs: Any
+    ) -> List[Any]:
+        """
+        Args:
+            model   => model of table to query
+            session => session to query with
+            primary => whether to read from the primary database (for
+                       read-your-writes) rather than a read replica
+            kwargs  => fields to filter on
+        Returns:
+            List of instances of model with field filters from kwargs applied
+            (see: DBManager.lookup), served from the query result cache if enabled.
+            NOTE:
+                The cache holds read-only snapshots of the column values of each
+                result (see: records.record_class), never instances owned by a
+                session.  If the cache is enabled, results (whether or not they
+                were cached) are therefore detached instances rebuilt from
+                snapshots, which must be merged into a session (Session.merge)
+                to be modified.  Otherwise, results belong to session.
+        Preconditions:
+            N/A
+        """
+        if session is None:
+            session = self.session if primary else self.create_read_session()
+        if self.query_cache is None:
+            return self.lookup(model, session=session, **kwargs).all()
+        fields = record_fields(model)
+        make = record_class(model)._make
+        snapshots = self.query_cache.get_or_load(
+            model,
+            kwargs,
+            lambda: tuple(
+                make(getattr(record, field) for field in fields) \
+                for record in self.lookup(model, session=session, **kwargs)
+            ),
+            'primary' if primary else 'replica'
+        )
+        result = list()
+        for snapshot in snapshots:
+            record = model(**snapshot._asdict())
+            make_transient_to_detached(record)
+            result.append(record)
+        return result
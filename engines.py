@@ -0,0 +1,298 @@
+## -*- coding: UTF8 -*-
+## engines.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Optional, Any, Dict, Tuple, NamedTuple
+import os
+from threading import RLock
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import create_engine as sqlalchemy_create_engine, exc, event
+from sqlalchemy.engine import Engine
+
+
+SQLITE_PROFILES = dict(
+    bulk_ingest=(
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'OFF'),
+        ('cache_size', -262144),
+        ('temp_store', 'MEMORY'),
+        ('mmap_size', 268435456)
+    ),
+    safe=(
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'FULL'),
+        ('cache_size', -2000),
+        ('temp_store', 'DEFAULT'),
+        ('mmap_size', 0)
+    )
+)
+
+_ENGINE_PROFILES = WeakKeyDictionary()
+
+
+class EngineConfig(NamedTuple):
+    """Engine and connection pool configuration of a DBManager.
+    Args:
+        engine_options      => keyword arguments to sqlalchemy.create_engine, used to
+                               configure the connection pool (i.e. poolclass, pool_size,
+                               max_overflow, pool_pre_ping, pool_recycle, pool_timeout),
+                               or None for the defaults
+        shared_engine       => whether to use the process-wide shared engine for the
+                               connection string and engine_options (see: EngineRegistry)
+        profile             => SQLite performance profile to apply to connections
+                               (i.e. 'bulk_ingest' or 'safe', see: SQLITE_PROFILES)
+        replicas            => connection strings of read replicas of the database
+        replica_strategy    => strategy used to balance reads across replicas
+                               (see: routing.ReplicaRouter)
+    """
+    engine_options: Optional[Dict[str, Any]] = None
+    shared_engine: bool = False
+    profile: Optional[str] = None
+    replicas: Tuple[str, ...] = ()
+    replica_strategy: str = 'round_robin'
+
+
+def apply_sqlite_profile(dbapi_connection: Any, profile: str) -> None:
+    """
+    Args:
+        dbapi_connection    => SQLite DBAPI connection to configure
+        profile             => name of profile in SQLITE_PROFILES to apply
+    Procedure:
+        Execute the PRAGMA statements of profile on dbapi_connection.
+    Preconditions:
+        profile is a key in SQLITE_PROFILES
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, value in SQLITE_PROFILES[profile]:
+            cursor.execute('PRAGMA %s = %s'%(pragma, value))
+    finally:
+        cursor.close()
+
+def set_sqlite_profile(engine: Engine, profile: Optional[str]) -> None:
+    """
+    Args:
+        engine  => engine to set performance profile of
+        profile => name of profile in SQLITE_PROFILES to apply, or None to stop
+                   applying profiles to new connections
+    Procedure:
+        Apply profile to every connection of engine's pool.  New connections
+        are configured when they are opened, and pooled connections configured
+        with a different profile are reconfigured the next time they are checked
+        out.  Has no effect on non-SQLite engines.
+        NOTE:
+            Engines are shared by DBManager instances using the engine registry
+            (see: EngineRegistry), so the most recently set profile wins.
+    Preconditions:
+        profile is None or a key in SQLITE_PROFILES
+    """
+    if profile is not None and profile not in SQLITE_PROFILES:
+        raise ValueError('Unknown SQLite profile %s (expected one of %s)'%(
+            profile,
+            ', '.join(SQLITE_PROFILES)
+        ))
+    if engine.dialect.name != 'sqlite':
+        return
+    if engine not in _ENGINE_PROFILES:
+        @event.listens_for(engine, 'connect')
+        def connect(dbapi_connection: Any, connection_record: Any) -> None: #pylint: disable=W0612
+            current_profile = _ENGINE_PROFILES.get(engine)
+            if current_profile is not None:
+                apply_sqlite_profile(dbapi_connection, current_profile)
+            connection_record.info['sqlite_profile'] = current_profile
+
+        @event.listens_for(engine, 'checkout')
+        def checkout( #pylint: disable=W0612
+            dbapi_connection: Any,
+            connection_record: Any,
+            _connection_proxy: Any
+        ) -> None:
+            current_profile = _ENGINE_PROFILES.get(engine)
+            if connection_record.info.get('sqlite_profile') != current_profile:
+                if current_profile is not None:
+                    apply_sqlite_profile(dbapi_connection, current_profile)
+                connection_record.info['sqlite_profile'] = current_profile
+    _ENGINE_PROFILES[engine] = profile
+
+def get_sqlite_profile(engine: Engine) -> Optional[str]:
+    """
+    Args:
+        engine  => engine to get performance profile of
+    Returns:
+        Name of the profile currently applied to engine, if any.
+    Preconditions:
+        N/A
+    """
+    return _ENGINE_PROFILES.get(engine)
+
+def _add_fork_guard(engine: Engine) -> None:
+    """
+    Args:
+        engine  => engine to guard
+    Procedure:
+        Tag each pooled DBAPI connection with the pid of the process that
+        opened it, and invalidate any connection checked out in a different
+        process (i.e. a connection inherited through fork()) so that the
+        pool opens a new one instead of sharing a socket with the parent.
+        NOTE:
+            Implementation taken from:
+            https://docs.sqlalchemy.org/en/13/core/pooling.html#using-connection-pools-with-multiprocessing
+    Preconditions:
+        N/A
+    """
+    @event.listens_for(engine, 'connect')
+    def connect(_dbapi_connection: Any, connection_record: Any) -> None: #pylint: disable=W0612
+        connection_record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, 'checkout')
+    def checkout( #pylint: disable=W0612
+        _dbapi_connection: Any,
+        connection_record: Any,
+        connection_proxy: Any
+    ) -> None:
+        pid = os.getpid()
+        if connection_record.info.get('pid', pid) != pid:
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError(
+                'Connection record belongs to pid %s, attempting to check out in pid %s'%(
+                    connection_record.info['pid'],
+                    pid
+                )
+            )
+
+
+class EngineRegistry:
+    """Process-wide registry of SQLAlchemy Engines keyed by connection
+    string and engine (pool) options, allowing multiple DBManager instances
+    connected to the same database to share a single connection pool.
+    Registered engines are never shared across processes: the registry is
+    cleared in child processes after fork(), and each engine invalidates
+    pooled connections inherited from a parent process.
+    """
+
+    def __init__(self) -> None:
+        self.__engines = dict()
+        self.__lock = RLock()
+        self.__pid = os.getpid()
+
+    @staticmethod
+    def __key(conn_string: str, engine_options: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        Args:
+            conn_string     => database connection string
+            engine_options  => keyword arguments to sqlalchemy.create_engine
+        Returns:
+            Hashable registry key for conn_string and engine_options.
+        Preconditions:
+            N/A
+        """
+        return (conn_string, repr(sorted(engine_options.items())))
+
+    def __check_pid(self) -> None:
+        """
+        Args:
+            N/A
+        Procedure:
+            Forget all registered engines if the current process is not the
+            process that registered them (i.e. after fork()).  Engines are
+            dropped rather than disposed so that connections owned by the parent
+            process are not closed from the child.
+        Preconditions:
+            N/A
+        """
+        pid = os.getpid()
+        if pid != self.__pid:
+            self.__engines = dict()
+            self.__lock = RLock()
+            self.__pid = pid
+
+    def get(self, conn_string: str, **engine_options: Any) -> Engine:
+        """
+        Args:
+            conn_string     => database connection string
+            engine_options  => keyword arguments to sqlalchemy.create_engine
+                               (i.e. poolclass, pool_size, max_overflow,
+                               pool_pre_ping, pool_recycle, pool_timeout)
+        Returns:
+            Engine registered for conn_string and engine_options in this process,
+            creating and registering a new one if none exists.
+        Preconditions:
+            N/A
+        """
+        self.__check_pid()
+        key = self.__key(conn_string, engine_options)
+        with self.__lock:
+            engine = self.__engines.get(key)
+            if engine is None:
+                engine = sqlalchemy_create_engine(conn_string, **engine_options)
+                _add_fork_guard(engine)
+                self.__engines[key] = engine
+            return engine
+
+    def dispose(self,
+        conn_string: Optional[str] = None,
+        **engine_options: Any
+    ) -> None:
+        """
+        Args:
+            conn_string     => database connection string of engine to dispose
+            engine_options  => engine options of engine to dispose
+        Procedure:
+            Dispose of and unregister the engine registered for conn_string and
+            engine_options, or all registered engines if conn_string is None.
+        Preconditions:
+            N/A
+        """
+        self.__check_pid()
+        with self.__lock:
+            if conn_string is None:
+                engines = list(self.__engines.values())
+                self.__engines.clear()
+            else:
+                engine = self.__engines.pop(self.__key(conn_string, engine_options), None)
+                engines = [engine] if engine is not None else list()
+        for engine in engines:
+            engine.dispose()
+
+    def reset(self) -> None:
+        """
+        Args:
+            N/A
+        Procedure:
+            Forget all registered engines without disposing of them.  Registered
+            to run in child processes after fork().
+        Preconditions:
+            N/A
+        """
+        self.__engines = dict()
+        self.__lock = RLock()
+        self.__pid = os.getpid()
+
+    def __len__(self) -> int:
+        return len(self.__engines)
+
+
+ENGINE_REGISTRY = EngineRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=ENGINE_REGISTRY.reset)
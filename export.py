@@ -0,0 +1,254 @@
+## -*- coding: UTF8 -*-
+## export.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Optional, Any, Iterator, List, Sequence, Tuple, Union, TextIO
+import csv
+from contextlib import nullcontext
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine, Connection
+from sqlalchemy.schema import Table
+from sqlalchemy.sql.expression import Selectable, select
+from sqlalchemy.types import TypeEngine, Integer, Float, Numeric, Boolean, DateTime, \
+    Date, LargeBinary
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None  #pylint: disable=C0103
+
+_ARROW_TYPES = (
+    (Boolean, 'bool_'),
+    (Integer, 'int64'),
+    (Numeric, 'float64'),
+    (Date, 'date32'),
+    (LargeBinary, 'binary')
+)
+
+def _require_pyarrow() -> None:
+    """
+    Args:
+        N/A
+    Procedure:
+        Raise an ImportError if the optional pyarrow dependency is not installed.
+    Preconditions:
+        N/A
+    """
+    if pyarrow is None:
+        raise ImportError(
+            'Arrow and Parquet export require pyarrow (pip install pyarrow)'
+        )
+
+def _selectable(source: Any, columns: Optional[Sequence[str]] = None) -> Selectable:
+    """
+    Args:
+        source  => model, table or selectable to export
+        columns => names of columns of source to project (if None, all columns)
+    Returns:
+        Select statement of columns of source.
+    Preconditions:
+        N/A
+    """
+    if not isinstance(source, Selectable):
+        source = inspect(source).local_table
+    if isinstance(source, Table) or columns is not None:
+        source = source.alias() if not isinstance(source, Table) else source
+        if columns is None:
+            return select(source.c)
+        return select([source.c[column] for column in columns])
+    return source
+
+def iter_chunks(
+    bind: Union[Engine, Connection],
+    source: Any,
+    chunk_size: int = 10000,
+    columns: Optional[Sequence[str]] = None
+) -> Iterator[Tuple[List[str], List[Tuple[Any, ...]]]]:
+    """
+    Args:
+        bind        => engine or connection to export with
+        source      => model, table or selectable to export
+        chunk_size  => maximum number of rows per chunk
+        columns     => names of columns of source to project (if None, all columns)
+    Returns:
+        Iterator of (column names, rows) pairs, where rows is a list of at most
+        chunk_size result tuples, read from a server-side cursor where the dialect
+        supports it so that memory use is bounded by chunk_size.
+    Preconditions:
+        chunk_size is greater than 0
+    """
+    connection = bind.connect() if isinstance(bind, Engine) else bind
+    try:
+        result = connection\
+            .execution_options(stream_results=True)\
+            .execute(_selectable(source, columns))
+        try:
+            keys = list(result.keys())
+            chunk = result.fetchmany(chunk_size)
+            while chunk:
+                yield keys, [tuple(row) for row in chunk]
+                chunk = result.fetchmany(chunk_size)
+        finally:
+            result.close()
+    finally:
+        if connection is not bind:
+            connection.close()
+
+def export_csv(
+    bind: Union[Engine, Connection],
+    source: Any,
+    destination: Union[str, TextIO],
+    chunk_size: int = 10000,
+    columns: Optional[Sequence[str]] = None,
+    header: bool = True
+) -> int:
+    """
+    Args:
+        bind        => engine or connection to export with
+        source      => model, table or selectable to export
+        destination => path of file or text file object to write CSV to
+        chunk_size  => maximum number of rows to hold in memory at a time
+        columns     => names of columns of source to project (if None, all columns)
+        header      => whether to write a header row of column names
+    Returns:
+        Number of rows exported.
+    Preconditions:
+        chunk_size is greater than 0
+    """
+    if isinstance(destination, str):
+        stream = open(destination, 'w', newline='')
+    else:
+        stream = nullcontext(destination)
+    with stream as output:
+        writer = csv.writer(output)
+        rows = 0
+        for keys, chunk in iter_chunks(bind, source, chunk_size, columns):
+            if header and rows == 0:
+                writer.writerow(keys)
+            writer.writerows(chunk)
+            rows += len(chunk)
+        if header and rows == 0:
+            writer.writerow(_selectable(source, columns).c.keys())
+        return rows
+
+def _arrow_type(sqltype: TypeEngine) -> Any:
+    """
+    Args:
+        sqltype => SQLAlchemy column type
+    Returns:
+        Arrow type of column values of sqltype.  Timezone-aware timestamps are
+        stored as UTC (the time zone of server-side created_at defaults).
+    Preconditions:
+        pyarrow is installed
+    """
+    if isinstance(sqltype, Numeric) and not isinstance(sqltype, Float) and \
+        sqltype.asdecimal:
+        return pyarrow.decimal128(sqltype.precision or 38, sqltype.scale or 0)
+    if isinstance(sqltype, DateTime):
+        return pyarrow.timestamp('us', tz='UTC' if sqltype.timezone else None)
+    for base, name in _ARROW_TYPES:
+        if isinstance(sqltype, base):
+            return getattr(pyarrow, name)()
+    return pyarrow.string()
+
+def arrow_schema(source: Any, columns: Optional[Sequence[str]] = None) -> Any:
+    """
+    Args:
+        source  => model, table or selectable to export
+        columns => names of columns of source to project (if None, all columns)
+    Returns:
+        Arrow schema of exported rows of source, derived from its column types
+        (so that every record batch has the same schema).
+    Preconditions:
+        pyarrow is installed
+    """
+    _require_pyarrow()
+    return pyarrow.schema([
+        pyarrow.field(column.key, _arrow_type(column.type)) \
+        for column in _selectable(source, columns).c
+    ])
+
+def export_arrow(
+    bind: Union[Engine, Connection],
+    source: Any,
+    chunk_size: int = 10000,
+    columns: Optional[Sequence[str]] = None
+) -> Iterator[Any]:
+    """
+    Args:
+        bind        => engine or connection to export with
+        source      => model, table or selectable to export
+        chunk_size  => maximum number of rows per record batch
+        columns     => names of columns of source to project (if None, all columns)
+    Returns:
+        Iterator of Arrow record batches of at most chunk_size rows, built
+        directly from result rows (see: arrow_schema).
+    Preconditions:
+        pyarrow is installed
+        chunk_size is greater than 0
+    """
+    schema = arrow_schema(source, columns)
+    for _, chunk in iter_chunks(bind, source, chunk_size, columns):
+        yield pyarrow.RecordBatch.from_arrays(
+            [
+                pyarrow.array(values, type=field.type) \
+                for field, values in zip(schema, zip(*chunk))
+            ],
+            schema=schema
+        )
+
+def export_parquet(
+    bind: Union[Engine, Connection],
+    source: Any,
+    destination: Union[str, Any],
+    chunk_size: int = 100000,
+    columns: Optional[Sequence[str]] = None,
+    compression: str = 'snappy'
+) -> int:
+    """
+    Args:
+        bind        => engine or connection to export with
+        source      => model, table or selectable to export
+        destination => path of file or binary file object to write Parquet to
+        chunk_size  => maximum number of rows per row group
+        columns     => names of columns of source to project (if None, all columns)
+        compression => Parquet compression codec
+    Returns:
+        Number of rows exported, written as one row group per chunk.
+    Preconditions:
+        pyarrow is installed
+        chunk_size is greater than 0
+    """
+    _require_pyarrow()
+    schema = arrow_schema(source, columns)
+    rows = 0
+    with pyarrow.parquet.ParquetWriter(
+        destination,
+        schema,
+        compression=compression
+    ) as writer:
+        for batch in export_arrow(bind, source, chunk_size, columns):
+            writer.write_table(pyarrow.Table.from_batches([batch], schema=schema))
+            rows += batch.num_rows
+    return rows
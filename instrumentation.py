@@ -0,0 +1,385 @@
+## -*- coding: UTF8 -*-
+## instrumentation.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Optional, Any, Callable, Dict, List, Tuple
+import logging
+from bisect import bisect_left
+from threading import RLock
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .utils import unscoped_sessionmaker, remove_listeners
+
+LOGGER = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+MetricsCallback = Callable[[str, Optional[str], float, Optional[int]], None]
+
+
+class LatencyStats:
+    """Latency histogram and row counts for a single kind of operation
+    (i.e. one SQL statement, flushes or commits).  Bucket i counts
+    operations that took at most LATENCY_BUCKETS[i] seconds, and the final
+    bucket counts operations slower than the largest bound."""
+
+    __slots__ = ('count', 'total', 'minimum', 'maximum', 'rows', 'buckets')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.rows = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, duration: float, rows: Optional[int] = None) -> None:
+        """
+        Args:
+            duration    => duration of operation in seconds
+            rows        => number of rows affected by operation, if known
+        Procedure:
+            Record an operation of duration in the histogram.
+        Preconditions:
+            N/A
+        """
+        self.count += 1
+        self.total += duration
+        if self.minimum is None or duration < self.minimum:
+            self.minimum = duration
+        if self.maximum is None or duration > self.maximum:
+            self.maximum = duration
+        if rows is not None and rows > 0:
+            self.rows += rows
+        self.buckets[bisect_left(LATENCY_BUCKETS, duration)] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Args:
+            N/A
+        Returns:
+            Dict of count, total, mean, min and max duration (in seconds),
+            rows and histogram buckets (as (upper bound, count) pairs, where
+            the final upper bound is None).
+        Preconditions:
+            N/A
+        """
+        return dict(
+            count=self.count,
+            total=self.total,
+            mean=self.total / self.count if self.count else 0.0,
+            min=self.minimum,
+            max=self.maximum,
+            rows=self.rows,
+            buckets=list(zip(LATENCY_BUCKETS + (None,), self.buckets))
+        )
+
+
+class Instrumentation:
+    """Collects per-statement latency histograms and row counts using engine
+    cursor execution events, and flush and commit durations using session
+    events.  Statements slower than slow_query_threshold seconds are logged
+    (with their parameters) to logger, and every operation is reported to
+    callback if provided.  No listeners are installed until attach is called,
+    and detach removes them, so disabled instrumentation costs nothing.
+    """
+
+    def __init__(self,
+        slow_query_threshold: Optional[float] = None,
+        callback: Optional[MetricsCallback] = None,
+        logger: Optional[logging.Logger] = None,
+        max_statements: int = 1000
+    ) -> None:
+        self.slow_query_threshold = slow_query_threshold
+        self.callback = callback
+        self.logger = logger if logger is not None else LOGGER
+        self.max_statements = max_statements
+        self.__statements = dict()
+        self.__flushes = LatencyStats()
+        self.__commits = LatencyStats()
+        self.__slow_queries = 0
+        self.__lock = RLock()
+        self.__listeners = list()   # type: List[Tuple[Any, str, Callable[..., None]]]
+
+    def __listen(self,
+        target: Any,
+        identifier: str,
+        listener: Callable[..., None]
+    ) -> None:
+        """
+        Args:
+            target      => engine or session factory to listen for events on
+            identifier  => name of event to listen for
+            listener    => listener function
+        Procedure:
+            Install listener, remembering it so that it can be removed by detach.
+        Preconditions:
+            N/A
+        """
+        event.listen(target, identifier, listener)
+        self.__listeners.append((target, identifier, listener))
+
+    def attach(self,
+        engine: Optional[Engine] = None,
+        session_factory: Any = None
+    ) -> 'Instrumentation':
+        """
+        Args:
+            engine          => engine to instrument statement execution of
+            session_factory => sessionmaker to instrument flushes and commits of
+        Procedure:
+            Install event listeners on engine and/or session_factory.
+        Preconditions:
+            N/A
+        """
+        if engine is not None:
+            self.__listen(engine, 'before_cursor_execute', self.__before_cursor_execute)
+            self.__listen(engine, 'after_cursor_execute', self.__after_cursor_execute)
+            self.__listen(engine, 'handle_error', self.__handle_error)
+        if session_factory is not None:
+            self.__listen(session_factory, 'before_flush', self.__before_flush)
+            self.__listen(session_factory, 'after_flush_postexec', self.__after_flush)
+            self.__listen(session_factory, 'before_commit', self.__before_commit)
+            self.__listen(session_factory, 'after_commit', self.__after_commit)
+        return self
+
+    def detach(self) -> 'Instrumentation':
+        """
+        Args:
+            N/A
+        Procedure:
+            Remove all event listeners installed by attach.
+        Preconditions:
+            N/A
+        """
+        remove_listeners(self.__listeners)
+        return self
+
+    def __before_cursor_execute(self,
+        conn: Any,
+        _cursor: Any,
+        _statement: str,
+        _parameters: Any,
+        context: Any,
+        _executemany: bool
+    ) -> None:
+        starts = conn.info.setdefault('instrumentation_start', list())
+        starts.append((context, perf_counter()))
+
+    def __after_cursor_execute(self,
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        _context: Any,
+        _executemany: bool
+    ) -> None:
+        duration = perf_counter() - conn.info['instrumentation_start'].pop()[1]
+        rows = cursor.rowcount if cursor is not None and cursor.rowcount >= 0 else None
+        with self.__lock:
+            stats = self.__statements.get(statement)
+            if stats is None and len(self.__statements) < self.max_statements:
+                stats = self.__statements[statement] = LatencyStats()
+            if stats is not None:
+                stats.record(duration, rows)
+            slow = self.slow_query_threshold is not None and \
+                duration >= self.slow_query_threshold
+            if slow:
+                self.__slow_queries += 1
+        if slow:
+            self.logger.warning(
+                'Slow query (%.6fs, %s rows): %s; parameters: %r',
+                duration,
+                rows,
+                statement,
+                parameters
+            )
+        if self.callback is not None:
+            self.callback('execute', statement, duration, rows)
+
+    def __handle_error(self, exception_context: Any) -> None:
+        """
+        Args:
+            exception_context   => context of the failed statement execution
+        Procedure:
+            Discard the start time of the failed statement (pushed by
+            before_cursor_execute), as after_cursor_execute is never called
+            for it.
+        Preconditions:
+            N/A
+        """
+        if exception_context.connection is None:
+            return
+        starts = exception_context.connection.info.get('instrumentation_start')
+        if starts and starts[-1][0] is exception_context.execution_context:
+            starts.pop()
+
+    def __before_flush(self, session: Any, *_args: Any) -> None:
+        session.info['instrumentation_flush_start'] = perf_counter()
+
+    def __after_flush(self, session: Any, *_args: Any) -> None:
+        start = session.info.pop('instrumentation_flush_start', None)
+        if start is not None:
+            self.__record('flush', self.__flushes, perf_counter() - start)
+
+    def __before_commit(self, session: Any) -> None:
+        session.info['instrumentation_commit_start'] = perf_counter()
+
+    def __after_commit(self, session: Any) -> None:
+        start = session.info.pop('instrumentation_commit_start', None)
+        if start is not None:
+            self.__record('commit', self.__commits, perf_counter() - start)
+
+    def __record(self, name: str, stats: LatencyStats, duration: float) -> None:
+        """
+        Args:
+            name        => name of operation (flush or commit)
+            stats       => stats to record operation in
+            duration    => duration of operation in seconds
+        Procedure:
+            Record operation in stats and report it to self.callback.
+        Preconditions:
+            N/A
+        """
+        with self.__lock:
+            stats.record(duration)
+        if self.callback is not None:
+            self.callback(name, None, duration, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Args:
+            N/A
+        Returns:
+            Snapshot of collected statistics: per-statement latency histograms and
+            row counts (see: LatencyStats.snapshot), flush and commit latency
+            histograms, and number of slow queries logged.
+        Preconditions:
+            N/A
+        """
+        with self.__lock:
+            return dict(
+                statements={
+                    statement: stats.snapshot() \
+                    for statement, stats in self.__statements.items()
+                },
+                flushes=self.__flushes.snapshot(),
+                commits=self.__commits.snapshot(),
+                slow_queries=self.__slow_queries
+            )
+
+    def reset(self) -> 'Instrumentation':
+        """
+        Args:
+            N/A
+        Procedure:
+            Discard all collected statistics.
+        Preconditions:
+            N/A
+        """
+        with self.__lock:
+            self.__statements = dict()
+            self.__flushes = LatencyStats()
+            self.__commits = LatencyStats()
+            self.__slow_queries = 0
+        return self
+
+
+class InstrumentationMixin:
+    """Mixin for DBManager collecting statement, flush and commit metrics
+    (see: Instrumentation)."""
+
+    @property
+    def instrumentation(self) -> Optional[Instrumentation]:
+        """Getter for instrumentation."""
+        return self.__instrumentation
+
+    @instrumentation.setter
+    def instrumentation(self, value: Optional[Instrumentation]) -> None:
+        """Setter for instrumentation."""
+        self.__instrumentation = value
+
+    def enable_instrumentation(self,
+        slow_query_threshold: Optional[float] = None,
+        callback: Optional[MetricsCallback] = None,
+        logger: Optional[logging.Logger] = None
+    ) -> 'DBManager':
+        """
+        Args:
+            slow_query_threshold    => number of seconds after which statements
+                                       are logged as slow queries (if None, none are)
+            callback                => function called with (operation, statement,
+                                       duration, rows) for every statement execution,
+                                       flush and commit
+            logger                  => logger to log slow queries to (defaults to
+                                       this module's logger)
+        Procedure:
+            Start collecting per-statement latency histograms and row counts, and
+            flush and commit durations, for self.engine, the engines of any read
+            replicas and sessions created by self.session_factory (see:
+            Instrumentation).  If the manager has not been initialized yet,
+            instrumentation is attached once it is.
+        Preconditions:
+            N/A
+        """
+        self.disable_instrumentation()
+        self.instrumentation = Instrumentation(slow_query_threshold, callback, logger)
+        self.instrumentation.attach(
+            self.engine,
+            unscoped_sessionmaker(self.session_factory)
+        )
+        if self.replica_router is not None:
+            for engine in self.replica_router.engines:
+                self.instrumentation.attach(engine=engine)
+        return self
+
+    def disable_instrumentation(self) -> 'DBManager':
+        """
+        Args:
+            N/A
+        Procedure:
+            Remove all instrumentation event listeners and discard collected
+            statistics.
+        Preconditions:
+            N/A
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.detach()
+            self.instrumentation = None
+        return self
+
+    def stats(self) -> Optional[Dict[str, Any]]:
+        """
+        Args:
+            N/A
+        Returns:
+            Snapshot of instrumentation statistics (see: Instrumentation.stats),
+            or None if instrumentation is not enabled.
+        Preconditions:
+            N/A
+        """
+        if self.instrumentation is None:
+            return None
+        return self.instrumentation.stats()
@@ -0,0 +1,261 @@
+## -*- coding: UTF8 -*-
+## ledger.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Optional, Any, Iterable, Set, Union
+
+from sqlalchemy.orm import Session, scoped_session
+
+from .cache import LRUCache, BloomFilter
+from .utils import chunked
+
+
+class LedgerDeduplicator: #pylint: disable=R0902
+    """Batched lookup of whether files have already been ingested, i.e. have
+    a completed row in a file ledger table (see: models.FileLedgerMixin),
+    by hash or path.  Lookups are resolved with chunked IN queries against
+    the (field, completed) indexes of the ledger table, and results are kept
+    in an optional LRU cache.  Once warmed (see: LedgerDeduplicator.warm),
+    a Bloom filter of completed values lets lookups for files that have not
+    been ingested skip the database entirely.
+    NOTE:
+        Cached results only reflect rows completed by other processes as of
+        the time they were looked up; use clear to discard them.
+    """
+
+    FIELDS = ('md5hash', 'sha1hash', 'sha2hash', 'file_path')
+
+    def __init__(self,
+        manager: 'DBManager',
+        model: Any,
+        field: str = 'sha2hash',
+        chunk_size: int = 500,
+        cache_size: Optional[int] = 100000,
+        bloom_capacity: Optional[int] = None,
+        bloom_error_rate: float = 0.001
+    ) -> None:
+        if field not in self.FIELDS:
+            raise ValueError('Unsupported ledger field %s (expected one of %s)'%(
+                field,
+                ', '.join(self.FIELDS)
+            ))
+        self.manager = manager
+        self.model = model
+        self.field = field
+        self.chunk_size = chunk_size
+        self.cache = LRUCache(cache_size) if cache_size else None
+        self.bloom = BloomFilter(bloom_capacity, bloom_error_rate) \
+            if bloom_capacity else None
+        self.__warm = False
+
+    @property
+    def manager(self) -> 'DBManager':
+        """Getter for manager."""
+        return self.__manager
+
+    @manager.setter
+    def manager(self, value: 'DBManager') -> None:
+        """Setter for manager."""
+        self.__manager = value
+
+    @property
+    def model(self) -> Any:
+        """Getter for model."""
+        return self.__model
+
+    @model.setter
+    def model(self, value: Any) -> None:
+        """Setter for model."""
+        self.__model = value
+
+    @property
+    def field(self) -> str:
+        """Getter for field."""
+        return self.__field
+
+    @field.setter
+    def field(self, value: str) -> None:
+        """Setter for field."""
+        self.__field = value
+
+    @property
+    def chunk_size(self) -> int:
+        """Getter for chunk_size."""
+        return self.__chunk_size
+
+    @chunk_size.setter
+    def chunk_size(self, value: int) -> None:
+        """Setter for chunk_size."""
+        self.__chunk_size = value
+
+    def __completed(self,
+        values: Iterable[str],
+        session: Union[Session, scoped_session]
+    ) -> Set[str]:
+        """
+        Args:
+            values  => values of self.field to look up
+            session => session to query with
+        Returns:
+            Subset of values that have a completed ledger row, resolved
+            with one IN query per self.chunk_size values.
+        Preconditions:
+            N/A
+        """
+        column = getattr(self.model, self.field)
+        completed = set()
+        for chunk in chunked(values, self.chunk_size):
+            completed.update(
+                row[0] for row in session.query(column)
+                .filter(column.in_(chunk))
+                .filter(self.model.completed == True) #pylint: disable=C0121
+                .distinct()
+            )
+        return completed
+
+    def __session(self,
+        session: Optional[Union[Session, scoped_session]]
+    ) -> Union[Session, scoped_session]:
+        """
+        Args:
+            session => session to query with, or None
+        Returns:
+            session, or the session of self.manager (the session factory if the
+            manager uses scoped sessions) if session is None.
+        Preconditions:
+            self.manager has been initialized (see: DBManager.initialize)
+        """
+        if session is None:
+            return self.manager.create_session()
+        return session
+
+    def warm(self,
+        session: Optional[Union[Session, scoped_session]] = None
+    ) -> 'LedgerDeduplicator':
+        """
+        Args:
+            session => session to query with
+        Procedure:
+            Load the values of self.field of all completed ledger rows into the
+            Bloom filter, after which lookups of values not in the filter are
+            answered without querying the database.
+        Preconditions:
+            self.bloom is not None (bloom_capacity was provided)
+        """
+        session = self.__session(session)
+        column = getattr(self.model, self.field)
+        self.bloom.clear()
+        query = (
+            session.query(column)
+            .filter(self.model.completed == True) #pylint: disable=C0121
+            .filter(column.isnot(None))
+            .yield_per(self.chunk_size)
+        )
+        for row in query:
+            self.bloom.add(row[0])
+        self.__warm = True
+        return self
+
+    def ingested(self,
+        values: Iterable[str],
+        session: Optional[Union[Session, scoped_session]] = None
+    ) -> Set[str]:
+        """
+        Args:
+            values  => values of self.field (hashes or paths) to check
+            session => session to query with
+        Returns:
+            Subset of values that have already been ingested (have a completed
+            ledger row), consulting the cache and Bloom filter before querying
+            the database for the remaining values.
+        Preconditions:
+            N/A
+        """
+        session = self.__session(session)
+        ingested = set()
+        unresolved = list()
+        for value in set(values):
+            if self.cache is not None:
+                cached = self.cache.get(value)
+                if cached is not None:
+                    if cached:
+                        ingested.add(value)
+                    continue
+            if self.__warm and value not in self.bloom:
+                continue
+            unresolved.append(value)
+        if unresolved:
+            completed = self.__completed(unresolved, session)
+            ingested.update(completed)
+            if self.cache is not None:
+                for value in unresolved:
+                    self.cache.put(value, value in completed)
+        return ingested
+
+    def is_ingested(self,
+        value: str,
+        session: Optional[Union[Session, scoped_session]] = None
+    ) -> bool:
+        """
+        Args:
+            value   => value of self.field (hash or path) to check
+            session => session to query with
+        Returns:
+            Whether value has already been ingested (see: ingested).
+        Preconditions:
+            N/A
+        """
+        return value in self.ingested((value,), session)
+
+    def mark_ingested(self, values: Iterable[str]) -> 'LedgerDeduplicator':
+        """
+        Args:
+            values  => values of self.field (hashes or paths) to mark
+        Procedure:
+            Record values as ingested in the cache and Bloom filter, i.e. after
+            committing completed ledger rows for them in this process.
+        Preconditions:
+            N/A
+        """
+        for value in values:
+            if self.cache is not None:
+                self.cache.put(value, True)
+            if self.bloom is not None:
+                self.bloom.add(value)
+        return self
+
+    def clear(self) -> 'LedgerDeduplicator':
+        """
+        Args:
+            N/A
+        Procedure:
+            Discard all cached results, including the Bloom filter (which
+            must be warmed again before it is used).
+        Preconditions:
+            N/A
+        """
+        if self.cache is not None:
+            self.cache.clear()
+        if self.bloom is not None:
+            self.bloom.clear()
+        self.__warm = False
+        return self
@@ -0,0 +1,237 @@
+## -*- coding: UTF8 -*-
+## loader.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Any, Callable, Iterable, Dict, List, FrozenSet
+from datetime import datetime, timezone
+from io import StringIO
+from time import perf_counter
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine, Connection
+from sqlalchemy.schema import Table
+
+from .utils import BulkInsertResult, chunked
+
+# maximum number of bound parameters per statement (and rows per VALUES
+# clause for MSSQL) supported by each dialect's multi-row INSERT
+_MAX_PARAMETERS = dict(mysql=65535, mssql=2100)
+_MAX_VALUES_ROWS = dict(mssql=1000)
+
+LoadFunction = Callable[[Connection, Table, List[str], List[Dict[str, Any]]], None]
+
+
+def _utc(value: datetime, naive: bool) -> datetime:
+    """
+    Args:
+        value   => datetime to normalize
+        naive   => whether to return a naive datetime
+    Returns:
+        value converted to UTC, as either a naive or aware datetime.  Naive
+        values are assumed to already be UTC (like the server-side created_at
+        default, see: utils.TimestampDefaultExpression).
+    Preconditions:
+        N/A
+    """
+    if value.tzinfo is None:
+        return value if naive else value.replace(tzinfo=timezone.utc)
+    value = value.astimezone(timezone.utc)
+    return value.replace(tzinfo=None) if naive else value
+
+def _utc_mapping(mapping: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Args:
+        mapping => mapping to normalize
+    Returns:
+        Copy of mapping with datetimes converted to naive UTC (see: _utc).
+    Preconditions:
+        N/A
+    """
+    return {
+        key: _utc(value, True) if isinstance(value, datetime) else value \
+        for key, value in mapping.items()
+    }
+
+def _copy_value(value: Any) -> str:
+    """
+    Args:
+        value   => value to serialize
+    Returns:
+        value serialized as a PostgreSQL COPY CSV field, where NULL is
+        the unquoted string \\N and every other value is quoted (so that it
+        can never be mistaken for NULL).
+    Preconditions:
+        N/A
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        value = 't' if value else 'f'
+    elif isinstance(value, datetime):
+        value = _utc(value, False).isoformat()
+    return '"%s"'%str(value).replace('"', '""')
+
+def _copy_rows(
+    connection: Connection,
+    table: Table,
+    keys: List[str],
+    mappings: List[Dict[str, Any]]
+) -> None:
+    """
+    Args:
+        connection  => PostgreSQL (psycopg2) connection
+        table       => table to load mappings into
+        keys        => column keys of mappings
+        mappings    => mappings to load
+    Procedure:
+        Load mappings with COPY FROM STDIN in CSV format.  Columns not in keys
+        (i.e. created_at) are filled by their server-side defaults.
+    Preconditions:
+        connection uses the psycopg2 DBAPI
+    """
+    preparer = connection.dialect.identifier_preparer
+    buffer = StringIO()
+    for mapping in mappings:
+        buffer.write(','.join(_copy_value(mapping[key]) for key in keys))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            'COPY %s (%s) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'%(
+                preparer.format_table(table),
+                ', '.join(preparer.quote(table.c[key].name) for key in keys)
+            ),
+            buffer
+        )
+    finally:
+        cursor.close()
+
+def _insert_values(
+    connection: Connection,
+    table: Table,
+    keys: List[str],
+    mappings: List[Dict[str, Any]]
+) -> None:
+    """
+    Args:
+        connection  => MySQL or MSSQL connection
+        table       => table to load mappings into
+        keys        => column keys of mappings
+        mappings    => mappings to load
+    Procedure:
+        Load mappings with multi-row INSERT ... VALUES statements, each with as
+        many rows as the dialect's parameter (and row) limits allow.  Timezone-aware
+        datetimes are converted to naive UTC, as neither dialect's TIMESTAMP type
+        stores time zones.
+    Preconditions:
+        N/A
+    """
+    dialect = connection.dialect.name
+    rows = max(1, _MAX_PARAMETERS.get(dialect, 65535) // max(1, len(keys)) - 1)
+    rows = min(rows, _MAX_VALUES_ROWS.get(dialect, rows))
+    for chunk in chunked(mappings, rows):
+        connection.execute(
+            table.insert().values([_utc_mapping(mapping) for mapping in chunk])
+        )
+
+def _executemany( #pylint: disable=W0613
+    connection: Connection,
+    table: Table,
+    keys: List[str],
+    mappings: List[Dict[str, Any]]
+) -> None:
+    """
+    Args:
+        connection  => connection
+        table       => table to load mappings into
+        keys        => column keys of mappings
+        mappings    => mappings to load
+    Procedure:
+        Load mappings with a single prepared INSERT statement executed once
+        per mapping (executemany).  Timezone-aware datetimes are converted to
+        naive UTC, as SQLite stores datetimes without time zones (and would
+        otherwise store their local wall-clock time).
+    Preconditions:
+        N/A
+    """
+    connection.execute(table.insert(), [_utc_mapping(mapping) for mapping in mappings])
+
+def _writer(engine: Engine) -> LoadFunction:
+    """
+    Args:
+        engine  => engine to load mappings with
+    Returns:
+        Function loading mappings using the fastest native path of engine's
+        dialect (see: load).
+    Preconditions:
+        N/A
+    """
+    dialect = engine.dialect.name
+    if dialect == 'postgresql' and engine.dialect.driver == 'psycopg2':
+        return _copy_rows
+    if dialect in ('mysql', 'mssql'):
+        return _insert_values
+    return _executemany
+
+def load(
+    engine: Engine,
+    model: Any,
+    mappings: Iterable[Dict[str, Any]],
+    batch_size: int = 10000
+) -> BulkInsertResult:
+    """
+    Args:
+        engine      => engine to load mappings with
+        model       => model (or table) to load mappings into
+        mappings    => iterable of dicts mapping column keys to values
+                       (see: models.BaseTableTemplate.to_mappings)
+        batch_size  => number of mappings to buffer and load at a time
+    Returns:
+        BulkInsertResult containing number of rows loaded, batches loaded,
+        commits issued (always 1) and elapsed time.
+    Procedure:
+        Load mappings into the table of model in a single transaction, using the
+        fastest native path of engine's dialect:
+            1) PostgreSQL (psycopg2) -> COPY FROM STDIN
+            2) MySQL, MSSQL -> multi-row INSERT ... VALUES
+            3) SQLite, Default -> prepared executemany
+        Within each batch, mappings are grouped by their set of keys, and columns
+        omitted from mappings are filled by their server-side defaults (i.e.
+        created_at, see: utils.TimestampDefaultExpression).
+    Preconditions:
+        batch_size is greater than 0
+    """
+    table = model if isinstance(model, Table) else inspect(model).local_table
+    writer = _writer(engine)
+    rows = batches = 0
+    start = perf_counter()
+    with engine.begin() as connection:
+        for batch in chunked(mappings, batch_size):
+            groups = dict() # type: Dict[FrozenSet[str], List[Dict[str, Any]]]
+            for mapping in batch:
+                groups.setdefault(frozenset(mapping), list()).append(mapping)
+            for keys, group in groups.items():
+                writer(connection, table, sorted(keys), group)
+            rows += len(batch)
+            batches += 1
+    return BulkInsertResult(rows, batches, 1, perf_counter() - start)
@@ -0,0 +1,313 @@
+## -*- coding: UTF8 -*-
+## maintenance.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Optional, Any, Callable, Iterator, Dict, List, Tuple
+from datetime import datetime
+from time import sleep
+
+from sqlalchemy import inspect, select, func
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import Table, Index, Column
+
+from .utils import refresh_view
+from .partitioning import is_partitioned, partitioned_by_ledger, storage_table_name, \
+    partition_indexes, create_partitions, ensure_partitions, drop_partition
+
+
+def _purge_chunks(
+    engine: Engine,
+    table: Table,
+    column: Column,
+    ledger_id: int,
+    chunk_size: int
+) -> Iterator[int]:
+    """
+    Args:
+        engine      => engine to delete rows with
+        table       => table to delete rows of ledger from
+        column      => column of table referencing the ledger
+        ledger_id   => id of ledger to delete rows of
+        chunk_size  => maximum number of rows to delete per transaction
+    Returns:
+        Number of rows deleted by each transaction, deleting up to chunk_size
+        rows of table referencing ledger_id by primary key per transaction
+        until none are left.
+    Preconditions:
+        table has a single-column primary key
+    """
+    primary_key = list(table.primary_key.columns)[0]
+    while True:
+        with engine.begin() as connection:
+            keys = [
+                row[0] for row in connection.execute(
+                    select([primary_key]).where(column == ledger_id).limit(chunk_size)
+                )
+            ]
+            if keys:
+                connection.execute(table.delete().where(primary_key.in_(keys)))
+        if keys:
+            yield len(keys)
+        if len(keys) < chunk_size:
+            return
+
+def _drop_ledger_partition(
+    engine: Engine,
+    table: Table,
+    column: Column,
+    ledger_id: int
+) -> int:
+    """
+    Args:
+        engine      => engine to drop partition with
+        table       => table partitioned by ledger
+        column      => column of table referencing the ledger
+        ledger_id   => id of ledger to drop partition of
+    Returns:
+        Number of rows in the dropped partition of ledger_id, or 0 if it
+        does not exist.
+    Preconditions:
+        table is partitioned by ledger (see: partitioning.partitioned_by_ledger)
+    """
+    with engine.begin() as connection:
+        rows = connection.execute(
+            select([func.count()]).select_from(table).where(column == ledger_id)
+        ).scalar()
+        return rows if drop_partition(connection, table, ledger_id) else 0
+
+
+class MaintenanceMixin:
+    """Mixin for DBManager maintaining the database schema and its data:
+    partitions, deferred indexes, materialized views and ledger purges."""
+
+    def partitioned_tables(self) -> List[Table]:
+        """
+        Args:
+            N/A
+        Returns:
+            Tables in self.metadata declared as partitioned
+            (see: partitioning.partition_table).
+        Preconditions:
+            self.metadata is not None
+        """
+        return [table for table in self.metadata.sorted_tables if is_partitioned(table)]
+
+    def create_partitions(self,
+        ledger_id: Optional[int] = None,
+        timestamp: Optional[datetime] = None
+    ) -> List[str]:
+        """
+        Args:
+            ledger_id   => id of ledger to create partitions for (if None, partitions
+                           are created for every ledger)
+            timestamp   => time to create range partitions for (default: now)
+        Returns:
+            Names of the partitions created, skipping those that already exist.
+        Procedure:
+            Create the partitions of each partitioned table in a single transaction:
+            tables partitioned by ledger get a partition for ledger_id (or every
+            ledger), and tables partitioned by range get partitions for the period
+            containing timestamp and the period following it.
+            NOTE:
+                Partitions are created automatically when ledger rows are inserted
+                through the ORM, so this only needs to be called for ledgers
+                inserted otherwise (i.e. with add_many), or to create range
+                partitions ahead of time.
+        Preconditions:
+            self.engine is not None and self.metadata is not None
+        """
+        created = list()
+        with self.engine.begin() as connection:
+            for table in self.partitioned_tables():
+                if ledger_id is not None and table.info['partition']['interval'] is None:
+                    created.extend(create_partitions(connection, table, (ledger_id,)))
+                else:
+                    created.extend(ensure_partitions(connection, table, timestamp))
+        return created
+
+    def missing_indexes(self, engine: Optional[Engine] = None) -> List[Index]:
+        """
+        Args:
+            engine  => the connection engine to use
+        Returns:
+            Indexes declared in self.metadata that do not exist in the database,
+            i.e. indexes deferred by bootstrap(defer_indexes=True) that have not
+            been built yet (see: build_indexes), followed by those of the partitions
+            of each table (see: partitioning.partition_indexes).
+        Preconditions:
+            The tables of self.metadata exist
+        """
+        if engine is None:
+            engine = self.engine
+        inspector = inspect(engine)
+        missing = list()
+        with engine.connect() as connection:
+            for table in self.metadata.sorted_tables:
+                if not table.indexes:
+                    continue
+                indexes = sorted(table.indexes, key=lambda index: index.name)
+                if is_partitioned(table):
+                    indexes.extend(partition_indexes(connection, table))
+                existing = dict()
+                for index in indexes:
+                    name = storage_table_name(engine.dialect, index.table)
+                    if name not in existing:
+                        existing[name] = set(
+                            found['name'] for found in inspector.get_indexes(
+                                name,
+                                schema=table.schema
+                            )
+                        )
+                    if index.name not in existing[name]:
+                        missing.append(index)
+        return missing
+
+    def build_indexes(self,
+        engine: Optional[Engine] = None,
+        callback: Optional[Callable[[Index, int, int], None]] = None
+    ) -> List[str]:
+        """
+        Args:
+            engine      => the connection engine to use
+            callback    => function called with (index, number built, number to
+                           build) after each index is built
+        Returns:
+            Names of the indexes built.
+        Procedure:
+            Build every index declared in self.metadata that does not exist in the
+            database (see: missing_indexes), one at a time.  Because missing indexes
+            are determined from the database itself, building can be resumed after
+            an interruption by simply calling build_indexes again.
+        Preconditions:
+            The tables of self.metadata exist
+        """
+        if engine is None:
+            engine = self.engine
+        missing = self.missing_indexes(engine)
+        for built, index in enumerate(missing, 1):
+            index.create(engine)
+            if callback is not None:
+                callback(index, built, len(missing))
+        return [index.name for index in missing]
+
+    def refresh_view(self,
+        view: Table,
+        concurrently: Optional[bool] = None,
+        incremental: bool = False
+    ) -> 'DBManager':
+        """
+        Args:
+            view            => view returned by utils.create_view
+            concurrently    => whether to refresh a PostgreSQL materialized view
+                               concurrently (see: utils.refresh_view)
+            incremental     => whether to only insert rows missing since the last
+                               refresh into an emulated materialized view
+        Procedure:
+            Refresh view using self.engine (see: utils.refresh_view).
+        Preconditions:
+            self.engine is not None
+        """
+        refresh_view(view, self.engine, concurrently, incremental)
+        return self
+
+    def linked_tables(self, ledger: Any) -> List[Tuple[Table, Any]]:
+        """
+        Args:
+            ledger  => model (or table) of file ledger table
+        Returns:
+            List of (table, column) pairs for each table in self.metadata with
+            a foreign key column referencing ledger (see: FileLedgerLinkedMixin),
+            ordered so that tables depending on other linked tables come first.
+        Preconditions:
+            self.metadata is not None
+        """
+        ledger_table = ledger if isinstance(ledger, Table) \
+            else inspect(ledger).local_table
+        linked = list()
+        for table in reversed(self.metadata.sorted_tables):
+            for foreign_key in table.foreign_keys:
+                if foreign_key.column.table is ledger_table and table is not ledger_table:
+                    linked.append((table, foreign_key.parent))
+        return linked
+
+    def purge_ledger(self,
+        ledger: Any,
+        ledger_id: int,
+        chunk_size: int = 10000,
+        callback: Optional[Callable[[str, int], None]] = None,
+        pause: float = 0.0
+    ) -> Dict[str, int]:
+        """
+        Args:
+            ledger      => model of file ledger table
+            ledger_id   => id of ledger row to purge
+            chunk_size  => maximum number of rows to delete per transaction
+            callback    => function called with (table name, rows deleted from
+                           table so far) after each chunk is deleted
+            pause       => number of seconds to sleep between chunks, to give other
+                           writers a chance to acquire locks
+        Returns:
+            Dict mapping table names to number of rows deleted from them.
+        Procedure:
+            Delete all rows linked to a ledger row (see: linked_tables), then the
+            ledger row itself, using set-based deletes of at most chunk_size rows
+            selected by primary key, each in its own transaction, rather than
+            relying on a single ON DELETE CASCADE (which holds locks for the
+            duration of the delete, and is not enforced by SQLite unless foreign
+            keys are enabled).  Tables partitioned by ledger (see:
+            partitioning.partition_table) have the partition of the ledger dropped
+            instead, after counting its rows.  Purging can be resumed after an
+            interruption by calling it again.
+        Preconditions:
+            self.engine is not None and self.metadata is not None
+            Linked tables have single-column primary keys
+        """
+        ledger_table = inspect(ledger).local_table
+        tables = self.linked_tables(ledger) + [(ledger_table, ledger_table.c.id)]
+        deleted = dict()
+        for table, column in tables:
+            deleted[table.name] = 0
+            try:
+                if partitioned_by_ledger(table, ledger_table):
+                    deleted[table.name] = _drop_ledger_partition(
+                        self.engine,
+                        table,
+                        column,
+                        ledger_id
+                    )
+                    if callback is not None and deleted[table.name]:
+                        callback(table.name, deleted[table.name])
+                for count in _purge_chunks(
+                    self.engine,
+                    table,
+                    column,
+                    ledger_id,
+                    chunk_size
+                ):
+                    deleted[table.name] += count
+                    if callback is not None:
+                        callback(table.name, deleted[table.name])
+                    if pause > 0 and count == chunk_size:
+                        sleep(pause)
+            finally:
+                self.invalidate(table)
+        return deleted
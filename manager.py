@@ -28,8 +28,27 @@ from sqlalchemy import create_engine as sqlalchemy_create_engine, MetaData
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, scoped_session, Session, Query
 
+from .utils import unscoped_sessionmaker
+from .engines import ENGINE_REGISTRY, EngineConfig, set_sqlite_profile
+from .queries import QueryMixin
+from .bulk import BulkWriteMixin
+from .cache import QueryCacheMixin
+from .maintenance import MaintenanceMixin
+from .routing import ReplicaRouter, ReplicaSession, ReplicaMixin
+from .bounded import BoundedSessionMixin
+from .instrumentation import InstrumentationMixin
+from .partitioning import attach_partition_listeners
 
-class DBManager:
+
+class DBManager( #pylint: disable=R0901
+    QueryMixin,
+    BulkWriteMixin,
+    QueryCacheMixin,
+    MaintenanceMixin,
+    ReplicaMixin,
+    BoundedSessionMixin,
+    InstrumentationMixin
+):
     """Database connection manager.  Handles database connection configuration
     for both standard applications and web servers (using thread-local storage),
     reading from and writing to a database (including transactions), etc.  This
@@ -41,15 +60,23 @@ class DBManager:
         conn_string: Optional[str] = None,
         metadata: Optional[MetaData] = None,
         session_factory: Optional[Callable[..., Session]] = None,
-        session: Optional[Union[session, scoped_session]] = None,
-        scoped: bool = False
+        session: Optional[Union[Session, scoped_session]] = None,
+        scoped: bool = False,
+        config: Optional[EngineConfig] = None
     ) -> None:
         self.conn_string = conn_string
+        self.config = config
         self.metadata = metadata
         self.session_factory = session_factory
         self.session = session
         self.scoped_sessions = scoped
         self.engine = None
+        self.replica_router = None
+        self.replica_session_factory = None
+        self.read_session = None
+        self.query_cache = None
+        self.session_bounds = None
+        self.instrumentation = None
 
     @property
     def conn_string(self) -> Optional[str]:
@@ -61,6 +88,16 @@ class DBManager:
         """Setter for conn_string."""
         self.__conn_string = value
 
+    @property
+    def config(self) -> EngineConfig:
+        """Getter for config."""
+        return self.__config
+
+    @config.setter
+    def config(self, value: Optional[EngineConfig]) -> None:
+        """Setter for config."""
+        self.__config = value if value is not None else EngineConfig()
+
     @property
     def engine(self) -> Optional[Engine]:
         """Getter for engine."""
@@ -113,29 +150,81 @@ class DBManager:
 
     def create_engine(self,
         conn_string: Optional[str] = None,
-        persist: bool = True
+        persist: bool = True,
+        **engine_options: Any
     ) -> Optional[Engine]:
         """
         Args:
-            conn_string => database connection string
-            persist     => whether to persist the database engine to self.engine
+            conn_string     => database connection string
+            persist         => whether to persist the database engine to self.engine
+            engine_options  => keyword arguments to sqlalchemy.create_engine, used to
+                               configure the connection pool (i.e. poolclass,
+                               pool_size, max_overflow, pool_pre_ping, pool_recycle,
+                               pool_timeout).  Merged with (and persisted to)
+                               self.config.engine_options.
         Returns:
-            New database connection (SQLAlchemy Engine) using either provided conn_string
-            or self.conn_string.
+            New database connection (SQLAlchemy Engine) using either provided
+            conn_string or self.conn_string.
             NOTE:
-                If both conn_string and self.conn_string are None then will return None.
+                If both conn_string and self.conn_string are None then will return
+                None.
+                If self.config.shared_engine is True, the engine is looked up in (or
+                added to) the process-wide engine registry (see:
+                engines.ENGINE_REGISTRY) so that managers with the same connection
+                string and engine options share a single connection pool.
+                If self.config.replicas is not empty, an engine is also created for
+                each read replica and reads are balanced across them (see:
+                routing.ReplicaRouter).
+                If self.config.profile is not None and the engine is a SQLite
+                engine, the profile's PRAGMA settings are applied to every pooled
+                connection (see: engines.SQLITE_PROFILES).
         Preconditions:
             N/A
         """
         if conn_string is not None:
             self.conn_string = conn_string
+        if engine_options:
+            self.config = self.config._replace(engine_options={
+                **(self.config.engine_options or dict()),
+                **engine_options
+            })
         if self.conn_string is not None:
-            engine = sqlalchemy_create_engine(self.conn_string)
+            engine = self.__build_engine(self.conn_string, persist)
             if persist:
                 self.engine = engine
+                if self.config.replicas:
+                    self.replica_router = ReplicaRouter(
+                        [
+                            self.__build_engine(replica, persist)
+                            for replica in self.config.replicas
+                        ],
+                        self.config.replica_strategy
+                    )
             return engine
         return None
 
+    def __build_engine(self, conn_string: str, instrument: bool) -> Engine:
+        """
+        Args:
+            conn_string => database connection string
+            instrument  => whether to attach self.instrumentation to the engine
+        Returns:
+            New (or, if self.config.shared_engine is True, shared) engine for
+            conn_string using self.config.engine_options and self.config.profile.
+        Preconditions:
+            N/A
+        """
+        engine_options = self.config.engine_options or dict()
+        if self.config.shared_engine:
+            engine = ENGINE_REGISTRY.get(conn_string, **engine_options)
+        else:
+            engine = sqlalchemy_create_engine(conn_string, **engine_options)
+        if self.config.profile is not None:
+            set_sqlite_profile(engine, self.config.profile)
+        if self.instrumentation is not None and instrument:
+            self.instrumentation.attach(engine=engine)
+        return engine
+
     def create_session(self, persist: bool = True) -> Union[Session, scoped_session]:
         """
         Args:
@@ -155,6 +244,33 @@ class DBManager:
             return self.session
         return (self.session_factory)()
 
+    def set_profile(self,
+        profile: Optional[str],
+        checkpoint: bool = True
+    ) -> 'DBManager':
+        """
+        Args:
+            profile     => name of SQLite performance profile to switch to
+                           (see: engines.SQLITE_PROFILES), or None
+            checkpoint  => whether to checkpoint (and truncate) the write-ahead
+                           log before switching profiles
+        Procedure:
+            Switch the SQLite performance profile applied to connections of
+            self.engine, i.e. to restore 'safe' settings once a 'bulk_ingest'
+            load has finished.  Pooled connections are reconfigured the next time
+            they are checked out.  Has no effect on non-SQLite engines beyond
+            setting self.config.profile.
+        Preconditions:
+            profile is None or a key in engines.SQLITE_PROFILES
+        """
+        self.config = self.config._replace(profile=profile)
+        if self.engine is not None and self.engine.dialect.name == 'sqlite':
+            set_sqlite_profile(self.engine, profile)
+            if checkpoint:
+                with self.engine.connect() as connection:
+                    connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return self
+
     def close_session(self,
         session: Optional[Union[Session, scoped_session]] = None
     ) -> None:
@@ -163,7 +279,7 @@ class DBManager:
             session => session to close if not self.session
         Procedure:
             Closes either the provided session or the current
-            session (self.session).
+            session (self.session) and read session (self.read_session).
         Preconditions:
             N/A
         """
@@ -174,29 +290,64 @@ class DBManager:
         elif self.session is not None:
             self.session.close()
             self.session = None
+        if session is None and self.read_session is not None:
+            self.read_session.close()
+            self.read_session = None
 
-    def bootstrap(self, engine: Optional[Engine] = None) -> None:
+    def bootstrap(self,
+        engine: Optional[Engine] = None,
+        defer_indexes: bool = False
+    ) -> None:
         """
         Args:
-            engine  => the connection engine to use
+            engine          => the connection engine to use
+            defer_indexes   => whether to create tables without their secondary
+                               (non-unique) indexes, for bulk loading
         Procedure:
             Use a database connection (SQLAlchemy Engine) to
             bootstrap a database with the necessary tables,
             indexes, and (materialized) views.
+            NOTE:
+                If defer_indexes is True, non-unique indexes are not created so that
+                they are not maintained row by row during the initial load, nor
+                are they created on partitions emulated by separate tables (see:
+                partitioning.partition_indexes).  Build them in a single pass once
+                loading has finished with build_indexes.  Primary keys and unique
+                indexes are always created, as they enforce constraints.
+                Partitions of partitioned tables (see: partitioning.partition_table)
+                are created for every existing ledger and the current period
+                (see: create_partitions).
         Preconditions:
             N/A
         """
         if engine is not None:
             self.engine = engine
         if self.engine is not None and self.metadata is not None:
-            self.metadata.create_all(self.engine)
+            if not defer_indexes:
+                self.metadata.create_all(self.engine)
+            else:
+                indexes = {
+                    table: table.indexes for table in self.metadata.tables.values()
+                }
+                try:
+                    for table in indexes:
+                        table.indexes = set(
+                            index for index in table.indexes if index.unique
+                        )
+                    self.metadata.create_all(self.engine)
+                finally:
+                    for table in indexes:
+                        table.indexes = indexes[table]
+            self.create_partitions()
 
     def initialize(self,
         conn_string: Optional[str] = None,
         metadata: Optional[MetaData] = None,
         bootstrap: bool = False,
         scoped: bool = False,
-        create_session: bool = False
+        create_session: bool = False,
+        config: Optional[EngineConfig] = None,
+        defer_indexes: bool = False
     ) -> 'DBManager':
         """
         Args:
@@ -206,6 +357,10 @@ class DBManager:
                                and views
             scoped          => whether to use scoped session objects
             create_session  => whether to create a persisted database session
+            config          => engine and connection pool configuration, replacing
+                               self.config (see: engines.EngineConfig)
+            defer_indexes   => whether to defer creation of secondary indexes when
+                               bootstrapping (see: DBManager.bootstrap)
         Procedure:
             Initialize a database connection using self.conn_string and perform
             various setup tasks such as boostrapping the database with the
@@ -219,28 +374,62 @@ class DBManager:
         """
         if conn_string is not None:
             self.conn_string = conn_string
+        if config is not None:
+            self.config = config
         self.create_engine()
         if metadata is not None:
             self.metadata = metadata
         if self.engine is not None:
             if bootstrap:
-                self.bootstrap()
-            if scoped or self.scoped_sessions:
-                self.session_factory = scoped_session(
-                    sessionmaker(bind=self.engine, autoflush=False)
-                )
-                self.scoped_sessions = True
-            else:
-                self.session_factory = sessionmaker(bind=self.engine, autoflush=False)
-                self.scoped_sessions = False
+                self.bootstrap(defer_indexes=defer_indexes)
+            self.__create_session_factories(scoped or self.scoped_sessions)
             if create_session and not self.scoped_sessions:
                 self.create_session()
         return self
 
-    def query(self, model: Any, **kwargs: Any) -> Optional[Query]:
+    def __create_session_factories(self, scoped: bool) -> None:
+        """
+        Args:
+            scoped  => whether to use scoped session objects
+        Procedure:
+            Create the (scoped) session factory bound to self.engine, and the
+            session factory of the read replicas if there are any, then attach
+            the session event listeners of partitioned tables, instrumentation
+            and the query cache to it.
+        Preconditions:
+            self.engine is not None
+        """
+        self.session_factory = sessionmaker(bind=self.engine, autoflush=False)
+        if scoped:
+            self.session_factory = scoped_session(self.session_factory)
+        self.scoped_sessions = scoped
+        if self.replica_router is not None:
+            self.replica_session_factory = sessionmaker(
+                class_=ReplicaSession,
+                router=self.replica_router,
+                autoflush=False,
+                autocommit=True
+            )
+        factory = unscoped_sessionmaker(self.session_factory)
+        if self.metadata is not None and self.partitioned_tables():
+            attach_partition_listeners(factory)
+        if self.instrumentation is not None:
+            self.instrumentation.attach(session_factory=factory)
+        if self.query_cache is not None:
+            self.query_cache.attach(factory)
+
+    def query(self,
+        model: Any,
+        session: Optional[Union[Session, scoped_session]] = None,
+        primary: bool = False,
+        **kwargs: Any
+    ) -> Optional[Query]:
         """
         Args:
             model   => model of table to query
+            session => session to query with
+            primary => whether to read from the primary database (for
+                       read-your-writes) rather than a read replica
             kwargs  => fields to filter on
         Returns:
             SQLAlchemy Query object with field filters from kwargs applied.
@@ -249,14 +438,16 @@ class DBManager:
         Preconditions:
             N/A
         """
-        query = self.session.query(model)
-        for arg in kwargs:
-            query = query.filter(getattr(model, arg) == kwargs[arg])
+        if session is None:
+            session = self.session if primary else self.create_read_session()
+        query = session.query(model)
+        for arg, value in kwargs.items():
+            query = query.filter(getattr(model, arg) == value)
         return query
 
     def add(self,
         record: Any,
-        session: Optional[Union[session, scoped_session]] = None,
+        session: Optional[Union[Session, scoped_session]] = None,
         commit: bool = False
     ) -> 'DBManager':
         """
@@ -266,20 +457,23 @@ class DBManager:
             commit      => whether to commit and end the transaction block
         Procedure:
             Add record to either provided or current session and commit if specified
-            (wrapper around Session.add).
+            (wrapper around Session.add), flushing the session if it reached its
+            bounds (see: enable_bounded_session).
         Preconditions:
             N/A
         """
         if session is None:
             session = self.session
         session.add(record)
+        if self.session_bounds is not None:
+            self.session_bounds.added(session)
         if commit:
             self.commit(session)
         return self
 
     def delete(self,
         record: Any,
-        session: Optional[Union[session, scoped_session]] = None,
+        session: Optional[Union[Session, scoped_session]] = None,
         commit: bool = False
     ) -> 'DBManager':
         """
@@ -301,23 +495,38 @@ class DBManager:
         return self
 
     def commit(self,
-        session: Optional[Union[session, scoped_session]] = None
+        session: Optional[Union[Session, scoped_session]] = None
     ) -> 'DBManager':
         """
         Args:
             session => session to add record to
         Procedure:
             Commit either provided or current session (wrapper around Session.commit).
+            NOTE:
+                Objects loaded from a read replica belong to self.read_session and
+                cannot be written, so committing the current session while
+                self.read_session has pending changes raises RuntimeError rather
+                than silently dropping them.
         Preconditions:
             N/A
         """
         if session is None:
+            read_session = self.read_session
+            if read_session is not None and (
+                read_session.new or read_session.dirty or read_session.deleted
+            ):
+                raise RuntimeError(
+                    'Cannot commit changes to objects loaded from a read replica '
+                    '(query them with primary=True to modify them)'
+                )
             session = self.session
         session.commit()
+        if self.session_bounds is not None:
+            self.session_bounds.committed(session)
         return self
 
     def rollback(self,
-        session: Optional[Union[session, scoped_session]] = None
+        session: Optional[Union[Session, scoped_session]] = None
     ) -> 'DBManager':
         """
         Args:
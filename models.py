@@ -21,14 +21,18 @@
 ## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 ## SOFTWARE.
 
-from typing import Dict, Any
+from typing import Optional, Iterable, Union, Tuple, Dict, List, FrozenSet, Any
 
 import re
+from sqlalchemy import inspect
 from sqlalchemy.types import Integer, TIMESTAMP, Boolean
 from sqlalchemy.sql.schema import Column, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base, declared_attr
+from sqlalchemy.event import listen, listens_for
 
 from .utils import TimestampDefaultExpression, DialectSpecificText
+from .partitioning import partition_table, on_ledger_insert, on_partitioned_insert, \
+    on_partitioned_update
 
 
 class BaseTableTemplate:
@@ -36,6 +40,10 @@ class BaseTableTemplate:
     for populating an ORM table instance with fields from a dictionary."""
     __KEY_REGEX_01 = re.compile(r'(.)([A-Z][a-z]+)')
     __KEY_REGEX_02 = re.compile(r'([a-z0-9])([A-Z])')
+    __CONVERTED_KEYS = dict()   # type: Dict[str, str]
+    __FIELD_MAPS = dict()       # type: Dict[type, Dict[str, Optional[str]]]
+    __COLUMN_MAPS = dict()      # type: Dict[type, Dict[str, str]]
+    __SERVER_DEFAULTS = dict()  # type: Dict[type, FrozenSet[str]]
 
     @classmethod
     def __convert_key(cls, key: str) -> str:
@@ -43,18 +51,99 @@ class BaseTableTemplate:
         Args:
             key => key to convert
         Returns:
-            Key converted from camel case to snake case.
+            Key converted from camel case to snake case.  Conversions are
+            memoized, as the same keys are converted for every record.
             NOTE:
                 Implementation taken from:
                 https://stackoverflow.com/questions/1175208/elegant-python-function-to-convert-camelcase-to-snake-case#1176023
         Preconditions:
             N/A
         """
-        return re.sub(
-            cls.__KEY_REGEX_02,
-            r'\1_\2',
-            re.sub(cls.__KEY_REGEX_01, r'\1_\2', key)
-        ).lower()
+        try:
+            return cls.__CONVERTED_KEYS[key]
+        except KeyError:
+            converted_key = re.sub(
+                cls.__KEY_REGEX_02,
+                r'\1_\2',
+                re.sub(cls.__KEY_REGEX_01, r'\1_\2', key)
+            ).lower()
+            cls.__CONVERTED_KEYS[key] = converted_key
+            return converted_key
+
+    @classmethod
+    def __field_map(cls) -> Dict[str, Optional[str]]:
+        """
+        Args:
+            N/A
+        Returns:
+            Per-class dict mapping (unconverted) data keys to the name of the
+            attribute of this class they populate, or None if this class has no
+            such attribute.  Entries are resolved lazily on first use.
+        Preconditions:
+            N/A
+        """
+        try:
+            return cls.__FIELD_MAPS[cls]
+        except KeyError:
+            return cls.__FIELD_MAPS.setdefault(cls, dict())
+
+    @classmethod
+    def __column_map(cls) -> Dict[str, str]:
+        """
+        Args:
+            N/A
+        Returns:
+            Per-class dict mapping attribute names of mapped columns to the
+            keys of their underlying table columns, resolved once per class.
+        Preconditions:
+            cls is a mapped class
+        """
+        try:
+            return cls.__COLUMN_MAPS[cls]
+        except KeyError:
+            return cls.__COLUMN_MAPS.setdefault(cls, {
+                attr.key: attr.columns[0].key \
+                for attr in inspect(cls).column_attrs
+            })
+
+    @classmethod
+    def __server_defaults(cls) -> FrozenSet[str]:
+        """
+        Args:
+            N/A
+        Returns:
+            Per-class set of keys of table columns with a server-side default,
+            resolved once per class.
+        Preconditions:
+            cls is a mapped class
+        """
+        try:
+            return cls.__SERVER_DEFAULTS[cls]
+        except KeyError:
+            return cls.__SERVER_DEFAULTS.setdefault(cls, frozenset(
+                column.key for column in inspect(cls).local_table.columns \
+                if column.server_default is not None
+            ))
+
+    @classmethod
+    def __resolve_field(cls, key: str) -> Optional[str]:
+        """
+        Args:
+            key => data key to resolve
+        Returns:
+            Name of attribute of this class that key populates, or None
+            if this class has no such attribute.
+        Preconditions:
+            N/A
+        """
+        field_map = cls.__field_map()
+        try:
+            return field_map[key]
+        except KeyError:
+            converted_key = cls.__convert_key(key)
+            field = converted_key if hasattr(cls, converted_key) else None
+            field_map[key] = field
+            return field
 
     @declared_attr
     def __tablename__(cls) -> str:  #pylint: disable=E0213
@@ -79,13 +168,47 @@ class BaseTableTemplate:
         Preconditions:
             data_dict is of type Dict<String, Any>
         """
+        resolve_field = self.__resolve_field
         for key in data_dict:
-            converted_key = self.__convert_key(key)
-            if hasattr(self, converted_key) and \
-               (getattr(self, converted_key) is None or overwrite):
-                setattr(self, converted_key, data_dict[key])
+            field = resolve_field(key)
+            if field is not None and \
+               (overwrite or getattr(self, field) is None):
+                setattr(self, field, data_dict[key])
         return self
 
+    @classmethod
+    def to_mappings(cls, data_dicts: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Args:
+            data_dicts  => dicts containing data to map to fields
+        Returns:
+            List of dicts mapping table column keys to values, one per dict in
+            data_dicts, suitable for passing directly to DBManager.add_many
+            (or any executemany-style Core insert) without creating ORM
+            instances.  Keys are converted the same way as in populate_fields,
+            and keys that do not map to a column of this table are dropped.
+            Keys whose value is None are also dropped for columns with a server-side
+            default (i.e. created_at), so that the default applies rather than NULL.
+        Preconditions:
+            cls is a mapped class
+            data_dicts is of type Iterable<Dict<String, Any>>
+        """
+        resolve_field = cls.__resolve_field
+        column_map = cls.__column_map()
+        server_defaults = cls.__server_defaults()
+        mappings = list()
+        for data_dict in data_dicts:
+            mapping = dict()
+            for key in data_dict:
+                column_key = column_map.get(resolve_field(key))
+                if column_key is None:
+                    continue
+                if data_dict[key] is None and column_key in server_defaults:
+                    continue
+                mapping[column_key] = data_dict[key]
+            mappings.append(mapping)
+        return mappings
+
 
 BaseTable = declarative_base(cls=BaseTableTemplate) #pylint: disable=C0103
 
@@ -120,12 +243,27 @@ class FileLedgerMixin(TableMixin):
     create_time = Column(TIMESTAMP(timezone=True))
     completed = Column(Boolean, index=True)
 
+    @declared_attr
+    def __table_args__(cls): #pylint: disable=E0213
+        return tuple(
+            Index(
+                'idx_%s_%s_completed'%(cls.__tablename__, field), #pylint: disable=E1101
+                field,
+                'completed'
+            ) for field in ('md5hash', 'sha1hash', 'sha2hash', 'file_path')
+        ) + (TableMixin.__table_args__,)
+
 
 class FileLedgerLinkedMixin:
     """Mixin for tables linked to fileledger table (see: FileLedgerMixin).
     Creates a foreign key called ledger_id that links to the fileledger table,
-    and thus assumes the fileledger table exists.
+    and thus assumes the fileledger table exists.  To partition the table, set
+    __partition_by__ to 'ledger_id' (one partition per ledger, so that purging a
+    ledger drops its partition), or to ('created_at', <interval>) with an interval
+    of 'day', 'month' or 'year' (see: partitioning.partition_table).
     """
+    __partition_by__ = None # type: Optional[Union[str, Tuple[str, str]]]
+
     @declared_attr
     def ledger_id(cls): #pylint: disable=E0213,R0201
         return Column(
@@ -136,14 +274,42 @@ class FileLedgerLinkedMixin:
         )
 
 
+@listens_for(FileLedgerLinkedMixin, 'instrument_class', propagate=True)
+def _partition_linked_table(mapper, cls) -> None:
+    """Declare the table of a class linked to the fileledger table as partitioned
+    if the class sets __partition_by__ (see: FileLedgerLinkedMixin), without
+    confirming deleted rows (which SQLite does not report for partitioned tables).
+    """
+    partition_by = getattr(cls, '__partition_by__', None)
+    if partition_by is not None:
+        if isinstance(partition_by, str):
+            partition_by = (partition_by,)
+        partition_table(mapper.local_table, *partition_by)
+        mapper.confirm_deleted_rows = False
+
+listen(FileLedgerLinkedMixin, 'before_insert', on_partitioned_insert, propagate=True)
+listen(FileLedgerLinkedMixin, 'before_update', on_partitioned_update, propagate=True)
+listen(FileLedgerMixin, 'after_insert', on_ledger_insert, propagate=True)
+
+
 class SharedStructureTableMixin:
-    """Mixin for tables storing data present in multiple structures."""
+    """Mixin for tables storing data present in multiple structures.  Each row
+    references its owning structure by structure_type (the table or class name
+    of the structure) and structure_id (its primary key), which are indexed
+    together as idx_<table>_structure (see: DBManager.resolve_structures).
+    """
     structure_id = Column(Integer, nullable=False)
     structure_type = Column(DialectSpecificText(), nullable=False)
-    __table_args = (
-        Index(
-            'idx_filereference_foreignkeys',
-            'structure_id',
-            'structure_type'
-        ),
-    )
+
+
+@listens_for(SharedStructureTableMixin, 'instrument_class', propagate=True)
+def _index_shared_structure_table(mapper, _cls) -> None:
+    """Add the (structure_type, structure_id) composite index to the table of a
+    class storing shared structure data.  The index is added here rather than in
+    __table_args__, which TableMixin.__table_args__ takes precedence over when
+    TableMixin comes first in the bases of the class.
+    """
+    table = mapper.local_table
+    name = 'idx_%s_structure'%table.name
+    if not any(index.name == name for index in table.indexes):
+        Index(name, table.c.structure_type, table.c.structure_id)
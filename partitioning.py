@@ -0,0 +1,934 @@
+## -*- coding: UTF8 -*-
+## partitioning.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+#pylint: disable=W0613
+from typing import Optional, Any, Callable, Iterable, Union, Dict, List, Set, Tuple
+from calendar import timegm
+from datetime import datetime, timedelta, timezone
+import re
+
+from sqlalchemy import select, and_, inspect
+from sqlalchemy.engine import Connection
+from sqlalchemy.engine.interfaces import Compiled, Dialect
+from sqlalchemy.event import listen
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session, Mapper, sessionmaker, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.schema import Table, Column, MetaData, Index, DDLElement, CreateTable, \
+    CreateIndex, DropTable
+from sqlalchemy.sql.expression import ClauseElement
+
+PARTITION_INTERVALS = ('day', 'month', 'year')
+_SUFFIX_FORMATS = dict(day='%Y%m%d', month='%Y%m', year='%Y')
+
+PartitionKey = Union[int, datetime]
+
+
+def partition_table(
+    table: Table,
+    column: str = 'ledger_id',
+    interval: Optional[str] = None
+) -> Table:
+    """
+    Args:
+        table       => table to partition
+        column      => name of column to partition table by
+        interval    => if None, table is partitioned by list with one partition per
+                       value of column (i.e. per ledger), otherwise table is
+                       partitioned by range with one partition per day, month or
+                       year (see: PARTITION_INTERVALS) of column (i.e. created_at)
+    Returns:
+        table, declared as partitioned:
+            1) PostgreSQL -> declarative partitioning (PARTITION BY LIST/RANGE),
+               with a DEFAULT partition for rows without a partition
+            2) MySQL -> PARTITION BY LIST/RANGE, without foreign keys (which
+               partitioned InnoDB tables do not support), with a MAXVALUE
+               partition for rows past the latest range partition
+            3) SQLite -> one table per partition, plus a default partition, behind
+               a UNION ALL view named after table, with INSTEAD OF triggers routing
+               writes to the partition tables
+        Partitions are created with create_partitions (which DBManager.bootstrap
+        and inserting a ledger row through the ORM do automatically), and dropped
+        with drop_partition.
+        NOTE:
+            PostgreSQL and MySQL require the primary key (and every unique index)
+            to include column, so column is appended to the primary key in DDL
+            and made NOT NULL.  The primary key of the mapped class is unchanged.
+            The SQLite emulation allocates primary keys from a sequence table
+            shared by the partitions.  SQLite does not report rows changed by
+            INSTEAD OF triggers, so ORM updates are written by
+            on_partitioned_update and mapped classes must not confirm deleted rows
+            (which FileLedgerLinkedMixin takes care of).  Rows are not moved
+            between partitions when column changes, upserts are not supported,
+            and SQLite limits the view to 500 partitions by default
+            (SQLITE_MAX_COMPOUND_SELECT).
+            On MySQL, partitions are created by DDL which implicitly commits, so
+            partitions for ledgers inserted through the ORM are only created once
+            the session commits (see: attach_partition_listeners).
+    Preconditions:
+        table has a single-column integer primary key
+        If interval is None, column is an integer column, otherwise a timestamp column
+    """
+    if 'partition' in table.info:
+        return table
+    if interval is not None and interval not in PARTITION_INTERVALS:
+        raise ValueError('Invalid partition interval %s (expected one of %s)'%(
+            interval,
+            ', '.join(PARTITION_INTERVALS)
+        ))
+    _register_compilers()
+    table.info['partition'] = dict(column=table.c[column].name, interval=interval)
+    table.c[column].nullable = False
+    if interval is None:
+        table.dialect_kwargs['postgresql_partition_by'] = 'LIST (%s)'%column
+        table.dialect_kwargs['mysql_partition_by'] = \
+            'LIST (%s) (PARTITION %s VALUES IN (0))'%(
+            column,
+            partition_name(table, 0)
+        )
+    else:
+        key = partition_key(table, datetime.utcnow())
+        table.dialect_kwargs['postgresql_partition_by'] = 'RANGE (%s)'%column
+        table.dialect_kwargs['mysql_partition_by'] = \
+            'RANGE (UNIX_TIMESTAMP(%s)) (PARTITION %s VALUES LESS THAN (%d), ' \
+            'PARTITION %s VALUES LESS THAN MAXVALUE)'%(
+                column,
+                partition_name(table, key),
+                timegm(_period_end(key, interval).timetuple()),
+                _default_name(table)
+            )
+    listen(table, 'after_create', _create_partitioned_table)
+    listen(table, 'after_drop', _drop_partitioned_table)
+    return table
+
+def is_partitioned(table: Table) -> bool:
+    """
+    Args:
+        table   => table to check
+    Returns:
+        Whether table was declared as partitioned (see: partition_table).
+    Preconditions:
+        N/A
+    """
+    return 'partition' in table.info
+
+def partitioned_by_ledger(table: Table, ledger_table: Table) -> bool:
+    """
+    Args:
+        table           => table to check
+        ledger_table    => file ledger table
+    Returns:
+        Whether table is partitioned by list on a foreign key to ledger_table,
+        i.e. has one partition per ledger.
+    Preconditions:
+        N/A
+    """
+    if not is_partitioned(table) or table.info['partition']['interval'] is not None:
+        return False
+    return any(
+        foreign_key.column.table is ledger_table \
+        for foreign_key in table.c[table.info['partition']['column']].foreign_keys
+    )
+
+def _period_end(start: datetime, interval: str) -> datetime:
+    """
+    Args:
+        start       => start of period
+        interval    => length of period (see: PARTITION_INTERVALS)
+    Returns:
+        Start of the period following the one starting at start.
+    Preconditions:
+        N/A
+    """
+    if interval == 'day':
+        return start + timedelta(days=1)
+    if interval == 'month':
+        return start.replace(
+            year=start.year + start.month // 12,
+            month=start.month % 12 + 1
+        )
+    return start.replace(year=start.year + 1)
+
+def partition_key(table: Table, value: PartitionKey) -> PartitionKey:
+    """
+    Args:
+        table   => partitioned table
+        value   => value of partition column
+    Returns:
+        Key of partition of table holding rows with value, i.e. value itself for
+        tables partitioned by list, or the (naive, UTC) start of the period
+        containing value for tables partitioned by range.
+    Preconditions:
+        table is partitioned (see: partition_table)
+    """
+    interval = table.info['partition']['interval']
+    if interval is None:
+        return int(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    value = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval != 'day':
+        value = value.replace(day=1)
+    if interval == 'year':
+        value = value.replace(month=1)
+    return value
+
+def partition_name(table: Table, key: PartitionKey) -> str:
+    """
+    Args:
+        table   => partitioned table
+        key     => partition key (see: partition_key)
+    Returns:
+        Name of partition of table with key, i.e. <table>_p<ledger id> or
+        <table>_p<YYYY[MM[DD]]>.
+    Preconditions:
+        table is partitioned (see: partition_table)
+    """
+    interval = table.info['partition']['interval']
+    if interval is None:
+        return '%s_p%d'%(table.name, key)
+    return '%s_p%s'%(table.name, key.strftime(_SUFFIX_FORMATS[interval]))
+
+def _default_name(table: Table) -> str:
+    return '%s_default'%table.name
+
+def _sequence_name(table: Table) -> str:
+    return '%s_seq'%table.name
+
+def storage_table_name(dialect: Dialect, table: Table) -> str:
+    """
+    Args:
+        dialect => dialect of database table is stored in
+        table   => table to get storage table of
+    Returns:
+        Name of the table storing the indexes declared on table, which for tables
+        emulating partitioning on SQLite is the default partition (as the table
+        itself is a view), and otherwise table itself.
+    Preconditions:
+        N/A
+    """
+    if dialect.name == 'sqlite' and is_partitioned(table):
+        return _default_name(table)
+    return table.name
+
+def partition_indexes(connection: Connection, table: Table) -> List[Index]:
+    """
+    Args:
+        connection  => connection to database
+        table       => partitioned table
+    Returns:
+        Indexes declared on the partitions of table that are stored as separate
+        tables, i.e. the indexes of table (suffixed with the partition suffix) on
+        each partition emulating partitioning on SQLite.  Partitions on other
+        dialects share the indexes of table, so none are returned.
+        NOTE:
+            SQLite partitions are created with the indexes that exist on the
+            default partition, so that indexes deferred by DBManager.bootstrap
+            are deferred on partitions too (see: DBManager.build_indexes).
+    Preconditions:
+        table is partitioned (see: partition_table) and exists
+    """
+    if connection.dialect.name != 'sqlite':
+        return list()
+    return [
+        index for name in partition_names(connection, table) \
+        for index in sorted(
+            _sqlite_partition_table(table, name).indexes,
+            key=lambda index: index.name
+        )
+    ]
+
+def partition_names(connection: Connection, table: Table) -> List[str]:
+    """
+    Args:
+        connection  => connection to database
+        table       => partitioned table
+    Returns:
+        Names of the (non-default) partitions of table that exist in the database.
+    Preconditions:
+        table is partitioned (see: partition_table) and exists
+    """
+    lister = _PARTITION_LISTERS.get(connection.dialect.name)
+    if lister is None:
+        raise NotImplementedError(
+            'Partitioning is not supported for dialect %s'%connection.dialect.name
+        )
+    pattern = re.compile(r'^%s_p\d+$'%re.escape(table.name))
+    return sorted(name for name in lister(connection, table) if pattern.match(name))
+
+def create_partitions(
+    connection: Connection,
+    table: Table,
+    values: Iterable[PartitionKey]
+) -> List[str]:
+    """
+    Args:
+        connection  => connection to database
+        table       => partitioned table
+        values      => values of partition column to create partitions for
+    Returns:
+        Names of the partitions created, skipping those that already exist.
+    Preconditions:
+        table is partitioned (see: partition_table) and exists
+        On MySQL, tables partitioned by range can only have partitions added
+        after their latest one
+    """
+    creator = _PARTITION_CREATORS.get(connection.dialect.name)
+    if creator is None:
+        raise NotImplementedError(
+            'Partitioning is not supported for dialect %s'%connection.dialect.name
+        )
+    existing = set(partition_names(connection, table))
+    created = list()
+    for key in sorted(set(partition_key(table, value) for value in values)):
+        name = partition_name(table, key)
+        if name not in existing:
+            creator(connection, table, key, name)
+            existing.add(name)
+            created.append(name)
+    if created and connection.dialect.name == 'sqlite':
+        _sqlite_rebuild_view(connection, table)
+    return created
+
+def ensure_partitions(
+    connection: Connection,
+    table: Table,
+    timestamp: Optional[datetime] = None
+) -> List[str]:
+    """
+    Args:
+        connection  => connection to database
+        table       => partitioned table
+        timestamp   => time to create range partitions for (default: now)
+    Returns:
+        Names of the partitions created for table, which are:
+            1) Partitioned by ledger -> one per row of the ledger table
+            2) Partitioned by range -> one for the period containing timestamp and
+               one for the period following it
+    Preconditions:
+        table is partitioned (see: partition_table) and exists
+    """
+    partition = table.info['partition']
+    if partition['interval'] is None:
+        values = list()
+        for foreign_key in table.c[partition['column']].foreign_keys:
+            values.extend(
+                row[0] for row in connection.execute(select([foreign_key.column]))
+            )
+        return create_partitions(connection, table, values)
+    key = partition_key(table, timestamp or datetime.utcnow())
+    return create_partitions(
+        connection,
+        table,
+        (key, _period_end(key, partition['interval']))
+    )
+
+def drop_partition(connection: Connection, table: Table, value: PartitionKey) -> bool:
+    """
+    Args:
+        connection  => connection to database
+        table       => partitioned table
+        value       => value of partition column of partition to drop
+    Returns:
+        Whether the partition holding value existed (and was dropped, along with
+        all of its rows).
+    Preconditions:
+        table is partitioned (see: partition_table) and exists
+    """
+    name = partition_name(table, partition_key(table, value))
+    if name not in partition_names(connection, table):
+        return False
+    _PARTITION_DROPPERS[connection.dialect.name](connection, table, name)
+    if connection.dialect.name == 'sqlite':
+        _sqlite_rebuild_view(connection, table)
+    return True
+
+def _postgresql_partitions(connection: Connection, table: Table) -> List[str]:
+    return [
+        row[0] for row in connection.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = \'%s\'::regclass'%(
+                connection.dialect.identifier_preparer.format_table(table)
+            )
+        )
+    ]
+
+def _postgresql_create_partition(
+    connection: Connection,
+    table: Table,
+    key: PartitionKey,
+    name: str
+) -> None:
+    interval = table.info['partition']['interval']
+    if interval is None:
+        bounds = 'IN (%d)'%key
+    else:
+        bounds = 'FROM (\'%s+00\') TO (\'%s+00\')'%(
+            key.isoformat(' '),
+            _period_end(key, interval).isoformat(' ')
+        )
+    preparer = connection.dialect.identifier_preparer
+    connection.execute('CREATE TABLE IF NOT EXISTS %s PARTITION OF %s FOR VALUES %s'%(
+        preparer.quote(name),
+        preparer.format_table(table),
+        bounds
+    ))
+
+def _postgresql_drop_partition(connection: Connection, table: Table, name: str) -> None:
+    connection.execute(
+        'DROP TABLE IF EXISTS %s'%connection.dialect.identifier_preparer.quote(name)
+    )
+
+def _mysql_partitions(connection: Connection, table: Table) -> List[str]:
+    return [
+        row[0] for row in connection.execute(
+            'SELECT partition_name FROM information_schema.partitions '
+            'WHERE table_schema = DATABASE() AND table_name = \'%s\' '
+            'AND partition_name IS NOT NULL'%table.name
+        )
+    ]
+
+def _mysql_create_partition(
+    connection: Connection,
+    table: Table,
+    key: PartitionKey,
+    name: str
+) -> None:
+    interval = table.info['partition']['interval']
+    preparer = connection.dialect.identifier_preparer
+    if interval is None:
+        connection.execute('ALTER TABLE %s ADD PARTITION (PARTITION %s VALUES IN (%d))'%(
+            preparer.format_table(table),
+            preparer.quote(name),
+            key
+        ))
+        return
+    connection.execute(
+        'ALTER TABLE %s REORGANIZE PARTITION %s INTO ('
+        'PARTITION %s VALUES LESS THAN (%d), PARTITION %s VALUES LESS THAN MAXVALUE)'%(
+            preparer.format_table(table),
+            preparer.quote(_default_name(table)),
+            preparer.quote(name),
+            timegm(_period_end(key, interval).timetuple()),
+            preparer.quote(_default_name(table))
+        )
+    )
+
+def _mysql_drop_partition(connection: Connection, table: Table, name: str) -> None:
+    preparer = connection.dialect.identifier_preparer
+    connection.execute('ALTER TABLE %s DROP PARTITION %s'%(
+        preparer.format_table(table),
+        preparer.quote(name)
+    ))
+
+def _sqlite_partitions(connection: Connection, table: Table) -> List[str]:
+    return [
+        row[0] for row in connection.execute(
+            'SELECT name FROM sqlite_master '
+            'WHERE type = \'table\' AND name LIKE \'%s_p%%\''%(
+                table.name
+            )
+        )
+    ]
+
+def _sqlite_partition_table(
+    table: Table,
+    name: str,
+    indexes: Optional[Set[str]] = None
+) -> Table:
+    """
+    Args:
+        table   => partitioned table
+        name    => name of partition
+        indexes => names of the indexes of table to include (default: all)
+    Returns:
+        Table named name with the columns and indexes of table (suffixed with the
+        partition suffix of name, or unchanged for the default partition), but
+        without foreign keys.
+    Preconditions:
+        N/A
+    """
+    partition = Table(name, MetaData(), *(
+        Column(
+            column.name,
+            column.type,
+            primary_key=column.primary_key,
+            nullable=column.nullable,
+            server_default=column.server_default.arg \
+                if column.server_default is not None else None
+        ) for column in table.columns
+    ))
+    suffix = '' if name == _default_name(table) else name[len(table.name):]
+    for index in table.indexes:
+        if indexes is not None and index.name not in indexes:
+            continue
+        Index(
+            index.name + suffix,
+            *(partition.c[column.name] for column in index.columns),
+            unique=index.unique
+        )
+    return partition
+
+def _sqlite_create_partition(
+    connection: Connection,
+    table: Table,
+    key: PartitionKey,
+    name: str
+) -> None:
+    existing = set(
+        row[0] for row in connection.execute(
+            'SELECT name FROM sqlite_master '
+            'WHERE type = \'index\' AND tbl_name = \'%s\''%_default_name(table)
+        )
+    )
+    _sqlite_partition_table(table, name, existing).create(connection)
+
+def _sqlite_drop_partition(connection: Connection, table: Table, name: str) -> None:
+    connection.execute(
+        'DROP TABLE IF EXISTS %s'%connection.dialect.identifier_preparer.quote(name)
+    )
+
+def _sqlite_key_expression(table: Table, row: str) -> str:
+    """
+    Args:
+        table   => partitioned table
+        row     => trigger row reference (NEW or OLD)
+    Returns:
+        SQLite expression computing the partition name suffix of row.
+    Preconditions:
+        N/A
+    """
+    partition = table.info['partition']
+    if partition['interval'] is None:
+        return '%s.%s'%(row, partition['column'])
+    return 'strftime(\'%s\', coalesce(%s.%s, CURRENT_TIMESTAMP))'%(
+        _SUFFIX_FORMATS[partition['interval']],
+        row,
+        partition['column']
+    )
+
+def _sqlite_rebuild_view(connection: Connection, table: Table) -> None:
+    """
+    Args:
+        connection  => connection to SQLite database
+        table       => partitioned table
+    Procedure:
+        (Re)create the view named after table as the UNION ALL of the default
+        partition and every partition of table, along with INSTEAD OF triggers
+        routing inserts, updates and deletes on the view to the partition owning
+        each row.  Rows without a partition are inserted into the default partition.
+    Preconditions:
+        table is partitioned (see: partition_table)
+    """
+    quote = connection.dialect.identifier_preparer.quote
+    names = [_default_name(table)] + partition_names(connection, table)
+    primary_key = quote(list(table.primary_key.columns)[0].name)
+    columns = [quote(column.name) for column in table.columns]
+    values = list()
+    for column in table.columns:
+        if column.primary_key:
+            values.append('coalesce(NEW.%s, last_insert_rowid())'%quote(column.name))
+        elif column.server_default is not None:
+            values.append('coalesce(NEW.%s, %s)'%(
+                quote(column.name),
+                connection.dialect.ddl_compiler(connection.dialect, None) \
+                    .get_column_default_string(column)
+            ))
+        else:
+            values.append('NEW.%s'%quote(column.name))
+    connection.execute('DROP VIEW IF EXISTS %s'%quote(table.name))
+    connection.execute('CREATE VIEW %s AS %s'%(
+        quote(table.name),
+        ' UNION ALL '.join(
+            'SELECT %s FROM %s'%(', '.join(columns), quote(name)) for name in names
+        )
+    ))
+    for name in names:
+        for event, row, body in (
+            ('INSERT', 'NEW', (
+                'INSERT INTO %s (id) SELECT NULL WHERE NEW.%s IS NULL; '
+                'INSERT INTO %s (%s) VALUES (%s); '
+                'DELETE FROM %s;'
+            )%(
+                quote(_sequence_name(table)),
+                primary_key,
+                quote(name),
+                ', '.join(columns),
+                ', '.join(values),
+                quote(_sequence_name(table))
+            )),
+            ('UPDATE', 'OLD', 'UPDATE %s SET %s WHERE %s = OLD.%s;'%(
+                quote(name),
+                ', '.join('%s = NEW.%s'%(column, column) for column in columns),
+                primary_key,
+                primary_key
+            )),
+            ('DELETE', 'OLD', 'DELETE FROM %s WHERE %s = OLD.%s;'%(
+                quote(name),
+                primary_key,
+                primary_key
+            ))
+        ):
+            if name == names[0]:
+                condition = 'NOT EXISTS (SELECT 1 FROM sqlite_master ' \
+                    'WHERE type = \'table\' AND name = \'%s_p\' || %s)'%(
+                        table.name,
+                        _sqlite_key_expression(table, row)
+                    )
+            elif table.info['partition']['interval'] is None:
+                condition = '%s = %s'%(
+                    _sqlite_key_expression(table, row),
+                    name[len(table.name) + 2:]
+                )
+            else:
+                condition = '%s = \'%s\''%(
+                    _sqlite_key_expression(table, row),
+                    name[len(table.name) + 2:]
+                )
+            connection.execute(
+                'CREATE TRIGGER %s INSTEAD OF %s ON %s WHEN %s BEGIN %s END'%(
+                    quote('%s_%s'%(name, event.lower())),
+                    event,
+                    quote(table.name),
+                    condition,
+                    body
+                )
+            )
+
+def allocate_id(connection: Connection, table: Table) -> Optional[int]:
+    """
+    Args:
+        connection  => connection to database
+        table       => table to allocate primary key of
+    Returns:
+        Next primary key from the sequence of a table emulating partitioning on
+        SQLite (whose view cannot report the primary key of an inserted row),
+        or None for every other table or database.
+    Preconditions:
+        N/A
+    """
+    if connection.dialect.name != 'sqlite' or not is_partitioned(table):
+        return None
+    sequence = connection.dialect.identifier_preparer.quote(_sequence_name(table))
+    allocated = connection.execute('INSERT INTO %s DEFAULT VALUES'%sequence).lastrowid
+    connection.execute('DELETE FROM %s'%sequence)
+    return allocated
+
+def _create_partitioned_table(
+    target: Table,
+    connection: Connection,
+    **kwargs: Any
+) -> None:
+    """Create the default partition of target, along with the sequence and view
+    emulating partitioning on SQLite (see: partition_table).
+    """
+    preparer = connection.dialect.identifier_preparer
+    if connection.dialect.name == 'postgresql':
+        connection.execute('CREATE TABLE IF NOT EXISTS %s PARTITION OF %s DEFAULT'%(
+            preparer.quote(_default_name(target)),
+            preparer.format_table(target)
+        ))
+    elif connection.dialect.name == 'sqlite':
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS %s (id INTEGER PRIMARY KEY AUTOINCREMENT)'%(
+                preparer.quote(_sequence_name(target))
+            )
+        )
+        _sqlite_rebuild_view(connection, target)
+
+def _drop_partitioned_table(
+    target: Table,
+    connection: Connection,
+    **kwargs: Any
+) -> None:
+    """Drop the partitions and sequence emulating partitioning on SQLite
+    (see: partition_table), which are dropped along with target otherwise.
+    """
+    if connection.dialect.name == 'sqlite':
+        for name in partition_names(connection, target) + \
+            [_default_name(target), _sequence_name(target)]:
+            _sqlite_drop_partition(connection, target, name)
+
+def _with_partition_key(create: str, table: Table, compiler: Compiled) -> str:
+    """
+    Args:
+        create      => compiled CREATE TABLE statement of partitioned table
+        table       => partitioned table
+        compiler    => DDL compiler create was compiled with
+    Returns:
+        create with the partition column appended to the primary key.
+    Preconditions:
+        N/A
+    """
+    columns = list(table.primary_key.columns)
+    column = table.c[table.info['partition']['column']]
+    if column in columns:
+        return create
+    return create.replace(
+        compiler.process(table.primary_key),
+        'PRIMARY KEY (%s)'%', '.join(
+            compiler.preparer.quote(column.name) for column in columns + [column]
+        ),
+        1
+    )
+
+def generate_postgresql_partitioned_create_expression(
+    element: CreateTable,
+    compiler: Compiled,
+    **kwargs: Any
+) -> str:
+    if not is_partitioned(element.element):
+        return _compile_default(element, compiler, **kwargs)
+    return _with_partition_key(
+        _compile_default(element, compiler, **kwargs),
+        element.element,
+        compiler
+    )
+
+def generate_mysql_partitioned_create_expression(
+    element: CreateTable,
+    compiler: Compiled,
+    **kwargs: Any
+) -> str:
+    if not is_partitioned(element.element):
+        return _compile_default(element, compiler, **kwargs)
+    return _with_partition_key(
+        _compile_default(
+            CreateTable(element.element, include_foreign_key_constraints=[]),
+            compiler,
+            **kwargs
+        ),
+        element.element,
+        compiler
+    )
+
+def generate_sqlite_partitioned_create_expression(
+    element: CreateTable,
+    compiler: Compiled,
+    **kwargs: Any
+) -> str:
+    if not is_partitioned(element.element):
+        return _compile_default(element, compiler, **kwargs)
+    return _compile_default(
+        CreateTable(
+            _sqlite_partition_table(element.element, _default_name(element.element))
+        ),
+        compiler,
+        **kwargs
+    )
+
+def generate_sqlite_partitioned_index_expression(
+    element: CreateIndex,
+    compiler: Compiled,
+    **kwargs: Any
+) -> str:
+    if not is_partitioned(element.element.table):
+        return _compile_default(element, compiler, **kwargs)
+    partition = _sqlite_partition_table(
+        element.element.table,
+        _default_name(element.element.table)
+    )
+    index = next(
+        index for index in partition.indexes if index.name == element.element.name
+    )
+    return _compile_default(CreateIndex(index), compiler, **kwargs)
+
+def generate_sqlite_partitioned_drop_expression(
+    element: DropTable,
+    compiler: Compiled,
+    **kwargs: Any
+) -> str:
+    if not is_partitioned(element.element):
+        return _compile_default(element, compiler, **kwargs)
+    return '\nDROP VIEW %s'%compiler.preparer.format_table(element.element)
+
+_PARTITION_COMPILERS = (
+    (CreateTable, 'postgresql', generate_postgresql_partitioned_create_expression),
+    (CreateTable, 'mysql', generate_mysql_partitioned_create_expression),
+    (CreateTable, 'sqlite', generate_sqlite_partitioned_create_expression),
+    (CreateIndex, 'sqlite', generate_sqlite_partitioned_index_expression),
+    (DropTable, 'sqlite', generate_sqlite_partitioned_drop_expression)
+)
+# compilers replaced by _PARTITION_COMPILERS, by element class and dialect
+_PREVIOUS_COMPILERS = dict()    # type: Dict[Tuple[type, str], Optional[Callable]]
+
+def _register_compilers() -> None:
+    """
+    Procedure:
+        Register the DDL compilers of partitioned tables (once), remembering the
+        compilers they replace so that DDL of other tables is compiled as before
+        (see: _compile_default).  Compilers are only registered once a table is
+        partitioned, so DDL compilation is unchanged for applications that do not
+        partition tables.
+    Preconditions:
+        N/A
+    """
+    for element_class, dialect, generate in _PARTITION_COMPILERS:
+        if (element_class, dialect) in _PREVIOUS_COMPILERS:
+            continue
+        dispatcher = element_class.__dict__.get('_compiler_dispatcher')
+        _PREVIOUS_COMPILERS[(element_class, dialect)] = \
+            dispatcher.specs.get(dialect) if dispatcher is not None else None
+        compiles(element_class, dialect)(generate)
+
+def _compile_default(element: DDLElement, compiler: Compiled, **kwargs: Any) -> str:
+    """
+    Args:
+        element     => DDL element to compile
+        compiler    => DDL compiler to compile element with
+        kwargs      => keyword arguments to compiler
+    Returns:
+        element compiled with the compiler registered for its dialect before
+        _register_compilers, or with the default compiler.
+    Preconditions:
+        N/A
+    """
+    previous = _PREVIOUS_COMPILERS.get((type(element), compiler.dialect.name))
+    if previous is None:
+        previous = type(element).__dict__['_compiler_dispatcher'].specs['default']
+    return previous(element, compiler, **kwargs)
+
+def create_ledger_partitions(
+    connection: Connection,
+    ledger_table: Table,
+    ledger_id: int
+) -> List[str]:
+    """
+    Args:
+        connection      => connection to database
+        ledger_table    => file ledger table
+        ledger_id       => id of ledger row
+    Returns:
+        Names of the partitions created for a ledger row in the partitioned tables
+        linked to ledger_table, i.e. its own partition in tables partitioned by
+        ledger, and the partitions for the current (and next) period in tables
+        partitioned by range.
+    Preconditions:
+        Partitioned tables linked to ledger_table exist
+    """
+    created = list()
+    for table in ledger_table.metadata.sorted_tables:
+        if partitioned_by_ledger(table, ledger_table):
+            created.extend(create_partitions(connection, table, (ledger_id,)))
+        elif is_partitioned(table) and any(
+            foreign_key.column.table is ledger_table for foreign_key in table.foreign_keys
+        ):
+            created.extend(ensure_partitions(connection, table))
+    return created
+
+def on_ledger_insert(mapper: Mapper, connection: Connection, target: Any) -> None:
+    """ORM after_insert handler for ledger rows, creating their partitions in
+    the same transaction (see: create_ledger_partitions), or once the session
+    commits on MySQL, where DDL implicitly commits (which requires the session
+    to come from a sessionmaker passed to attach_partition_listeners).
+    """
+    if connection.dialect.name != 'mysql':
+        create_ledger_partitions(connection, mapper.local_table, target.id)
+        return
+    session = object_session(target)
+    session.info.setdefault('pending_partitions', list()).append(
+        (connection.engine, mapper.local_table, target.id)
+    )
+
+def on_partitioned_insert(mapper: Mapper, connection: Connection, target: Any) -> None:
+    """ORM before_insert handler allocating the primary key of rows of tables
+    emulating partitioning on SQLite (see: allocate_id).
+    """
+    column = list(mapper.local_table.primary_key.columns)[0]
+    key = mapper.get_property_by_column(column).key
+    if getattr(target, key) is None:
+        allocated = allocate_id(connection, mapper.local_table)
+        if allocated is not None:
+            setattr(target, key, allocated)
+
+def on_partitioned_update(mapper: Mapper, connection: Connection, target: Any) -> None:
+    """ORM before_update handler writing changed columns of rows of tables
+    emulating partitioning on SQLite through the view with a Core UPDATE, and
+    marking them as committed so the ORM emits no UPDATE of its own (SQLite does
+    not report rows changed by INSTEAD OF triggers, so the ORM would consider
+    the row stale).
+    """
+    if connection.dialect.name != 'sqlite' or not is_partitioned(mapper.local_table):
+        return
+    state = inspect(target)
+    values = dict()
+    for prop in mapper.column_attrs:
+        column = prop.columns[0]
+        if column.table is mapper.local_table and state.attrs[prop.key].history.added:
+            values[column.name] = getattr(target, prop.key)
+    if not values:
+        return
+    table = mapper.local_table
+    connection.execute(table.update().where(and_(*(
+        column == value for column, value in zip(mapper.primary_key, state.identity)
+    ))).values(values))
+    expired = list()
+    for prop in mapper.column_attrs:
+        if prop.columns[0].name in values:
+            value = getattr(target, prop.key)
+            set_committed_value(target, prop.key, value)
+            if isinstance(value, ClauseElement):
+                expired.append(prop.key)
+    if expired:
+        state.session.expire(target, expired)
+
+def attach_partition_listeners(session_factory: sessionmaker) -> sessionmaker:
+    """
+    Args:
+        session_factory => sessionmaker to attach listeners to
+    Returns:
+        session_factory, with listeners creating the partitions of ledgers inserted
+        through the ORM on MySQL once sessions commit (see: on_ledger_insert).
+    Preconditions:
+        N/A
+    """
+    listen(session_factory, 'after_commit', _create_pending_partitions)
+    listen(session_factory, 'after_rollback', _discard_pending_partitions)
+    return session_factory
+
+def _create_pending_partitions(session: Session) -> None:
+    pending = session.info.pop('pending_partitions', None)
+    for engine, ledger_table, ledger_id in pending or ():
+        with engine.connect() as connection:
+            create_ledger_partitions(connection, ledger_table, ledger_id)
+
+def _discard_pending_partitions(session: Session) -> None:
+    session.info.pop('pending_partitions', None)
+
+
+_PARTITION_LISTERS = dict(
+    postgresql=_postgresql_partitions,
+    mysql=_mysql_partitions,
+    sqlite=_sqlite_partitions
+)
+_PARTITION_CREATORS = dict(
+    postgresql=_postgresql_create_partition,
+    mysql=_mysql_create_partition,
+    sqlite=_sqlite_create_partition
+)
+_PARTITION_DROPPERS = dict(
+    postgresql=_postgresql_drop_partition,
+    mysql=_mysql_drop_partition,
+    sqlite=_sqlite_drop_partition
+)
@@ -0,0 +1,438 @@
+## -*- coding: UTF8 -*-
+## pipeline.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Optional, Any, Callable, Iterable, Iterator, Dict, List, Tuple, \
+    NamedTuple
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.context import BaseContext
+from time import perf_counter
+
+from sqlalchemy.engine.url import make_url
+
+from .manager import DBManager
+from .engines import EngineConfig
+
+ParseFunction = Callable[[Any], Iterable[Tuple[Any, Dict[str, Any]]]]
+
+_WORKER_MANAGER = None  # type: Optional[DBManager]
+
+
+class IngestionResult(NamedTuple):
+    """Summary of a run of IngestionPipeline."""
+    items: int
+    rows: int
+    failures: List[Tuple[Any, str]]
+    elapsed: float
+
+    @property
+    def rows_per_second(self) -> float:
+        """Ingestion throughput in rows per second."""
+        if self.elapsed <= 0:
+            return float(self.rows)
+        return self.rows / self.elapsed
+
+
+def _group_records(
+    records: Iterable[Tuple[Any, Dict[str, Any]]]
+) -> Dict[Any, List[Dict[str, Any]]]:
+    """
+    Args:
+        records => iterable of (model, mapping) pairs
+    Returns:
+        Dict mapping each model to list of its mappings, in the order the
+        models were first encountered (so parent tables are written first).
+    Preconditions:
+        N/A
+    """
+    groups = dict()
+    for model, mapping in records:
+        groups.setdefault(model, list()).append(mapping)
+    return groups
+
+def _write_groups(
+    manager: DBManager,
+    groups: Dict[Any, List[Dict[str, Any]]],
+    batch_size: int
+) -> int:
+    """
+    Args:
+        manager     => initialized database manager to write with
+        groups      => dict mapping models to lists of mappings to insert
+        batch_size  => number of mappings to insert per statement execution
+    Returns:
+        Number of rows written.
+    Procedure:
+        Insert all mappings in groups in a single transaction, rolling it back
+        if any insert fails.
+    Preconditions:
+        N/A
+    """
+    session = manager.create_session(persist=False)
+    try:
+        rows = 0
+        for model, mappings in groups.items():
+            rows += manager.add_many(model, mappings, batch_size, session=session).rows
+        manager.commit(session)
+        return rows
+    except BaseException:
+        manager.rollback(session)
+        raise
+    finally:
+        manager.close_session(session)
+
+def _init_worker(
+    conn_string: str,
+    engine_options: Dict[str, Any],
+    profile: Optional[str]
+) -> None:
+    """
+    Args:
+        conn_string     => database connection string
+        engine_options  => connection pool and other engine options
+        profile         => SQLite performance profile
+    Procedure:
+        Create this worker process's database manager (and thus its engine
+        and connection pool) after the worker has been started.
+    Preconditions:
+        N/A
+    """
+    global _WORKER_MANAGER  #pylint: disable=W0603
+    _WORKER_MANAGER = DBManager(
+        conn_string,
+        config=EngineConfig(engine_options=engine_options, profile=profile)
+    ).initialize()
+
+def _parse_item(parse: ParseFunction, item: Any) -> Dict[Any, List[Dict[str, Any]]]:
+    """
+    Args:
+        parse   => function parsing item into (model, mapping) pairs
+        item    => item to parse
+    Returns:
+        Parsed records grouped by model (see: _group_records).
+    Preconditions:
+        N/A
+    """
+    return _group_records(parse(item))
+
+def _ingest_item(parse: ParseFunction, item: Any, batch_size: int) -> int:
+    """
+    Args:
+        parse       => function parsing item into (model, mapping) pairs
+        item        => item to parse
+        batch_size  => number of mappings to insert per statement execution
+    Returns:
+        Number of rows written for item, in a single transaction using this
+        worker's database manager.
+    Preconditions:
+        _init_worker has been called in this process
+    """
+    return _write_groups(_WORKER_MANAGER, _parse_item(parse, item), batch_size)
+
+
+class IngestionPipeline: #pylint: disable=R0902
+    """Multi-process ingestion pipeline.  Parsing of items (i.e. evidence
+    files) is fanned out to a process pool, where each worker creates its
+    own DBManager (and engine) after it starts.  Each item's records are
+    written in a single transaction, so a failure while parsing or writing
+    one item only rolls back that item's records.  For SQLite, which only
+    supports a single writer, workers only parse and the parent process
+    serializes all writes; for other backends, workers write in parallel.
+    """
+
+    def __init__(self,
+        conn_string: str,
+        processes: Optional[int] = None,
+        batch_size: int = 1000,
+        engine_options: Optional[Dict[str, Any]] = None,
+        profile: Optional[str] = None,
+        serialize_writes: Optional[bool] = None,
+        mp_context: Optional[BaseContext] = None
+    ) -> None:
+        self.conn_string = conn_string
+        self.processes = processes
+        self.batch_size = batch_size
+        self.engine_options = engine_options
+        self.profile = profile
+        self.serialize_writes = serialize_writes \
+            if serialize_writes is not None \
+            else make_url(conn_string).get_backend_name() == 'sqlite'
+        self.mp_context = mp_context
+
+    @property
+    def conn_string(self) -> str:
+        """Getter for conn_string."""
+        return self.__conn_string
+
+    @conn_string.setter
+    def conn_string(self, value: str) -> None:
+        """Setter for conn_string."""
+        self.__conn_string = value
+
+    @property
+    def processes(self) -> Optional[int]:
+        """Getter for processes."""
+        return self.__processes
+
+    @processes.setter
+    def processes(self, value: Optional[int]) -> None:
+        """Setter for processes."""
+        self.__processes = value
+
+    @property
+    def batch_size(self) -> int:
+        """Getter for batch_size."""
+        return self.__batch_size
+
+    @batch_size.setter
+    def batch_size(self, value: int) -> None:
+        """Setter for batch_size."""
+        self.__batch_size = value
+
+    @property
+    def engine_options(self) -> Dict[str, Any]:
+        """Getter for engine_options."""
+        return self.__engine_options
+
+    @engine_options.setter
+    def engine_options(self, value: Optional[Dict[str, Any]]) -> None:
+        """Setter for engine_options."""
+        self.__engine_options = dict(value) if value is not None else dict()
+
+    @property
+    def profile(self) -> Optional[str]:
+        """Getter for profile."""
+        return self.__profile
+
+    @profile.setter
+    def profile(self, value: Optional[str]) -> None:
+        """Setter for profile."""
+        self.__profile = value
+
+    @property
+    def serialize_writes(self) -> bool:
+        """Getter for serialize_writes."""
+        return self.__serialize_writes
+
+    @serialize_writes.setter
+    def serialize_writes(self, value: bool) -> None:
+        """Setter for serialize_writes."""
+        self.__serialize_writes = value
+
+    @property
+    def mp_context(self) -> Optional[BaseContext]:
+        """Getter for mp_context."""
+        return self.__mp_context
+
+    @mp_context.setter
+    def mp_context(self, value: Optional[BaseContext]) -> None:
+        """Setter for mp_context."""
+        self.__mp_context = value
+
+    def __create_writer(self) -> Optional[DBManager]:
+        """
+        Args:
+            N/A
+        Returns:
+            Initialized database manager the parent process writes with if
+            self.serialize_writes is True, otherwise None.
+        Preconditions:
+            N/A
+        """
+        if not self.serialize_writes:
+            return None
+        return DBManager(
+            self.conn_string,
+            config=EngineConfig(engine_options=self.engine_options, profile=self.profile)
+        ).initialize()
+
+    def __submit(self,
+        executor: ProcessPoolExecutor,
+        parse: ParseFunction,
+        item: Any
+    ) -> Future:
+        """
+        Args:
+            executor    => process pool to submit item to
+            parse       => function parsing item into (model, mapping) pairs
+            item        => item to parse (and, unless self.serialize_writes, write)
+        Returns:
+            Future resolving to the records parsed from item if
+            self.serialize_writes is True, otherwise to the number of rows
+            written for item.
+        Preconditions:
+            N/A
+        """
+        if self.serialize_writes:
+            return executor.submit(_parse_item, parse, item)
+        return executor.submit(_ingest_item, parse, item, self.batch_size)
+
+    def __fill(self, #pylint: disable=R0913
+        executor: ProcessPoolExecutor,
+        parse: ParseFunction,
+        items: Iterator[Any],
+        pending: Dict[Future, Any],
+        max_pending: int,
+        failures: List[Tuple[Any, str]]
+    ) -> bool:
+        """
+        Args:
+            executor    => process pool to submit items to
+            parse       => function parsing items into (model, mapping) pairs
+            items       => iterator of items left to submit
+            pending     => dict mapping submitted futures to their items
+            max_pending => maximum number of items in pending
+            failures    => list of failed items (and their errors)
+        Returns:
+            Whether no items are left to submit.
+        Procedure:
+            Submit items to executor until max_pending items are pending.  If
+            the process pool is broken, no further items can be submitted, so
+            the item being submitted and all remaining items are failed.
+        Preconditions:
+            N/A
+        """
+        while len(pending) < max_pending:
+            try:
+                item = next(items)
+            except StopIteration:
+                return True
+            try:
+                pending[self.__submit(executor, parse, item)] = item
+            except BrokenProcessPool as exc:
+                failures.append((item, repr(exc)))
+                failures.extend((remaining, repr(exc)) for remaining in items)
+                return True
+        return False
+
+    def __result(self, future: Future, writer: Optional[DBManager]) -> int:
+        """
+        Args:
+            future  => completed future returned by __submit
+            writer  => database manager the parent process writes with, or None
+        Returns:
+            Number of rows written for the future's item, writing its parsed
+            records with writer if self.serialize_writes is True.
+        Preconditions:
+            future is done
+        """
+        if self.serialize_writes:
+            return _write_groups(writer, future.result(), self.batch_size)
+        return future.result()
+
+    def __process(self, #pylint: disable=R0913
+        executor: ProcessPoolExecutor,
+        writer: Optional[DBManager],
+        parse: ParseFunction,
+        items: Iterator[Any],
+        max_pending: int
+    ) -> Tuple[int, int, List[Tuple[Any, str]]]:
+        """
+        Args:
+            executor    => process pool to submit items to
+            writer      => database manager the parent process writes with, or None
+            parse       => function parsing items into (model, mapping) pairs
+            items       => iterator of items to parse and ingest
+            max_pending => maximum number of items submitted at any time
+        Returns:
+            Number of items processed, rows written, and failed items (and their
+            errors).
+        Preconditions:
+            N/A
+        """
+        count = rows = 0
+        failures = list()
+        pending = dict()
+        exhausted = False
+        while pending or not exhausted:
+            if not exhausted:
+                failed = len(failures)
+                exhausted = self.__fill(
+                    executor,
+                    parse,
+                    items,
+                    pending,
+                    max_pending,
+                    failures
+                )
+                count += len(failures) - failed
+            if not pending:
+                break
+            for future in wait(pending, return_when=FIRST_COMPLETED).done:
+                item = pending.pop(future)
+                count += 1
+                try:
+                    rows += self.__result(future, writer)
+                except Exception as exc: #pylint: disable=W0703
+                    failures.append((item, repr(exc)))
+        return count, rows, failures
+
+    def run(self,
+        parse: ParseFunction,
+        items: Iterable[Any],
+        max_pending: Optional[int] = None
+    ) -> IngestionResult:
+        """
+        Args:
+            parse       => function parsing an item into an iterable of
+                           (model, mapping) pairs, where mapping maps column
+                           keys of model to values (see: BaseTable.to_mappings)
+            items       => items to parse and ingest
+            max_pending => maximum number of items submitted to the process pool
+                           at any time (defaults to twice the number of processes)
+        Returns:
+            IngestionResult containing the number of items processed, rows written,
+            failed items (and their errors) and elapsed time.
+        Procedure:
+            Parse and write each item in items using the process pool, writing each
+            item's records in their own transaction (see: IngestionPipeline).
+            NOTE:
+                parse, items and models must be picklable, i.e. parse must be
+                defined at module level.
+        Preconditions:
+            N/A
+        """
+        if max_pending is None:
+            max_pending = 2 * (self.processes or os.cpu_count() or 1)
+        start = perf_counter()
+        writer = self.__create_writer()
+        try:
+            with ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=self.mp_context,
+                initializer=None if self.serialize_writes else _init_worker,
+                initargs=() if self.serialize_writes else \
+                    (self.conn_string, self.engine_options, self.profile)
+            ) as executor:
+                count, rows, failures = self.__process(
+                    executor,
+                    writer,
+                    parse,
+                    iter(items),
+                    max_pending
+                )
+        finally:
+            if writer is not None and writer.engine is not None:
+                writer.engine.dispose()
+        return IngestionResult(count, rows, failures, perf_counter() - start)
@@ -0,0 +1,353 @@
+## -*- coding: UTF8 -*-
+## queries.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Optional, Any, Union, Iterable, Iterator, Dict, List, FrozenSet, \
+    Sequence, Set, Tuple
+
+from sqlalchemy import inspect, bindparam
+from sqlalchemy.ext import baked
+from sqlalchemy.orm import scoped_session, Session
+
+from .utils import chunked
+from .export import export_csv, export_parquet
+from .records import record_class, record_fields
+
+_BAKERY = baked.bakery(size=1000)
+BakedQueryKey = Tuple[Any, FrozenSet[str], FrozenSet[str]]
+
+_BAKED_QUERIES = dict()     # type: Dict[BakedQueryKey, baked.BakedQuery]
+
+def _baked_query(
+    model: Any,
+    keys: FrozenSet[str],
+    null_keys: FrozenSet[str]
+) -> baked.BakedQuery:
+    """
+    Args:
+        model       => model of table to query
+        keys        => fields to filter on by (bound) value
+        null_keys   => fields to filter on being NULL
+    Returns:
+        BakedQuery selecting model filtered on keys and null_keys, with one bound
+        parameter (named after the field) per key.  Baked queries are created once
+        per model and set of filter keys, and the bakery caches their compiled
+        SQL, so repeated lookups only bind new parameter values.
+    Preconditions:
+        model is a mapped class
+    """
+    cache_key = (model, keys, null_keys)
+    baked_query = _BAKED_QUERIES.get(cache_key)
+    if baked_query is None:
+        baked_query = _BAKERY(lambda session: session.query(model), model)
+        for key in sorted(keys):
+            baked_query.add_criteria(
+                lambda query, key=key: query.filter(
+                    getattr(model, key) == bindparam(key)
+                ),
+                model,
+                key
+            )
+        for key in sorted(null_keys):
+            baked_query.add_criteria(
+                lambda query, key=key: query.filter(getattr(model, key).is_(None)),
+                model,
+                key
+            )
+        baked_query = _BAKED_QUERIES.setdefault(cache_key, baked_query)
+    return baked_query
+
+def _structure_types(rows: Sequence[Any]) -> Dict[str, Any]:
+    """
+    Args:
+        rows    => rows (ORM instances or records) of tables storing shared
+                   structure data
+    Returns:
+        Dict mapping the table and class names of the models declared with the
+        same declarative base as rows to those models.
+    Preconditions:
+        N/A
+    """
+    structure_types = dict()
+    for row in rows[:1]:
+        model = getattr(row, '_model', type(row))
+        for cls in getattr(model, '_decl_class_registry', dict()).values():
+            if isinstance(cls, type) and hasattr(cls, '__tablename__'):
+                structure_types[cls.__name__] = cls
+                structure_types[cls.__tablename__] = cls
+    return structure_types
+
+def _load_structures(
+    session: Union[Session, scoped_session],
+    model: Any,
+    structure_ids: Iterable[int],
+    chunk_size: int
+) -> Dict[int, Any]:
+    """
+    Args:
+        session         => session to query with
+        model           => model of structures to load
+        structure_ids   => primary keys of structures to load
+        chunk_size      => maximum number of structure ids per IN query
+    Returns:
+        Dict mapping the primary key of each structure found to the structure.
+    Preconditions:
+        model has a single-column primary key
+    """
+    primary_key = inspect(model).primary_key[0]
+    key = inspect(model).get_property_by_column(primary_key).key
+    structures = dict()
+    for chunk in chunked(sorted(structure_ids), chunk_size):
+        for structure in session.query(model).filter(primary_key.in_(chunk)):
+            structures[getattr(structure, key)] = structure
+    return structures
+
+
+class QueryMixin:
+    """Mixin for DBManager reading rows as baked queries, read-only records
+    (see: records.record_class), streams, or exported files."""
+
+    def lookup(self,
+        model: Any,
+        session: Optional[Union[Session, scoped_session]] = None,
+        primary: bool = False,
+        **kwargs: Any
+    ) -> baked.Result:
+        """
+        Args:
+            model   => model of table to query
+            session => session to query with
+            primary => whether to read from the primary database (for
+                       read-your-writes) rather than a read replica
+            kwargs  => fields to filter on
+        Returns:
+            Baked query Result (supporting all, first, one, one_or_none, count and
+            iteration) with field filters from kwargs applied.  Unlike
+            DBManager.query, the statement for each model and set of filter fields
+            is constructed and compiled once and cached, so hot lookups only bind
+            new parameters.
+        Preconditions:
+            N/A
+        """
+        if session is None:
+            session = self.session if primary else self.create_read_session()
+        null_keys = frozenset(key for key, value in kwargs.items() if value is None)
+        keys = frozenset(kwargs).difference(null_keys)
+        return _baked_query(model, keys, null_keys)(session)\
+            .params(**{key: kwargs[key] for key in keys})
+
+    def records(self,
+        model: Any,
+        session: Optional[Union[Session, scoped_session]] = None,
+        primary: bool = False,
+        **kwargs: Any
+    ) -> List[Tuple[Any, ...]]:
+        """
+        Args:
+            model   => model of table to query
+            session => session to query with
+            primary => whether to read from the primary database (for
+                       read-your-writes) rather than a read replica
+            kwargs  => fields to filter on
+        Returns:
+            List of read-only records of model (see: records.record_class) with
+            field filters from kwargs applied.
+            NOTE:
+                Rows are fetched with a Core select on the session's connection and
+                wrapped in compact named tuples, skipping ORM hydration, the
+                identity map and instance state entirely.  Use query for rows to be
+                modified.
+        Preconditions:
+            N/A
+        """
+        if session is None:
+            session = self.session if primary else self.create_read_session()
+        statement = self.__records_statement(model, session, **kwargs)
+        make = record_class(model)._make
+        return [
+            make(row) for row in session.connection(clause=statement).execute(statement)
+        ]
+
+    def __records_statement(self,
+        model: Any,
+        session: Union[Session, scoped_session],
+        **kwargs: Any
+    ) -> Any:
+        """
+        Args:
+            model   => model of table to query
+            session => session to query with
+            kwargs  => fields to filter on
+        Returns:
+            Select of the column attributes of model, in the order of the fields of
+            its record class (see: records.record_fields), with field filters from
+            kwargs applied.
+        Preconditions:
+            N/A
+        """
+        return self.query(model, session=session, **kwargs)\
+            .with_entities(*(getattr(model, field) for field in record_fields(model)))\
+            .statement
+
+    def resolve_structures(self,
+        rows: Iterable[Any],
+        structure_types: Optional[Dict[str, Any]] = None,
+        chunk_size: int = 500,
+        session: Optional[Union[Session, scoped_session]] = None,
+        primary: bool = False
+    ) -> List[Optional[Any]]:
+        """
+        Args:
+            rows            => rows (ORM instances or records) of tables storing
+                               shared structure data (see:
+                               models.SharedStructureTableMixin)
+            structure_types => dict mapping structure_type values to models (if
+                               None, the table and class names of the models
+                               declared with the same declarative base as the rows)
+            chunk_size      => maximum number of structure ids per IN query
+            session         => session to query with
+            primary         => whether to read from the primary database (for
+                               read-your-writes) rather than a read replica
+        Returns:
+            List of the owning structure of each row (or None if it does not exist),
+            in the order of rows.
+        Procedure:
+            Group rows by structure_type and load the structures of each type with
+            a single IN query on their primary key (per chunk_size ids), instead of
+            one query per row.
+        Preconditions:
+            Every structure_type of rows maps to a model with a single-column
+            primary key
+        """
+        rows = list(rows)
+        if session is None:
+            session = self.session if primary else self.create_read_session()
+        if structure_types is None:
+            structure_types = _structure_types(rows)
+        groups = dict()     # type: Dict[str, Set[int]]
+        for row in rows:
+            groups.setdefault(row.structure_type, set()).add(row.structure_id)
+        structures = dict() # type: Dict[str, Dict[int, Any]]
+        for structure_type, structure_ids in groups.items():
+            if structure_type not in structure_types:
+                raise ValueError('Unknown structure type %s'%structure_type)
+            structures[structure_type] = _load_structures(
+                session,
+                structure_types[structure_type],
+                structure_ids,
+                chunk_size
+            )
+        return [structures[row.structure_type].get(row.structure_id) for row in rows]
+
+    def stream(self,
+        model: Any,
+        chunk_size: int = 1000,
+        as_rows: bool = False,
+        as_records: bool = False,
+        session: Optional[Union[Session, scoped_session]] = None,
+        primary: bool = False,
+        **kwargs: Any
+    ) -> Iterator[List[Any]]:
+        """
+        Args:
+            model       => model of table to query
+            chunk_size  => number of rows to fetch from the cursor at a time
+            as_rows     => whether to yield raw result rows instead of ORM instances
+            as_records  => whether to yield read-only records (see: records) instead
+                           of ORM instances
+            session     => session to query with
+            primary     => whether to read from the primary database (for
+                           read-your-writes) rather than a read replica
+            kwargs      => fields to filter on
+        Returns:
+            Iterator of lists of at most chunk_size ORM instances of model (or
+            result rows if as_rows is True, or records if as_records is True) with
+            field filters from kwargs applied.
+            NOTE:
+                Results are fetched with a server-side cursor (stream_results) on
+                dialects that support it, and the cursor is closed as soon as the
+                iterator is exhausted, closed, or garbage collected, so consumers
+                may stop early without leaking the connection.
+        Preconditions:
+            chunk_size is greater than 0
+        """
+        if session is None:
+            session = self.session if primary else self.create_read_session()
+        query = self.query(model, session=session, **kwargs).yield_per(chunk_size)
+        statement = self.__records_statement(model, session, **kwargs) \
+            if as_records else query.statement
+        result = session\
+            .connection(clause=statement)\
+            .execution_options(stream_results=True)\
+            .execute(statement)
+        try:
+            if as_records:
+                make = record_class(model)._make
+                chunk = result.fetchmany(chunk_size)
+                while chunk:
+                    yield [make(row) for row in chunk]
+                    chunk = result.fetchmany(chunk_size)
+            elif as_rows:
+                chunk = result.fetchmany(chunk_size)
+                while chunk:
+                    yield chunk
+                    chunk = result.fetchmany(chunk_size)
+            else:
+                yield from chunked(query.instances(result), chunk_size)
+        finally:
+            result.close()
+
+    def export(self,
+        source: Any,
+        destination: Any,
+        format: str = 'csv', #pylint: disable=W0622
+        chunk_size: int = 10000,
+        columns: Optional[Sequence[str]] = None,
+        primary: bool = False
+    ) -> int:
+        """
+        Args:
+            source      => model, table or selectable to export
+            destination => path of file or file object to write to
+            format      => format to export to (csv or parquet)
+            chunk_size  => maximum number of rows to hold in memory at a time
+                           (and, for Parquet, rows per row group)
+            columns     => names of columns of source to project (if None, all
+                           columns)
+            primary     => whether to export from the primary database rather
+                           than a read replica
+        Returns:
+            Number of rows exported from Core result rows using self.engine (or
+            a read replica), without creating ORM instances (see:
+            export.export_csv and export.export_parquet).
+        Preconditions:
+            self.engine is not None
+            format is parquet => pyarrow is installed
+        """
+        engine = self.engine
+        if self.replica_router is not None and not primary:
+            engine = self.replica_router.choose()
+        if format == 'csv':
+            return export_csv(engine, source, destination, chunk_size, columns)
+        if format == 'parquet':
+            return export_parquet(engine, source, destination, chunk_size, columns)
+        raise ValueError('Unsupported export format %s (expected csv or parquet)'%format)
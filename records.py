@@ -0,0 +1,67 @@
+## -*- coding: UTF8 -*-
+## records.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Any, Dict, Tuple, Type
+from collections import namedtuple
+
+from sqlalchemy import inspect
+
+_RECORD_CLASSES = dict()    # type: Dict[Any, Type[Tuple[Any, ...]]]
+
+def record_fields(model: Any) -> Tuple[str, ...]:
+    """
+    Args:
+        model   => model of table
+    Returns:
+        Names of the column attributes of model, in mapper order, which are the
+        fields of its record class (see: record_class).
+    Preconditions:
+        model is a mapped class
+    """
+    return tuple(attr.key for attr in inspect(model).column_attrs)
+
+def record_class(model: Any) -> Type[Tuple[Any, ...]]:
+    """
+    Args:
+        model   => model of table
+    Returns:
+        Read-only record class for rows of model, generated once per model: a
+        named tuple (with empty __slots__, so no per-instance __dict__) with one
+        field per column attribute of model (see: record_fields), and model as its
+        _model attribute.  Records are plain tuples, so they are not tracked by
+        any session, have no instance state or attribute instrumentation, and
+        cannot be modified or lazy-load relationships.
+    Preconditions:
+        model is a mapped class
+        Column attribute names of model do not start with an underscore
+    """
+    cls = _RECORD_CLASSES.get(model)
+    if cls is None:
+        name = '%sRecord'%model.__name__
+        cls = type(name, (namedtuple(name, record_fields(model)),), dict(
+            __slots__=(),
+            __doc__='Read-only record of %s (see: records.record_class).'%model.__name__,
+            _model=model
+        ))
+        cls = _RECORD_CLASSES.setdefault(model, cls)
+    return cls
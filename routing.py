@@ -0,0 +1,187 @@
+## -*- coding: UTF8 -*-
+## routing.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Optional, Any, Callable, Sequence, Dict, Union
+from itertools import cycle
+from threading import Lock
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, Query, scoped_session
+
+STRATEGIES = ('round_robin', 'least_busy')
+
+
+class ReplicaRouter:
+    """Balances reads across read replica engines, either in turn
+    (round_robin) or by choosing the replica with the fewest connections
+    currently checked out of its pool (least_busy)."""
+
+    def __init__(self, engines: Sequence[Engine], strategy: str = 'round_robin') -> None:
+        if strategy not in STRATEGIES:
+            raise ValueError(
+                'Unknown replica balancing strategy %s (expected one of %s)'%(
+                    strategy,
+                    ', '.join(STRATEGIES)
+                )
+            )
+        if not engines:
+            raise ValueError('ReplicaRouter requires at least one replica engine')
+        self.engines = list(engines)
+        self.strategy = strategy
+        self.__cycle = cycle(self.engines)
+        self.__lock = Lock()
+        self.__busy = {engine: 0 for engine in self.engines}    # type: Dict[Engine, int]
+        for engine in self.engines:
+            self.__track(engine)
+
+    def __track(self, engine: Engine) -> None:
+        """
+        Args:
+            engine  => replica engine to track connections of
+        Procedure:
+            Count connections checked out of engine's pool using pool events.
+        Preconditions:
+            N/A
+        """
+        def checkout(*_args: Any) -> None:
+            with self.__lock:
+                self.__busy[engine] += 1
+        def checkin(*_args: Any) -> None:
+            with self.__lock:
+                self.__busy[engine] = max(0, self.__busy[engine] - 1)
+        event.listen(engine, 'checkout', checkout)
+        event.listen(engine, 'checkin', checkin)
+
+    def busy(self, engine: Engine) -> int:
+        """
+        Args:
+            engine  => replica engine
+        Returns:
+            Number of connections currently checked out of engine's pool.
+        Preconditions:
+            engine is one of self.engines
+        """
+        return self.__busy[engine]
+
+    def choose(self) -> Engine:
+        """
+        Args:
+            N/A
+        Returns:
+            Replica engine to execute the next read with.
+        Preconditions:
+            N/A
+        """
+        with self.__lock:
+            if self.strategy == 'least_busy':
+                return min(self.engines, key=self.__busy.__getitem__)
+            return next(self.__cycle)
+
+    def dispose(self) -> None:
+        """Dispose of the connection pools of all replica engines."""
+        for engine in self.engines:
+            engine.dispose()
+
+
+class ReplicaSession(Session):
+    """Read-only session that executes every statement on a read replica
+    chosen by a ReplicaRouter.  Queries refresh objects already in the session
+    (see: Query.populate_existing), so that long-lived sessions do not return
+    stale objects, and sessions should autocommit (see: DBManager.initialize),
+    so that connections are returned to the replica's pool after each read
+    rather than held until the session closes."""
+
+    def __init__(self, router: Optional[ReplicaRouter] = None, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.router = router
+
+    def get_bind(self, mapper: Any = None, clause: Any = None, **kwargs: Any) -> Engine: #pylint: disable=W0221
+        if self.router is None:
+            return super().get_bind(mapper, clause, **kwargs)
+        return self.router.choose()
+
+    def query(self, *entities: Any, **kwargs: Any) -> Query:
+        return super().query(*entities, **kwargs).populate_existing()
+
+    def flush(self, objects: Any = None) -> None:
+        if self.new or self.dirty or self.deleted:
+            raise RuntimeError('Cannot write using a read replica session')
+        super().flush(objects)
+
+
+class ReplicaMixin:
+    """Mixin for DBManager reading from read replicas (see: ReplicaRouter)."""
+
+    @property
+    def replica_router(self) -> Optional[ReplicaRouter]:
+        """Getter for replica_router."""
+        return self.__replica_router
+
+    @replica_router.setter
+    def replica_router(self, value: Optional[ReplicaRouter]) -> None:
+        """Setter for replica_router."""
+        self.__replica_router = value
+
+    @property
+    def replica_session_factory(self) -> Optional[Callable[..., ReplicaSession]]:
+        """Getter for replica_session_factory."""
+        return self.__replica_session_factory
+
+    @replica_session_factory.setter
+    def replica_session_factory(self,
+        value: Optional[Callable[..., ReplicaSession]]
+    ) -> None:
+        """Setter for replica_session_factory."""
+        self.__replica_session_factory = value
+
+    @property
+    def read_session(self) -> Optional[ReplicaSession]:
+        """Getter for read_session."""
+        return self.__read_session
+
+    @read_session.setter
+    def read_session(self, value: Optional[ReplicaSession]) -> None:
+        """Setter for read_session."""
+        self.__read_session = value
+
+    def create_read_session(self,
+        persist: bool = True
+    ) -> Union[Session, scoped_session]:
+        """
+        Args:
+            persist => whether to persist the read session
+        Returns:
+            Session executing reads on the read replicas (see: ReplicaSession),
+            or, if there are no replicas, the session returned by create_session.
+        Preconditions:
+            N/A
+        """
+        if self.replica_session_factory is None:
+            return self.session if persist and self.session is not None \
+                else self.create_session(persist)
+        if persist:
+            if self.read_session is None:
+                self.read_session = (self.replica_session_factory)()
+            return self.read_session
+        return (self.replica_session_factory)()
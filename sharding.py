@@ -0,0 +1,421 @@
+## -*- coding: UTF8 -*-
+## sharding.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Optional, Any, Callable, Iterable, Dict, List, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from heapq import merge
+from itertools import count
+from operator import attrgetter
+from threading import Lock
+from zlib import crc32
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import MetaData
+from sqlalchemy.orm import Query
+
+from .manager import DBManager
+from .models import FileLedgerMixin
+from .utils import BulkInsertResult
+
+ShardFunction = Callable[[int, int], int]
+
+
+def modulo_shard(ledger_id: int, shards: int) -> int:
+    """
+    Args:
+        ledger_id   => ledger id to map to a shard
+        shards      => number of shards
+    Returns:
+        Index of shard owning ledger_id (ledger_id modulo shards).
+    Preconditions:
+        N/A
+    """
+    return ledger_id % shards
+
+def hash_shard(ledger_id: int, shards: int) -> int:
+    """
+    Args:
+        ledger_id   => ledger id to map to a shard
+        shards      => number of shards
+    Returns:
+        Index of shard owning ledger_id, based on a (stable) CRC32 hash of
+        ledger_id, which spreads sequential ids less predictably than modulo_shard.
+    Preconditions:
+        N/A
+    """
+    return crc32(str(ledger_id).encode('ascii')) % shards
+
+
+class ShardedDBManager:
+    """Database manager for case data horizontally sharded across several
+    databases by ledger id (see: FileLedgerLinkedMixin).  Each shard is a
+    DBManager; the shard function maps a ledger id to the index of the shard
+    owning the ledger row and all rows linked to it.  Writes and single-ledger
+    queries go to the owning shard, while cross-ledger queries fan out to all
+    shards in parallel and merge their results.  Ledger ids are allocated per
+    shard (see: ShardedDBManager.add_ledger) so that they are globally unique
+    and always map back to the shard they were allocated on.
+    Args:
+        shards          => connection strings of shards, in shard index order
+        metadata        => database metadata object
+        ledger          => model of file ledger table
+        shard_function  => function mapping (ledger id, number of shards) to
+                           a shard index (see: modulo_shard, hash_shard)
+        max_workers     => maximum number of threads used to fan out queries
+        kwargs          => additional keyword arguments to DBManager for
+                           each shard (i.e. config)
+    """
+
+    def __init__(self,
+        shards: Sequence[str],
+        metadata: MetaData,
+        ledger: Any,
+        shard_function: ShardFunction = modulo_shard,
+        max_workers: Optional[int] = None,
+        **kwargs: Any
+    ) -> None:
+        if not shards:
+            raise ValueError('ShardedDBManager requires at least one shard')
+        self.managers = [DBManager(shard, metadata, **kwargs) for shard in shards]
+        self.metadata = metadata
+        self.ledger = ledger
+        self.shard_function = shard_function
+        self.__executor = ThreadPoolExecutor(
+            max_workers=max_workers or len(self.managers),
+            thread_name_prefix='ShardedDBManager'
+        )
+        self.__next_shard = count()
+        self.__lock = Lock()
+
+    def initialize(self,
+        bootstrap: bool = False,
+        create_session: bool = True,
+        **kwargs: Any
+    ) -> 'ShardedDBManager':
+        """
+        Args:
+            bootstrap       => whether to bootstrap every shard with tables, indexes,
+                               and views
+            create_session  => whether to create a persisted session on every shard
+            kwargs          => additional keyword arguments to DBManager.initialize
+        Procedure:
+            Initialize (and optionally bootstrap) every shard.
+        Preconditions:
+            N/A
+        """
+        for manager in self.managers:
+            manager.initialize(
+                bootstrap=bootstrap,
+                create_session=create_session,
+                **kwargs
+            )
+        return self
+
+    def bootstrap(self, **kwargs: Any) -> 'ShardedDBManager':
+        """
+        Args:
+            kwargs  => keyword arguments to DBManager.bootstrap
+        Procedure:
+            Bootstrap every shard with the necessary tables, indexes and views.
+        Preconditions:
+            Shards have been initialized
+        """
+        for manager in self.managers:
+            manager.bootstrap(**kwargs)
+        return self
+
+    def shard_index(self, ledger_id: int) -> int:
+        """
+        Args:
+            ledger_id   => ledger id
+        Returns:
+            Index of the shard owning ledger_id.
+        Preconditions:
+            N/A
+        """
+        return self.shard_function(ledger_id, len(self.managers))
+
+    def manager_for(self, ledger_id: int) -> DBManager:
+        """
+        Args:
+            ledger_id   => ledger id
+        Returns:
+            DBManager of the shard owning ledger_id.
+        Preconditions:
+            N/A
+        """
+        return self.managers[self.shard_index(ledger_id)]
+
+    def __ledger_id(self, model: Any, record: Any) -> int:
+        """
+        Args:
+            model   => model of record
+            record  => ledger or linked ORM instance, or mapping
+        Returns:
+            Id of the ledger record belongs to (or is).
+        Preconditions:
+            record has a ledger_id, or is a ledger row with an id
+        """
+        key = 'id' if self.__is_ledger(model) else 'ledger_id'
+        value = record.get(key) if isinstance(record, dict) else getattr(record, key)
+        if value is None:
+            raise ValueError('Cannot route record without a %s to a shard'%key)
+        return value
+
+    @staticmethod
+    def __is_ledger(model: Any) -> bool:
+        """
+        Args:
+            model   => model of table
+        Returns:
+            Whether model is a ledger model (see: models.FileLedgerMixin), whose
+            rows are routed by id rather than ledger_id.
+        Preconditions:
+            N/A
+        """
+        return isinstance(model, type) and issubclass(model, FileLedgerMixin)
+
+    def add_ledger(self,
+        ledger: Any,
+        shard: Optional[int] = None,
+        max_attempts: int = 10
+    ) -> Any:
+        """
+        Args:
+            ledger          => ledger ORM instance to add
+            shard           => index of shard to add ledger to (if None, shards are
+                               used in turn)
+            max_attempts    => number of times to retry allocating an id if another
+                               writer allocated the same id concurrently
+        Returns:
+            ledger, after it has been committed on its shard.
+        Procedure:
+            If ledger has no id, allocate the smallest id greater than every ledger
+            id on the shard that the shard function maps back to the shard, then
+            insert and commit ledger on that shard.
+        Preconditions:
+            N/A
+        """
+        if ledger.id is not None:
+            self.manager_for(ledger.id).add(ledger, commit=True)
+            return ledger
+        if shard is None:
+            with self.__lock:
+                shard = next(self.__next_shard) % len(self.managers)
+        manager = self.managers[shard]
+        for attempt in range(max_attempts):
+            candidate = manager.session.query(func.max(self.ledger.id)).scalar()
+            candidate = (candidate or 0) + 1
+            while self.shard_index(candidate) != shard:
+                candidate += 1
+            ledger.id = candidate
+            try:
+                manager.add(ledger, commit=True)
+                return ledger
+            except IntegrityError:
+                manager.rollback()
+                ledger.id = None
+                if attempt + 1 == max_attempts:
+                    raise
+        return ledger
+
+    def add(self, record: Any, commit: bool = False) -> 'ShardedDBManager':
+        """
+        Args:
+            record  => ledger or linked ORM instance to add
+            commit  => whether to commit the owning shard's session
+        Procedure:
+            Add record to the session of the shard owning its ledger.
+        Preconditions:
+            record has a ledger_id, or is a ledger row with an id
+        """
+        ledger_id = self.__ledger_id(type(record), record)
+        self.manager_for(ledger_id).add(record, commit=commit)
+        return self
+
+    def add_many(self,
+        model: Any,
+        records: Iterable[Any],
+        batch_size: int = 1000,
+        commit: bool = False
+    ) -> BulkInsertResult:
+        """
+        Args:
+            model       => model of table to insert records into
+            records     => iterable of ORM instances of model and/or mappings
+            batch_size  => number of records to insert per statement execution
+            commit      => whether to commit each shard written to
+        Returns:
+            Combined BulkInsertResult of inserting records into their owning shards
+            (see: DBManager.add_many).  If commit is True, shards are written (and
+            committed) in parallel, each in its own session.  Otherwise records are
+            written to the persisted session of each shard in turn, and committed
+            with the rest of its pending changes (see: commit).
+        Preconditions:
+            Every record has a ledger_id (or, for the ledger model, an id)
+        """
+        groups = dict() # type: Dict[int, List[Any]]
+        for record in records:
+            shard = self.shard_index(self.__ledger_id(model, record))
+            groups.setdefault(shard, list()).append(record)
+        def shard_add_many(shard: int) -> BulkInsertResult:
+            manager = self.managers[shard]
+            if not commit:
+                return manager.add_many(model, groups[shard], batch_size)
+            session = manager.create_session(persist=False)
+            try:
+                return manager.add_many(
+                    model,
+                    groups[shard],
+                    batch_size,
+                    session=session,
+                    commit=True
+                )
+            finally:
+                manager.close_session(session)
+        if commit:
+            results = list(self.__executor.map(shard_add_many, groups))
+        else:
+            results = [shard_add_many(shard) for shard in groups]
+        return BulkInsertResult(
+            sum(result.rows for result in results),
+            sum(result.batches for result in results),
+            sum(result.commits for result in results),
+            max((result.elapsed for result in results), default=0.0)
+        )
+
+    def query(self, model: Any, ledger_id: int, **kwargs: Any) -> Query:
+        """
+        Args:
+            model       => model of table to query
+            ledger_id   => id of ledger to query rows of
+            kwargs      => additional fields to filter on
+        Returns:
+            Query of the shard owning ledger_id (see: DBManager.query) filtered on
+            ledger_id (or, for the ledger model, id).
+        Preconditions:
+            N/A
+        """
+        key = 'id' if self.__is_ledger(model) else 'ledger_id'
+        kwargs[key] = ledger_id
+        return self.manager_for(ledger_id).query(model, **kwargs)
+
+    def __fan_out(self, call: Callable[[DBManager], Any]) -> List[Any]:
+        """
+        Args:
+            call    => function to call with each shard's DBManager
+        Returns:
+            Results of calling call on every shard in parallel, in shard order.
+        Preconditions:
+            N/A
+        """
+        return list(self.__executor.map(call, self.managers))
+
+    def fetch(self,
+        model: Any,
+        order_by: Optional[str] = None,
+        **kwargs: Any
+    ) -> List[Any]:
+        """
+        Args:
+            model       => model of table to query
+            order_by    => name of attribute to order merged results by
+            kwargs      => fields to filter on
+        Returns:
+            List of (detached) instances of model with field filters from kwargs
+            applied, from the owning shard if kwargs filters on ledger_id, otherwise
+            from every shard in parallel.  If order_by is provided, each shard
+            orders its results and they are merged in order.
+        Preconditions:
+            N/A
+        """
+        def shard_fetch(manager: DBManager) -> List[Any]:
+            session = manager.create_session(persist=False)
+            try:
+                query = manager.query(model, session=session, **kwargs)
+                if order_by is not None:
+                    query = query.order_by(getattr(model, order_by))
+                return query.all()
+            finally:
+                manager.close_session(session)
+        if kwargs.get('ledger_id') is not None:
+            return shard_fetch(self.manager_for(kwargs['ledger_id']))
+        results = self.__fan_out(shard_fetch)
+        if order_by is not None:
+            return list(merge(*results, key=attrgetter(order_by)))
+        return [record for result in results for record in result]
+
+    def count(self, model: Any, **kwargs: Any) -> int:
+        """
+        Args:
+            model   => model of table to count rows of
+            kwargs  => fields to filter on
+        Returns:
+            Number of rows of model with field filters from kwargs applied, summed
+            over every shard (counted in parallel).
+        Preconditions:
+            N/A
+        """
+        def shard_count(manager: DBManager) -> int:
+            session = manager.create_session(persist=False)
+            try:
+                return manager.query(model, session=session, **kwargs).count()
+            finally:
+                manager.close_session(session)
+        if kwargs.get('ledger_id') is not None:
+            return shard_count(self.manager_for(kwargs['ledger_id']))
+        return sum(self.__fan_out(shard_count))
+
+    def purge_ledger(self, ledger_id: int, **kwargs: Any) -> Dict[str, int]:
+        """
+        Args:
+            ledger_id   => id of ledger row to purge
+            kwargs      => additional keyword arguments to DBManager.purge_ledger
+        Returns:
+            Rows deleted per table from the shard owning ledger_id
+            (see: DBManager.purge_ledger).
+        Preconditions:
+            N/A
+        """
+        return self.manager_for(ledger_id).purge_ledger(self.ledger, ledger_id, **kwargs)
+
+    def commit(self) -> 'ShardedDBManager':
+        """Commit the persisted session of every shard."""
+        for manager in self.managers:
+            if manager.session is not None:
+                manager.commit()
+        return self
+
+    def rollback(self) -> 'ShardedDBManager':
+        """Rollback the persisted session of every shard."""
+        for manager in self.managers:
+            if manager.session is not None:
+                manager.rollback()
+        return self
+
+    def close(self) -> None:
+        """Close every shard's sessions and shut down the fan-out thread pool."""
+        for manager in self.managers:
+            manager.close_session()
+        self.__executor.shutdown()
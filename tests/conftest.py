@@ -0,0 +1,63 @@
+## -*- coding: UTF8 -*-
+## conftest.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+#pylint: disable=W0621
+from typing import Iterator
+
+from sqlalchemy.schema import MetaData
+
+import pytest
+
+from ..manager import DBManager
+from .models import ModelTable, FileLedger, new_ledger
+
+
+@pytest.fixture
+def conn_string(tmp_path) -> str:
+    """Connection string of an empty SQLite database file."""
+    return 'sqlite:///%s'%(tmp_path / 'test.db')
+
+@pytest.fixture
+def metadata() -> MetaData:
+    """Metadata of the tables to bootstrap (overridden by test modules)."""
+    return ModelTable.metadata
+
+@pytest.fixture
+def manager(conn_string: str, metadata: MetaData) -> Iterator[DBManager]:
+    """Bootstrapped DBManager with a persisted session."""
+    manager = DBManager().initialize(
+        conn_string,
+        metadata,
+        bootstrap=True,
+        create_session=True
+    )
+    yield manager
+    manager.close_session()
+    manager.engine.dispose()
+
+@pytest.fixture
+def ledger(manager: DBManager) -> FileLedger:
+    """Committed file ledger row."""
+    ledger = new_ledger()
+    manager.add(ledger, commit=True)
+    return ledger
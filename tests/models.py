@@ -0,0 +1,93 @@
+## -*- coding: UTF8 -*-
+## models.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Any
+from datetime import datetime
+
+from sqlalchemy.types import Integer
+from sqlalchemy.schema import Column
+from sqlalchemy.ext.declarative import declarative_base
+
+from ..models import BaseTableTemplate, TableMixin, FileLedgerMixin, \
+    FileLedgerLinkedMixin, SharedStructureTableMixin
+from ..utils import DialectSpecificText
+
+ModelTable = declarative_base(cls=BaseTableTemplate) #pylint: disable=C0103
+PartitionedTable = declarative_base(cls=BaseTableTemplate) #pylint: disable=C0103
+
+
+class FileLedger(ModelTable, FileLedgerMixin):
+    """File ledger table."""
+
+
+class Entry(ModelTable, TableMixin, FileLedgerLinkedMixin):
+    """Table of parsed entries linked to the file ledger table."""
+    record_number = Column(Integer)
+    name = Column(DialectSpecificText())
+
+
+class Attribute(ModelTable, TableMixin, SharedStructureTableMixin):
+    """Table of attributes shared by file ledger rows and entries."""
+    name = Column(DialectSpecificText())
+
+
+class PartitionedFileLedger(PartitionedTable, FileLedgerMixin):
+    """File ledger table of the partitioned tables."""
+    __tablename__ = 'fileledger'
+
+
+class Artifact(PartitionedTable, TableMixin, FileLedgerLinkedMixin):
+    """Table partitioned by ledger."""
+    __partition_by__ = 'ledger_id'
+    record_number = Column(Integer)
+    name = Column(DialectSpecificText())
+
+
+class Event(PartitionedTable, TableMixin, FileLedgerLinkedMixin):
+    """Table partitioned by month of creation."""
+    __partition_by__ = ('created_at', 'month')
+    value = Column(Integer)
+
+
+def new_ledger(model: Any = FileLedger, name: str = 'ledger', **kwargs: Any) -> Any:
+    """
+    Args:
+        model   => model of file ledger table
+        name    => file name of ledger
+        kwargs  => additional fields of ledger
+    Returns:
+        New (transient) ledger row of model with its required fields populated.
+    Preconditions:
+        N/A
+    """
+    now = datetime.utcnow()
+    fields = dict(
+        file_name=name,
+        file_path='/evidence/%s'%name,
+        file_size=0,
+        modify_time=now,
+        access_time=now,
+        create_time=now
+    )
+    fields.update(kwargs)
+    return model(**fields)
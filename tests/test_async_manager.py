@@ -0,0 +1,83 @@
+## -*- coding: UTF8 -*-
+## test_async_manager.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import asyncio
+
+import pytest
+
+from ..async_manager import AsyncDBManager
+from .models import Entry
+
+
+def test_add_commits_in_its_own_session(manager, ledger):
+    async def add():
+        async with AsyncDBManager(manager) as async_manager:
+            return await async_manager.add(Entry(ledger_id=ledger.id, record_number=1))
+    entry = asyncio.run(add())
+    assert entry.id is not None and entry.record_number == 1
+    assert manager.query(Entry).count() == 1
+
+def test_concurrent_add_many_and_fetch(manager, ledger):
+    async def ingest():
+        async with AsyncDBManager(manager, max_workers=2) as async_manager:
+            results = await asyncio.gather(*(
+                async_manager.add_many(
+                    Entry,
+                    [dict(ledger_id=ledger.id, record_number=part)] * 5
+                ) for part in range(4)
+            ))
+            return results, await async_manager.fetch(Entry, record_number=2)
+    results, fetched = asyncio.run(ingest())
+    assert sum(result.rows for result in results) == 20
+    assert len(fetched) == 5
+
+def test_failed_operation_is_rolled_back(manager, ledger):
+    ledger_id = ledger.id
+    def fail(session):
+        manager.add(Entry(ledger_id=ledger_id, record_number=1), session=session)
+        session.flush()
+        raise RuntimeError('failed')
+    async def run():
+        async with AsyncDBManager(manager) as async_manager:
+            await async_manager.run(fail)
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+    assert manager.query(Entry).count() == 0
+
+def test_stream_stops_early_without_leaking_the_producer(manager, ledger):
+    manager.add_many(
+        Entry,
+        [dict(ledger_id=ledger.id, record_number=number) for number in range(20)],
+        commit=True
+    )
+    async def consume():
+        async with AsyncDBManager(manager, stream_buffer=1) as async_manager:
+            chunks = async_manager.stream(Entry, chunk_size=2)
+            first = None
+            async for first in chunks:
+                break
+            await chunks.aclose()
+            return first, [chunk async for chunk in async_manager.stream(Entry)]
+    first, chunks = asyncio.run(asyncio.wait_for(consume(), timeout=10))
+    assert len(first) == 2
+    assert [len(chunk) for chunk in chunks] == [20]
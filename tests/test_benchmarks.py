@@ -0,0 +1,46 @@
+## -*- coding: UTF8 -*-
+## test_benchmarks.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import json
+
+from ..benchmarks import suite
+
+
+def test_suite_reports_every_benchmark(tmp_path):
+    output = tmp_path / 'results.json'
+    suite.main([
+        '--records', '50',
+        '--batch-size', '10',
+        '--calls', '5',
+        '--tables', '2',
+        '--directory', str(tmp_path),
+        '--output', str(output)
+    ])
+    results = json.loads(output.read_text())
+    assert results['parameters'] == dict(records=50, batch_size=10, calls=5, tables=2)
+    assert set(results['databases']) == {'memory', 'file'}
+    for database in results['databases'].values():
+        assert set(database) == {
+            'inserts', 'query', 'fetch', 'cascade_delete', 'bootstrap'
+        }
+    assert (results['lookup']['calls'], results['lookup']['rows']) == (5, 50)
@@ -0,0 +1,81 @@
+## -*- coding: UTF8 -*-
+## test_bounded.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import pytest
+
+from ..bounded import SessionBounds
+from .models import Entry
+
+
+def _entries(ledger_id, count):
+    return [Entry(ledger_id=ledger_id, record_number=number) for number in range(count)]
+
+def test_session_bounds_rejects_invalid_limits():
+    with pytest.raises(ValueError):
+        SessionBounds(max_objects=0)
+    with pytest.raises(ValueError):
+        SessionBounds(memory_interval=0)
+
+def test_session_stats_is_none_unless_enabled(manager):
+    assert manager.session_stats() is None
+    assert manager.enable_bounded_session().session_stats()['added'] == 0
+    assert manager.disable_bounded_session().session_stats() is None
+
+def test_bounded_session_flushes_and_expunges_every_max_objects(manager, ledger):
+    ledger_id = ledger.id
+    manager.enable_bounded_session(max_objects=4)
+    for entry in _entries(ledger_id, 10):
+        manager.add(entry)
+    stats = manager.session_stats()
+    assert stats['added'] == 10
+    assert stats['flushes'] == 2
+    assert stats['peak_tracked'] == 5  # ledger and first 4 entries
+    assert stats['tracked'] == stats['pending'] == 2
+    assert manager.query(Entry).count() == 8
+    manager.commit()
+    stats = manager.session_stats()
+    assert stats['tracked'] == 0
+    assert stats['expunged'] >= 10
+    assert manager.query(Entry, ledger_id=ledger_id).count() == 10
+
+def test_bounded_session_without_expunge_keeps_instances(manager, ledger):
+    entries = _entries(ledger.id, 3)
+    manager.enable_bounded_session(max_objects=2, expunge=False)
+    for entry in entries:
+        manager.add(entry)
+    stats = manager.session_stats()
+    assert stats['flushes'] == 1
+    assert stats['expunged'] == 0
+    assert all(entry in manager.session for entry in entries)
+    manager.commit()
+    assert manager.query(Entry).count() == 3
+
+def test_bounded_session_flushes_above_max_memory(manager, ledger):
+    ledger_id = ledger.id
+    manager.enable_bounded_session(max_objects=None, max_memory=1)
+    manager.session_bounds.memory_interval = 2
+    for entry in _entries(ledger_id, 5):
+        manager.add(entry)
+    if manager.session_stats()['memory'] is None:
+        pytest.skip('resident memory is not available')
+    assert manager.session_stats()['flushes'] == 2
@@ -0,0 +1,64 @@
+## -*- coding: UTF8 -*-
+## test_bulk.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from ..manager import DBManager
+from ..engines import EngineConfig
+from .models import Entry
+
+
+def test_add_many_counts_rows_batches_and_commits(manager, ledger):
+    records = [
+        dict(ledger_id=ledger.id, record_number=number, name='entry%d'%number)
+        for number in range(25)
+    ]
+    result = manager.add_many(Entry, records, batch_size=10, commit_every=2)
+    assert (result.rows, result.batches, result.commits) == (25, 3, 2)
+    assert manager.query(Entry).count() == 25
+
+def test_add_many_commits_once_when_requested(manager, ledger):
+    records = [dict(ledger_id=ledger.id, record_number=number) for number in range(5)]
+    result = manager.add_many(Entry, records, batch_size=2, commit=True)
+    assert (result.rows, result.batches, result.commits) == (5, 3, 1)
+
+def test_add_many_without_commit_leaves_transaction_open(manager, ledger):
+    manager.add_many(Entry, [dict(ledger_id=ledger.id, record_number=1)])
+    manager.rollback()
+    assert manager.query(Entry).count() == 0
+
+def test_add_many_mixes_instances_and_dicts_with_different_keys(manager, ledger):
+    records = [
+        Entry(ledger_id=ledger.id, record_number=1, name='instance'),
+        dict(ledger_id=ledger.id, record_number=2),
+        dict(ledger_id=ledger.id, record_number=3, name='dict')
+    ]
+    result = manager.add_many(Entry, records, commit=True)
+    assert result.batches == 1
+    assert sorted(
+        (entry.record_number, entry.name) for entry in manager.query(Entry)
+    ) == [(1, 'instance'), (2, None), (3, 'dict')]
+
+def test_engine_options_are_merged_into_config(conn_string):
+    manager = DBManager(conn_string, config=EngineConfig(engine_options=dict(echo=False)))
+    engine = manager.create_engine(pool_pre_ping=True)
+    assert manager.config.engine_options == dict(echo=False, pool_pre_ping=True)
+    engine.dispose()
@@ -0,0 +1,81 @@
+## -*- coding: UTF8 -*-
+## test_cache.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from .. import cache
+from ..cache import LRUCache
+from ..manager import DBManager
+from .models import ModelTable, Entry
+
+
+def test_lru_cache_evicts_least_recently_used_and_expired_entries(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(cache, 'monotonic', lambda: now[0])
+    lru = LRUCache(maxsize=2, ttl=10)
+    lru.put('a', 1)
+    lru.put('b', 2)
+    assert lru.get('a') == 1
+    lru.put('c', 3)
+    assert (lru.get('a'), lru.get('b'), lru.get('c')) == (1, None, 3)
+    now[0] = 11.0
+    assert lru.get('a') is None
+
+def test_fetch_is_served_from_cache(manager, ledger):
+    manager.add(Entry(ledger_id=ledger.id, record_number=1), commit=True)
+    manager.enable_query_cache()
+    first = manager.fetch(Entry, record_number=1)
+    second = manager.fetch(Entry, record_number=1)
+    assert [entry.record_number for entry in first + second] == [1, 1]
+    stats = manager.cache_stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+def test_writes_invalidate_once_their_transaction_commits(manager, ledger):
+    manager.enable_query_cache()
+    ledger_id = ledger.id
+    assert manager.fetch(Entry) == []
+    session = manager.create_session(persist=False)
+    manager.add(Entry(ledger_id=ledger_id, record_number=1), session=session)
+    session.flush()
+    assert manager.fetch(Entry) == []
+    manager.commit(session)
+    manager.close_session(session)
+    manager.add_many(Entry, [dict(ledger_id=ledger_id, record_number=2)], commit=True)
+    assert sorted(entry.record_number for entry in manager.fetch(Entry)) == [1, 2]
+
+def test_rollback_invalidates_results_read_during_transaction(manager, ledger):
+    manager.enable_query_cache()
+    manager.add(Entry(ledger_id=ledger.id, record_number=1))
+    manager.session.flush()
+    assert len(manager.fetch(Entry)) == 1
+    manager.rollback()
+    assert manager.fetch(Entry) == []
+
+def test_cache_enabled_before_initialize_is_attached(conn_string):
+    manager = DBManager().enable_query_cache()
+    manager.initialize(conn_string, ModelTable.metadata, bootstrap=True)
+    session = manager.create_session()
+    assert manager.fetch(Entry, session=session) == []
+    manager.add_many(Entry, [dict(ledger_id=1, record_number=1)], session=session)
+    manager.commit(session)
+    assert len(manager.fetch(Entry, session=session)) == 1
+    manager.close_session()
+    manager.engine.dispose()
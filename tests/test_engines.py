@@ -0,0 +1,99 @@
+## -*- coding: UTF8 -*-
+## test_engines.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+#pylint: disable=W0621
+import os
+
+import pytest
+from sqlalchemy.pool import QueuePool
+
+from ..manager import DBManager
+from ..engines import ENGINE_REGISTRY, EngineConfig, get_sqlite_profile
+
+
+@pytest.fixture
+def registry(conn_string):
+    yield ENGINE_REGISTRY
+    ENGINE_REGISTRY.dispose(conn_string, poolclass=QueuePool)
+    ENGINE_REGISTRY.dispose(conn_string, poolclass=QueuePool, pool_size=2)
+
+@pytest.mark.usefixtures('registry')
+def test_shared_engine_is_shared_by_connection_string_and_options(conn_string):
+    config = EngineConfig(engine_options=dict(poolclass=QueuePool), shared_engine=True)
+    first = DBManager(conn_string, config=config).create_engine()
+    second = DBManager(conn_string, config=config).create_engine()
+    other = DBManager(conn_string, config=config._replace(
+        engine_options=dict(poolclass=QueuePool, pool_size=2)
+    )).create_engine()
+    assert first is second
+    assert other is not first
+    assert other.pool.size() == 2
+
+def test_unshared_engines_are_not_registered(conn_string, registry):
+    count = len(registry)
+    first = DBManager(conn_string).create_engine()
+    second = DBManager(conn_string).create_engine()
+    assert first is not second
+    assert len(registry) == count
+
+def test_registered_engine_replaces_connections_from_another_process(
+    conn_string,
+    registry,
+    monkeypatch
+):
+    engine = registry.get(conn_string, poolclass=QueuePool)
+    with engine.connect() as connection:
+        inherited = connection.connection.connection
+    pid = os.getpid()
+    monkeypatch.setattr(os, 'getpid', lambda: pid + 1)
+    with engine.connect() as connection:
+        assert connection.connection.connection is not inherited
+
+def _pragma(engine, pragma):
+    with engine.connect() as connection:
+        return connection.execute('PRAGMA %s'%pragma).scalar()
+
+def test_profile_is_applied_to_connections(conn_string):
+    manager = DBManager(conn_string, config=EngineConfig(profile='bulk_ingest'))
+    engine = manager.create_engine()
+    assert get_sqlite_profile(engine) == 'bulk_ingest'
+    assert _pragma(engine, 'journal_mode') == 'wal'
+    assert _pragma(engine, 'synchronous') == 0
+    engine.dispose()
+
+def test_set_profile_reconfigures_pooled_connections(conn_string):
+    manager = DBManager(conn_string, config=EngineConfig(
+        engine_options=dict(poolclass=QueuePool),
+        profile='bulk_ingest'
+    ))
+    engine = manager.create_engine()
+    assert _pragma(engine, 'synchronous') == 0
+    manager.set_profile('safe')
+    assert manager.config.profile == 'safe'
+    assert _pragma(engine, 'synchronous') == 2
+    engine.dispose()
+
+def test_unknown_profile_is_rejected(conn_string):
+    manager = DBManager(conn_string, config=EngineConfig(profile='fastest'))
+    with pytest.raises(ValueError):
+        manager.create_engine()
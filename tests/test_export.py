@@ -0,0 +1,76 @@
+## -*- coding: UTF8 -*-
+## test_export.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+#pylint: disable=W0621
+import csv
+from io import StringIO
+
+import pytest
+
+from ..export import export_arrow
+from .models import Entry
+
+
+@pytest.fixture
+def entries(manager, ledger):
+    manager.add_many(Entry, [
+        dict(ledger_id=ledger.id, record_number=number, name='entry,%d'%number)
+        for number in range(5)
+    ], commit=True)
+
+@pytest.mark.usefixtures('entries')
+def test_export_csv_writes_header_and_rows(manager, tmp_path):
+    path = str(tmp_path / 'entries.csv')
+    rows = manager.export(Entry, path, chunk_size=2, columns=('record_number', 'name'))
+    with open(path, newline='') as stream:
+        assert list(csv.reader(stream)) == [['record_number', 'name']] + [
+            [str(number), 'entry,%d'%number] for number in range(5)
+        ]
+    assert rows == 5
+
+def test_export_csv_of_empty_source_writes_header(manager):
+    output = StringIO()
+    assert manager.export(Entry, output, columns=('id', 'name')) == 0
+    assert output.getvalue().splitlines() == ['id,name']
+
+def test_export_rejects_unknown_formats(manager, tmp_path):
+    with pytest.raises(ValueError):
+        manager.export(Entry, str(tmp_path / 'entries.xml'), format='xml')
+
+@pytest.mark.usefixtures('entries')
+def test_export_parquet_writes_row_groups_of_chunk_size(manager, tmp_path):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    path = str(tmp_path / 'entries.parquet')
+    assert manager.export(Entry, path, format='parquet', chunk_size=2) == 5
+    data = parquet.ParquetFile(path)
+    assert data.metadata.num_row_groups == 3
+    table = data.read()
+    assert table.column('record_number').to_pylist() == list(range(5))
+    assert str(table.schema.field('created_at').type).startswith('timestamp')
+
+@pytest.mark.usefixtures('entries')
+def test_export_arrow_batches_share_one_schema(manager):
+    pytest.importorskip('pyarrow')
+    batches = list(export_arrow(manager.engine, Entry, chunk_size=2))
+    assert [batch.num_rows for batch in batches] == [2, 2, 1]
+    assert len(set(batch.schema for batch in batches)) == 1
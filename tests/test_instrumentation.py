@@ -0,0 +1,78 @@
+## -*- coding: UTF8 -*-
+## test_instrumentation.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import logging
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from ..manager import DBManager
+from .models import ModelTable, Entry
+
+
+def test_statements_flushes_and_commits_are_recorded(manager, ledger):
+    operations = list()
+    manager.enable_instrumentation(
+        callback=lambda operation, *_args: operations.append(operation)
+    )
+    manager.add(Entry(ledger_id=ledger.id, record_number=1), commit=True)
+    stats = manager.stats()
+    inserts = [
+        snapshot for statement, snapshot in stats['statements'].items()
+        if statement.startswith('INSERT INTO entry')
+    ]
+    assert [(snapshot['count'], snapshot['rows']) for snapshot in inserts] == [(1, 1)]
+    assert stats['flushes']['count'] >= 1 and stats['commits']['count'] == 1
+    assert {'execute', 'flush', 'commit'} <= set(operations)
+
+def test_slow_queries_are_logged(manager, caplog):
+    manager.enable_instrumentation(slow_query_threshold=0.0)
+    with caplog.at_level(logging.WARNING):
+        with manager.engine.connect() as connection:
+            connection.execute('SELECT 1')
+    assert manager.stats()['slow_queries'] == 1
+    assert 'Slow query' in caplog.text and 'SELECT 1' in caplog.text
+
+def test_failed_statements_do_not_leak_start_times(manager):
+    manager.enable_instrumentation()
+    with manager.engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute('SELECT * FROM missing')
+        connection.execute('SELECT 2')
+        assert connection.connection.info['instrumentation_start'] == []
+
+def test_disabled_instrumentation_collects_nothing(manager):
+    manager.enable_instrumentation().disable_instrumentation()
+    manager.query(Entry).all()
+    assert manager.stats() is None
+
+def test_instrumentation_enabled_before_initialize_is_attached(conn_string):
+    manager = DBManager().enable_instrumentation()
+    manager.initialize(conn_string, ModelTable.metadata, bootstrap=True)
+    session = manager.create_session()
+    manager.query(Entry, session=session).all()
+    manager.commit(session)
+    stats = manager.stats()
+    assert stats['statements'] and stats['commits']['count'] == 1
+    manager.close_session()
+    manager.engine.dispose()
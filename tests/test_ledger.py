@@ -0,0 +1,84 @@
+## -*- coding: UTF8 -*-
+## test_ledger.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+#pylint: disable=W0621
+import pytest
+from sqlalchemy import event
+
+from ..ledger import LedgerDeduplicator
+from .models import FileLedger, new_ledger
+
+
+@pytest.fixture
+def ledgers(manager):
+    for number in range(5):
+        manager.add(new_ledger(
+            name='file%d'%number,
+            sha2hash='hash%d'%number,
+            completed=number != 4
+        ))
+    manager.commit()
+
+@pytest.fixture
+def statements(manager):
+    statements = list()
+    def capture(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+    event.listen(manager.engine, 'before_cursor_execute', capture)
+    yield statements
+    event.remove(manager.engine, 'before_cursor_execute', capture)
+
+@pytest.mark.usefixtures('ledgers')
+def test_ingested_only_includes_completed_ledgers(manager):
+    deduplicator = LedgerDeduplicator(manager, FileLedger, chunk_size=2)
+    assert deduplicator.ingested(['hash%d'%number for number in range(6)]) == {
+        'hash0', 'hash1', 'hash2', 'hash3'
+    }
+    assert not deduplicator.is_ingested('hash4')
+
+@pytest.mark.usefixtures('ledgers')
+def test_cached_lookups_skip_the_database(manager, statements):
+    deduplicator = LedgerDeduplicator(manager, FileLedger)
+    assert deduplicator.is_ingested('hash0')
+    queries = len(statements)
+    assert deduplicator.is_ingested('hash0')
+    assert not deduplicator.is_ingested('hash4') and not deduplicator.is_ingested('hash4')
+    assert len(statements) == queries + 1
+
+@pytest.mark.usefixtures('ledgers')
+def test_warm_bloom_filter_answers_misses_without_querying(manager, statements):
+    deduplicator = LedgerDeduplicator(
+        manager,
+        FileLedger,
+        cache_size=None,
+        bloom_capacity=1000
+    ).warm()
+    queries = len(statements)
+    assert deduplicator.ingested(['missing%d'%number for number in range(50)]) == set()
+    assert len(statements) == queries
+    deduplicator.mark_ingested(['new'])
+    assert 'new' in deduplicator.bloom
+
+def test_unsupported_field_is_rejected(manager):
+    with pytest.raises(ValueError):
+        LedgerDeduplicator(manager, FileLedger, field='file_name')
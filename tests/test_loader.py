@@ -0,0 +1,77 @@
+## -*- coding: UTF8 -*-
+## test_loader.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from ..loader import load, _copy_value
+from .models import FileLedger, Entry, new_ledger
+
+
+def test_load_normalizes_aware_datetimes_to_utc(manager):
+    eastern = timezone(timedelta(hours=-5))
+    mappings = FileLedger.to_mappings([ #pylint: disable=E1101
+        dict(
+            fileName='aware',
+            filePath='/aware',
+            fileSize=1,
+            modifyTime=datetime(2020, 1, 1, 7, 0, tzinfo=eastern),
+            accessTime=datetime(2020, 1, 1, 12, 0),
+            createTime=datetime(2020, 1, 1, 12, 0, tzinfo=timezone.utc)
+        )
+    ])
+    result = manager.load(FileLedger, mappings)
+    ledger = manager.query(FileLedger).one()
+    assert (result.rows, result.batches, result.commits) == (1, 1, 1)
+    assert ledger.modify_time.replace(tzinfo=None) == datetime(2020, 1, 1, 12, 0)
+    assert ledger.access_time.replace(tzinfo=None) == datetime(2020, 1, 1, 12, 0)
+    assert ledger.create_time.replace(tzinfo=None) == datetime(2020, 1, 1, 12, 0)
+    assert ledger.created_at is not None
+
+def test_load_batches_mappings_with_different_keys(manager, ledger):
+    mappings = [
+        dict(ledger_id=ledger.id, record_number=number, name='entry%d'%number)
+        if number % 2 else dict(ledger_id=ledger.id, record_number=number)
+        for number in range(25)
+    ]
+    result = load(manager.engine, Entry, mappings, batch_size=10)
+    assert (result.rows, result.batches) == (25, 3)
+    assert manager.query(Entry).count() == 25
+    assert manager.query(Entry, name=None).count() == 13
+
+def test_load_is_all_or_nothing(manager):
+    manager.add(new_ledger(), commit=True)
+    mappings = [dict(id=2, file_name='a', file_path='/a', file_size=0)] * 2
+    with pytest.raises(IntegrityError):
+        manager.load(FileLedger, mappings, batch_size=1)
+    assert manager.query(FileLedger).count() == 1
+
+def test_copy_values_are_quoted_and_converted_to_utc():
+    eastern = timezone(timedelta(hours=-5))
+    assert _copy_value(None) == '\\N'
+    assert _copy_value(True) == '"t"'
+    assert _copy_value('say "hi"') == '"say ""hi"""'
+    assert _copy_value(datetime(2020, 1, 1, 7, 0, tzinfo=eastern)) == \
+        '"2020-01-01T12:00:00+00:00"'
@@ -0,0 +1,94 @@
+## -*- coding: UTF8 -*-
+## test_maintenance.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from sqlalchemy import inspect
+
+from ..manager import DBManager
+from .models import ModelTable, FileLedger, Entry, new_ledger
+
+
+def _index_names(engine, table):
+    return set(index['name'] for index in inspect(engine).get_indexes(table))
+
+def test_deferred_indexes_are_built_in_one_pass(conn_string):
+    manager = DBManager().initialize(
+        conn_string,
+        ModelTable.metadata,
+        bootstrap=True,
+        defer_indexes=True
+    )
+    declared = set(
+        index.name for table in ModelTable.metadata.sorted_tables
+        for index in table.indexes if not index.unique
+    )
+    assert set(index.name for index in manager.missing_indexes()) == declared
+    assert not _index_names(manager.engine, 'entry') & declared
+    progress = list()
+    built = manager.build_indexes(
+        callback=lambda index, count, total: progress.append((count, total))
+    )
+    assert set(built) == declared
+    assert progress[-1] == (len(declared), len(declared))
+    assert not manager.missing_indexes()
+    assert not manager.build_indexes()
+    manager.engine.dispose()
+
+def test_bootstrap_restores_declared_indexes(conn_string):
+    declared = {
+        table: set(table.indexes) for table in ModelTable.metadata.sorted_tables
+    }
+    manager = DBManager().initialize(conn_string, ModelTable.metadata)
+    manager.bootstrap(defer_indexes=True)
+    assert {
+        table: set(table.indexes) for table in ModelTable.metadata.sorted_tables
+    } == declared
+    manager.engine.dispose()
+
+def test_purge_ledger_deletes_linked_rows_in_chunks(manager):
+    kept, purged = new_ledger(name='kept'), new_ledger(name='purged')
+    manager.add(kept).add(purged).commit()
+    kept_id, purged_id = kept.id, purged.id
+    manager.add_many(Entry, [
+        dict(ledger_id=ledger_id, record_number=number)
+        for ledger_id in (kept_id, purged_id) for number in range(7)
+    ], commit=True)
+    manager.enable_query_cache()
+    assert len(manager.fetch(Entry, ledger_id=purged_id)) == 7
+    progress = list()
+    deleted = manager.purge_ledger(
+        FileLedger,
+        purged_id,
+        chunk_size=3,
+        callback=lambda table, rows: progress.append((table, rows))
+    )
+    assert deleted == dict(entry=7, fileledger=1)
+    assert progress == [('entry', 3), ('entry', 6), ('entry', 7), ('fileledger', 1)]
+    assert not manager.fetch(Entry, ledger_id=purged_id)
+    assert manager.query(Entry, ledger_id=kept_id).count() == 7
+    assert [ledger.id for ledger in manager.query(FileLedger)] == [kept_id]
+    assert manager.purge_ledger(FileLedger, purged_id) == dict(entry=0, fileledger=0)
+
+def test_linked_tables_reference_the_ledger(manager):
+    assert [
+        (table.name, column.name) for table, column in manager.linked_tables(FileLedger)
+    ] == [('entry', 'ledger_id')]
@@ -0,0 +1,56 @@
+## -*- coding: UTF8 -*-
+## test_models.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+#pylint: disable=E1101
+from .models import Entry
+
+
+def test_populate_fields_converts_camel_case_keys():
+    entry = Entry().populate_fields(dict(RecordNumber=7, name='entry', Unknown=1))
+    assert (entry.record_number, entry.name) == (7, 'entry')
+    assert not hasattr(entry, 'unknown')
+
+def test_populate_fields_without_overwrite_only_fills_missing_values():
+    entry = Entry(name='kept').populate_fields(
+        dict(name='replaced', recordNumber=3),
+        overwrite=False
+    )
+    assert (entry.record_number, entry.name) == (3, 'kept')
+
+def test_to_mappings_drops_unknown_keys_and_null_server_defaults():
+    mappings = Entry.to_mappings([
+        dict(RecordNumber=1, LedgerId=2, Unknown='x', CreatedAt=None),
+        dict(name='entry', ledgerId=2, createdAt='2020-01-01')
+    ])
+    assert mappings == [
+        dict(record_number=1, ledger_id=2),
+        dict(name='entry', ledger_id=2, created_at='2020-01-01')
+    ]
+
+def test_to_mappings_inserts_with_server_defaults(manager, ledger):
+    manager.add_many(
+        Entry,
+        Entry.to_mappings([dict(RecordNumber=1, LedgerId=ledger.id, CreatedAt=None)]),
+        commit=True
+    )
+    assert manager.query(Entry).one().created_at is not None
@@ -0,0 +1,104 @@
+## -*- coding: UTF8 -*-
+## test_partitioning.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+#pylint: disable=W0621,E1101
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy.schema import Column, MetaData, Table
+from sqlalchemy.types import DateTime, Integer
+
+from ..partitioning import partition_table, partition_names, partition_key, \
+    partition_name
+from .models import PartitionedTable, PartitionedFileLedger, Artifact, Event, \
+    new_ledger
+
+
+@pytest.fixture
+def metadata():
+    return PartitionedTable.metadata
+
+def _partitions(manager, model):
+    with manager.engine.connect() as connection:
+        return partition_names(connection, model.__table__)
+
+def test_bootstrap_creates_range_partitions(manager):
+    table = Event.__table__
+    current = partition_name(table, partition_key(table, datetime.utcnow()))
+    assert manager.partitioned_tables() == [Artifact.__table__, table]
+    assert current in _partitions(manager, Event)
+    assert not _partitions(manager, Artifact)
+
+def test_orm_ledger_insert_creates_ledger_partition(manager):
+    ledger = new_ledger(PartitionedFileLedger)
+    manager.add(ledger).commit()
+    ledger_id = ledger.id
+    assert _partitions(manager, Artifact) == ['artifact_p%d'%ledger_id]
+    manager.add_many(Artifact, [
+        dict(ledger_id=ledger_id, record_number=number) for number in range(5)
+    ], commit=True)
+    artifact = manager.fetch(Artifact, ledger_id=ledger_id)[0]
+    artifact.name = 'renamed'
+    manager.commit()
+    assert manager.query(Artifact, name='renamed').count() == 1
+    assert manager.query(Artifact, ledger_id=ledger_id).count() == 5
+
+def test_create_partitions_skips_existing(manager):
+    timestamp = datetime(2001, 1, 15)
+    created = manager.create_partitions(timestamp=timestamp)
+    assert created == ['event_p200101', 'event_p200102']
+    assert not manager.create_partitions(timestamp=timestamp)
+    ledger = new_ledger(PartitionedFileLedger)
+    manager.add(ledger).commit()
+    ledger_id = ledger.id
+    manager.add_many(Event, [
+        dict(ledger_id=ledger_id, created_at=datetime(2001, 1, day), value=day)
+        for day in range(1, 4)
+    ], commit=True)
+    assert manager.query(Event).count() == 3
+
+def test_purge_ledger_drops_partition(manager):
+    kept, purged = new_ledger(PartitionedFileLedger, 'kept'), \
+        new_ledger(PartitionedFileLedger, 'purged')
+    manager.add(kept).add(purged).commit()
+    kept_id, purged_id = kept.id, purged.id
+    manager.add_many(Artifact, [
+        dict(ledger_id=ledger_id, record_number=number)
+        for ledger_id in (kept_id, purged_id) for number in range(3)
+    ], commit=True)
+    deleted = manager.purge_ledger(PartitionedFileLedger, purged_id)
+    assert deleted['artifact'] == 3
+    assert deleted['fileledger'] == 1
+    assert _partitions(manager, Artifact) == ['artifact_p%d'%kept_id]
+    assert manager.query(Artifact).count() == 3
+
+def test_partition_table_rejects_invalid_interval():
+    table = Table(
+        'sample',
+        MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('created_at', DateTime)
+    )
+    with pytest.raises(ValueError):
+        partition_table(table, 'created_at', 'week')
+    assert 'partition' not in table.info
@@ -0,0 +1,52 @@
+## -*- coding: UTF8 -*-
+## test_pipeline.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from ..pipeline import IngestionPipeline
+from .models import Entry
+
+
+def parse_item(item):
+    ledger_id, records = item
+    if records < 0:
+        raise ValueError('corrupt item')
+    for number in range(records):
+        yield Entry, dict(ledger_id=ledger_id, record_number=number)
+
+
+def test_serialized_pipeline_isolates_failed_items(conn_string, manager, ledger):
+    items = [(ledger.id, 10), (ledger.id, -1), (ledger.id, 5)]
+    result = IngestionPipeline(conn_string, processes=2).run(parse_item, items)
+    assert (result.items, result.rows) == (3, 15)
+    assert [failure[0] for failure in result.failures] == [items[1]]
+    assert 'corrupt item' in result.failures[0][1]
+    assert manager.query(Entry).count() == 15
+
+def test_parallel_pipeline_writes_from_workers(conn_string, manager, ledger):
+    items = [(ledger.id, 3)] * 4
+    result = IngestionPipeline(
+        conn_string,
+        processes=1,
+        serialize_writes=False
+    ).run(parse_item, items)
+    assert (result.items, result.rows, result.failures) == (4, 12, [])
+    assert manager.query(Entry).count() == 12
@@ -0,0 +1,83 @@
+## -*- coding: UTF8 -*-
+## test_queries.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+#pylint: disable=W0621
+import pytest
+
+from .. import queries
+from ..records import record_class, record_fields
+from .models import Entry
+
+
+@pytest.fixture
+def entries(manager, ledger):
+    manager.add_many(Entry, [
+        dict(ledger_id=ledger.id, record_number=number, name='entry%d'%number)
+        for number in range(3)
+    ] + [dict(ledger_id=ledger.id, record_number=3)], commit=True)
+
+@pytest.mark.usefixtures('entries')
+def test_lookup_matches_query(manager):
+    assert [entry.name for entry in manager.lookup(Entry, record_number=1)] == ['entry1']
+    assert manager.lookup(Entry, record_number=1).one() is \
+        manager.query(Entry, record_number=1).one()
+    assert manager.lookup(Entry).count() == 4
+
+@pytest.mark.usefixtures('entries')
+def test_lookup_filters_none_with_is_null(manager):
+    assert [entry.record_number for entry in manager.lookup(Entry, name=None)] == [3]
+
+@pytest.mark.usefixtures('entries')
+def test_lookup_bakes_once_per_model_and_filter_fields(manager):
+    manager.lookup(Entry, record_number=0, name='entry0').all()
+    key = (Entry, frozenset(('record_number', 'name')), frozenset())
+    baked_query = queries._BAKED_QUERIES[key] #pylint: disable=W0212
+    assert manager.lookup(Entry, name='entry2', record_number=2).one().name == 'entry2'
+    assert queries._BAKED_QUERIES[key] is baked_query #pylint: disable=W0212
+
+def test_record_class_is_generated_once_per_model():
+    cls = record_class(Entry)
+    assert record_class(Entry) is cls
+    assert cls._fields == record_fields(Entry) #pylint: disable=E1101
+    assert cls._model is Entry #pylint: disable=W0212
+    assert not hasattr(cls(*range(len(cls._fields))), '__dict__') #pylint: disable=E1101
+
+@pytest.mark.usefixtures('entries')
+def test_records_are_detached_named_tuples(manager, ledger):
+    records = manager.records(Entry, ledger_id=ledger.id)
+    assert [record.record_number for record in records] == [0, 1, 2, 3]
+    record = manager.records(Entry, record_number=1)[0]
+    assert isinstance(record, record_class(Entry))
+    assert record == tuple(
+        getattr(manager.query(Entry, record_number=1).one(), field)
+        for field in record_fields(Entry)
+    )
+    with pytest.raises(AttributeError):
+        record.name = 'renamed'
+    assert not manager.records(Entry, record_number=4)
+
+@pytest.mark.usefixtures('entries')
+def test_stream_as_records_yields_chunks(manager):
+    chunks = list(manager.stream(Entry, chunk_size=3, as_records=True))
+    assert [len(chunk) for chunk in chunks] == [3, 1]
+    assert all(isinstance(record, record_class(Entry)) for record in chunks[0])
@@ -0,0 +1,82 @@
+## -*- coding: UTF8 -*-
+## test_routing.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+#pylint: disable=W0621
+import pytest
+
+from ..manager import DBManager
+from ..engines import EngineConfig
+from ..routing import ReplicaRouter
+from .models import ModelTable, FileLedger, new_ledger
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    def database(name):
+        conn_string = 'sqlite:///%s'%(tmp_path / ('%s.db'%name))
+        manager = DBManager(conn_string, ModelTable.metadata)\
+            .initialize(bootstrap=True, create_session=True)
+        manager.add(new_ledger(name=name), commit=True)
+        manager.close_session()
+        manager.engine.dispose()
+        return conn_string
+    primary = database('primary')
+    replicas = (database('replica0'), database('replica1'))
+    manager = DBManager(primary, ModelTable.metadata, config=EngineConfig(
+        replicas=replicas
+    )).initialize(create_session=True)
+    yield manager
+    manager.close_session()
+    manager.engine.dispose()
+    manager.replica_router.dispose()
+
+def test_reads_are_balanced_across_replicas(replicated):
+    names = [replicated.query(FileLedger).one().file_name for _ in range(4)]
+    assert names == ['replica0', 'replica1', 'replica0', 'replica1']
+
+def test_primary_reads_and_writes_use_the_primary(replicated):
+    replicated.add(new_ledger(name='written'), commit=True)
+    assert [
+        ledger.file_name for ledger in replicated.query(FileLedger, primary=True)
+    ] == ['primary', 'written']
+    assert replicated.records(FileLedger, primary=True, file_name='written')
+
+def test_objects_read_from_replicas_cannot_be_written(replicated):
+    ledger = replicated.query(FileLedger).first()
+    ledger.file_name = 'modified'
+    with pytest.raises(RuntimeError):
+        replicated.commit()
+    with pytest.raises(RuntimeError):
+        replicated.read_session.flush()
+
+def test_least_busy_strategy_prefers_idle_replicas(replicated):
+    first, second = replicated.replica_router.engines
+    router = ReplicaRouter([first, second], 'least_busy')
+    with first.connect():
+        assert router.busy(first) == 1
+        assert router.choose() is second
+    assert router.busy(first) == 0
+
+def test_unknown_strategy_is_rejected(replicated):
+    with pytest.raises(ValueError):
+        ReplicaRouter(replicated.replica_router.engines, 'random')
@@ -0,0 +1,84 @@
+## -*- coding: UTF8 -*-
+## test_sharding.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+#pylint: disable=W0621
+import pytest
+
+from ..sharding import ShardedDBManager, modulo_shard, hash_shard
+from .models import ModelTable, FileLedger, Entry, new_ledger
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    sharded = ShardedDBManager(
+        ['sqlite:///%s'%(tmp_path / ('shard%d.db'%shard)) for shard in range(2)],
+        ModelTable.metadata,
+        FileLedger
+    ).initialize(bootstrap=True, create_session=True)
+    yield sharded
+    sharded.close()
+    for manager in sharded.managers:
+        manager.engine.dispose()
+
+def test_ledgers_are_allocated_ids_owned_by_their_shard(sharded):
+    ledgers = [sharded.add_ledger(new_ledger(name=str(number))) for number in range(4)]
+    assert [ledger.id for ledger in ledgers] == [2, 1, 4, 3]
+    assert [
+        sharded.shard_index(ledger.id) for ledger in ledgers
+    ] == [0, 1, 0, 1]
+    assert sharded.count(FileLedger) == 4
+
+def test_linked_rows_are_routed_to_their_ledger_shard(sharded):
+    ledgers = [sharded.add_ledger(new_ledger(name=str(number))) for number in range(2)]
+    result = sharded.add_many(Entry, [
+        dict(ledger_id=ledger.id, record_number=number)
+        for ledger in ledgers for number in range(3)
+    ], commit=True)
+    sharded.add(Entry(ledger_id=ledgers[0].id, record_number=3), commit=True)
+    assert result.rows == 6
+    for ledger in ledgers:
+        manager = sharded.manager_for(ledger.id)
+        assert manager.query(Entry).count() == manager.query(
+            Entry,
+            ledger_id=ledger.id
+        ).count()
+    assert sharded.count(Entry, ledger_id=ledgers[0].id) == 4
+    assert [
+        entry.record_number for entry in sharded.fetch(Entry, order_by='record_number')
+    ] == [0, 0, 1, 1, 2, 2, 3]
+
+def test_purge_ledger_only_touches_its_shard(sharded):
+    ledgers = [sharded.add_ledger(new_ledger(name=str(number))) for number in range(2)]
+    sharded.add_many(Entry, [
+        dict(ledger_id=ledger.id, record_number=1) for ledger in ledgers
+    ], commit=True)
+    assert sharded.purge_ledger(ledgers[1].id) == dict(entry=1, fileledger=1)
+    assert sharded.count(Entry) == 1 and sharded.count(FileLedger) == 1
+
+def test_records_without_a_ledger_cannot_be_routed(sharded):
+    with pytest.raises(ValueError):
+        sharded.add(Entry(record_number=1))
+
+def test_shard_functions_are_stable():
+    assert [modulo_shard(ledger_id, 3) for ledger_id in range(1, 5)] == [1, 2, 0, 1]
+    assert hash_shard(12345, 7) == hash_shard(12345, 7) < 7
@@ -0,0 +1,72 @@
+## -*- coding: UTF8 -*-
+## test_stream.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+#pylint: disable=W0621
+import sqlite3
+
+import pytest
+from sqlalchemy import event
+
+from .models import Entry
+
+
+@pytest.fixture
+def entries(manager, ledger):
+    manager.add_many(
+        Entry,
+        [dict(ledger_id=ledger.id, record_number=number) for number in range(10)],
+        commit=True
+    )
+
+@pytest.fixture
+def cursors(manager):
+    cursors = list()
+    def capture(_conn, cursor, *_args):
+        cursors.append(cursor)
+    event.listen(manager.engine, 'after_cursor_execute', capture)
+    yield cursors
+    event.remove(manager.engine, 'after_cursor_execute', capture)
+
+@pytest.mark.usefixtures('entries')
+def test_stream_yields_chunks_of_instances(manager):
+    chunks = list(manager.stream(Entry, chunk_size=4))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert all(isinstance(entry, Entry) for chunk in chunks for entry in chunk)
+
+@pytest.mark.usefixtures('entries')
+def test_stream_yields_rows_and_records(manager):
+    rows = [row for chunk in manager.stream(Entry, as_rows=True) for row in chunk]
+    records = [
+        record for chunk in manager.stream(Entry, as_records=True, record_number=3)
+        for record in chunk
+    ]
+    assert len(rows) == 10
+    assert [record.record_number for record in records] == [3]
+
+@pytest.mark.usefixtures('entries')
+def test_stream_closes_cursor_when_consumer_stops_early(manager, cursors):
+    chunks = manager.stream(Entry, chunk_size=3)
+    assert len(next(chunks)) == 3
+    chunks.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        cursors[-1].fetchone()
@@ -0,0 +1,88 @@
+## -*- coding: UTF8 -*-
+## test_structures.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+#pylint: disable=W0621
+
+import pytest
+from sqlalchemy import event, inspect
+
+from .models import FileLedger, Entry, Attribute
+
+
+@pytest.fixture
+def attributes(manager, ledger):
+    ledger_id = ledger.id
+    manager.add_many(Entry, [
+        dict(ledger_id=ledger_id, record_number=number) for number in range(5)
+    ], commit=True)
+    entry_ids = [entry.id for entry in manager.query(Entry).order_by(Entry.id)]
+    manager.add_many(Attribute, [
+        dict(structure_type='entry', structure_id=entry_id, name='entry')
+        for entry_id in entry_ids
+    ] + [
+        dict(structure_type='FileLedger', structure_id=ledger_id, name='ledger'),
+        dict(structure_type='entry', structure_id=0, name='orphan')
+    ], commit=True)
+    return manager.query(Attribute).order_by(Attribute.id).all()
+
+def _count_selects(engine, table, statements):
+    def before_cursor_execute(_conn, _cursor, statement, *_args):
+        if statement.startswith('SELECT') and 'FROM %s'%table in statement:
+            statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    return before_cursor_execute
+
+def test_shared_structure_tables_are_indexed(manager):
+    indexes = inspect(manager.engine).get_indexes('attribute')
+    assert dict(
+        name='idx_attribute_structure',
+        column_names=['structure_type', 'structure_id'],
+        unique=0
+    ) in indexes
+
+def test_resolve_structures_by_table_and_class_name(manager, attributes):
+    structures = manager.resolve_structures(attributes, primary=True)
+    assert [type(structure) for structure in structures[:5]] == [Entry] * 5
+    assert [structure.id for structure in structures[:5]] == \
+        [attribute.structure_id for attribute in attributes[:5]]
+    assert isinstance(structures[5], FileLedger)
+    assert structures[6] is None
+
+def test_resolve_structures_batches_ids(manager, attributes):
+    statements = list()
+    listener = _count_selects(manager.engine, 'entry', statements)
+    try:
+        manager.resolve_structures(attributes, chunk_size=2, primary=True)
+    finally:
+        event.remove(manager.engine, 'before_cursor_execute', listener)
+    assert len(statements) == 3
+
+def test_resolve_structures_accepts_records(manager, attributes):
+    records = manager.records(Attribute, primary=True)
+    structures = manager.resolve_structures(records, primary=True)
+    assert [getattr(structure, 'id', None) for structure in structures] == \
+        [getattr(structure, 'id', None) for structure in \
+            manager.resolve_structures(attributes, primary=True)]
+
+def test_resolve_structures_rejects_unknown_types(manager, attributes):
+    with pytest.raises(ValueError):
+        manager.resolve_structures(attributes, structure_types=dict(entry=Entry))
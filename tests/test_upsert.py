@@ -0,0 +1,74 @@
+## -*- coding: UTF8 -*-
+## test_upsert.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import pytest
+from sqlalchemy import inspect
+from sqlalchemy.dialects import postgresql, mysql, mssql, oracle
+
+from ..upsert import upsert_statement
+from .models import Entry
+
+
+def _entries(manager):
+    return sorted(
+        (entry.id, entry.record_number, entry.name)
+        for entry in manager.query(Entry).populate_existing()
+    )
+
+def test_upsert_inserts_and_overwrites_existing_rows(manager, ledger):
+    manager.add_many(Entry, [
+        dict(id=1, ledger_id=ledger.id, record_number=1, name='old')
+    ], commit=True)
+    result = manager.upsert(Entry, [
+        dict(id=1, ledger_id=ledger.id, record_number=10, name='new'),
+        dict(id=2, ledger_id=ledger.id, record_number=2, name='added')
+    ], conflict_keys=('id',), batch_size=1, commit=True)
+    assert (result.rows, result.batches, result.commits) == (2, 2, 1)
+    assert _entries(manager) == [(1, 10, 'new'), (2, 2, 'added')]
+
+def test_upsert_without_overwrite_only_fills_nulls(manager, ledger):
+    manager.add_many(Entry, [
+        dict(id=1, ledger_id=ledger.id, record_number=1)
+    ], commit=True)
+    manager.upsert(Entry, [
+        dict(id=1, ledger_id=ledger.id, record_number=10, name='filled')
+    ], conflict_keys=('id',), overwrite=False, commit=True)
+    assert _entries(manager) == [(1, 1, 'filled')]
+
+@pytest.mark.parametrize('dialect, expected', [
+    (postgresql.dialect(), 'ON CONFLICT (id) DO UPDATE'),
+    (mysql.dialect(), 'ON DUPLICATE KEY UPDATE'),
+    (mssql.dialect(), 'MERGE INTO entry')
+])
+def test_upsert_statement_uses_native_syntax(dialect, expected):
+    statement = upsert_statement(
+        dialect,
+        inspect(Entry).local_table,
+        ('id', 'name'),
+        ('id',)
+    )
+    assert expected in str(statement.compile(dialect=dialect))
+
+def test_upsert_statement_rejects_unsupported_dialects():
+    with pytest.raises(NotImplementedError):
+        upsert_statement(oracle.dialect(), inspect(Entry).local_table, ('id',), ('id',))
@@ -0,0 +1,122 @@
+## -*- coding: UTF8 -*-
+## test_views.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+#pylint: disable=W0621
+import pytest
+from sqlalchemy import select
+from sqlalchemy.types import Integer, DateTime
+from sqlalchemy.schema import MetaData, Table, Column
+
+from ..manager import DBManager
+from ..utils import TimestampDefaultExpression, create_view, create_view_index
+
+
+@pytest.fixture
+def metadata():
+    metadata = MetaData()
+    Table(
+        'sample',
+        metadata,
+        Column('id', Integer, primary_key=True),
+        Column('value', Integer),
+        Column('created_at', DateTime, server_default=TimestampDefaultExpression())
+    )
+    return metadata
+
+def _bootstrap(conn_string, metadata):
+    return DBManager().initialize(conn_string, metadata, bootstrap=True)
+
+def _insert(manager, metadata, *values):
+    with manager.engine.begin() as connection:
+        connection.execute(
+            metadata.tables['sample'].insert(),
+            [dict(value=value) for value in values]
+        )
+
+def _values(manager, view):
+    with manager.engine.connect() as connection:
+        return sorted(row[0] for row in connection.execute(select([view.c.value])))
+
+def test_emulated_view_is_populated_and_refreshed(conn_string, metadata):
+    sample = metadata.tables['sample']
+    view = create_view(
+        'sample_view',
+        select([sample.c.id, sample.c.value]).where(sample.c.value > 0),
+        metadata,
+        materialized=True,
+        emulate=True
+    )
+    create_view_index(view, 'idx_sample_view_value', 'value')
+    manager = _bootstrap(conn_string, metadata)
+    _insert(manager, metadata, 1, 0, 2)
+    assert _values(manager, view) == []
+    manager.refresh_view(view)
+    assert _values(manager, view) == [1, 2]
+    with manager.engine.begin() as connection:
+        connection.execute(sample.delete().where(sample.c.value == 1))
+    manager.refresh_view(view)
+    assert _values(manager, view) == [2]
+    manager.engine.dispose()
+
+def test_incremental_refresh_only_inserts_missing_rows(conn_string, metadata):
+    sample = metadata.tables['sample']
+    view = create_view(
+        'sample_view',
+        select([sample.c.id, sample.c.value, sample.c.created_at]),
+        metadata,
+        materialized=True,
+        emulate=True
+    )
+    manager = _bootstrap(conn_string, metadata)
+    _insert(manager, metadata, 1)
+    manager.refresh_view(view, incremental=True)
+    _insert(manager, metadata, 2)
+    manager.refresh_view(view, incremental=True)
+    manager.refresh_view(view, incremental=True)
+    assert _values(manager, view) == [1, 2]
+    manager.engine.dispose()
+
+def test_incremental_refresh_requires_created_at(conn_string, metadata):
+    sample = metadata.tables['sample']
+    view = create_view(
+        'sample_view',
+        select([sample.c.id, sample.c.value]),
+        metadata,
+        materialized=True,
+        emulate=True
+    )
+    manager = _bootstrap(conn_string, metadata)
+    with pytest.raises(ValueError):
+        manager.refresh_view(view, incremental=True)
+    manager.engine.dispose()
+
+def test_standard_views_are_always_current(conn_string, metadata):
+    sample = metadata.tables['sample']
+    view = create_view('sample_view', select([sample.c.value]), metadata)
+    manager = _bootstrap(conn_string, metadata)
+    _insert(manager, metadata, 3)
+    manager.refresh_view(view)
+    assert _values(manager, view) == [3]
+    with pytest.raises(ValueError):
+        create_view_index(view, 'idx_sample_view_value', 'value')
+    manager.engine.dispose()
@@ -0,0 +1,70 @@
+## -*- coding: UTF8 -*-
+## test_writer.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from ..writer import is_retryable_error
+from .models import Entry
+
+
+def test_writer_coalesces_concurrent_submissions(manager, ledger):
+    ledger_id = ledger.id
+    with manager.create_writer(max_delay=0.05) as writer:
+        with ThreadPoolExecutor(max_workers=4) as producers:
+            futures = list(producers.map(
+                lambda number: writer.submit(
+                    Entry,
+                    [dict(ledger_id=ledger_id, record_number=number)] * 10
+                ),
+                range(8)
+            ))
+        assert [future.result(timeout=10) for future in futures] == [10] * 8
+    assert manager.query(Entry).count() == 80
+
+def test_failed_submission_does_not_fail_its_group(manager, ledger):
+    ledger_id = ledger.id
+    with manager.create_writer(max_delay=0.2) as writer:
+        good = writer.submit(Entry, [dict(ledger_id=ledger_id, record_number=1)])
+        bad = writer.submit(Entry, [dict(ledger_id=ledger_id, record_number=2, id=1)] * 2)
+        assert good.result(timeout=10) == 1
+        with pytest.raises(IntegrityError):
+            bad.result(timeout=10)
+    assert [entry.record_number for entry in manager.query(Entry)] == [1]
+
+def test_closed_writer_rejects_submissions(manager):
+    writer = manager.create_writer()
+    writer.close()
+    assert not writer.running
+    with pytest.raises(RuntimeError):
+        writer.submit(Entry, [])
+
+def test_lock_errors_are_retryable():
+    def error(message):
+        return OperationalError('INSERT', {}, sqlite3.OperationalError(message))
+    assert is_retryable_error(error('database is locked'))
+    assert not is_retryable_error(error('no such table'))
+    assert not is_retryable_error(RuntimeError('database is locked'))
@@ -0,0 +1,193 @@
+## -*- coding: UTF8 -*-
+## upsert.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+#pylint: disable=W0613
+from typing import Any, Sequence
+
+from sqlalchemy import func, text, bindparam
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.engine.interfaces import Dialect
+from sqlalchemy.schema import Table
+from sqlalchemy.sql.expression import ClauseElement
+
+
+def _text_statement(table: Table, keys: Sequence[str], sql: str) -> ClauseElement:
+    """
+    Args:
+        table   => table statement inserts into
+        keys    => column keys bound by statement
+        sql     => statement SQL with one :key bind parameter per key
+    Returns:
+        Textual statement with bind parameters typed by the columns of table,
+        so that values go through the same bind processing as Core inserts.
+    Preconditions:
+        N/A
+    """
+    return text(sql).bindparams(*(
+        bindparam(key, type_=table.c[key].type) for key in keys
+    ))
+
+def _postgresql_upsert(
+    table: Table,
+    keys: Sequence[str],
+    conflict_keys: Sequence[str],
+    overwrite: bool,
+    preparer: Any
+) -> ClauseElement:
+    statement = postgresql_insert(table)
+    update = [key for key in keys if key not in conflict_keys]
+    if not update:
+        return statement.on_conflict_do_nothing(index_elements=list(conflict_keys))
+    return statement.on_conflict_do_update(
+        index_elements=list(conflict_keys),
+        set_={
+            key: statement.excluded[key] if overwrite \
+            else func.coalesce(table.c[key], statement.excluded[key]) \
+            for key in update
+        }
+    )
+
+def _sqlite_upsert(
+    table: Table,
+    keys: Sequence[str],
+    conflict_keys: Sequence[str],
+    overwrite: bool,
+    preparer: Any
+) -> ClauseElement:
+    update = [key for key in keys if key not in conflict_keys]
+    def quote(key: str) -> str:
+        return preparer.quote(table.c[key].name)
+    if not update:
+        action = 'NOTHING'
+    else:
+        action = 'UPDATE SET %s'%', '.join(
+            '%s = excluded.%s'%(quote(key), quote(key)) if overwrite \
+            else '%s = COALESCE(%s.%s, excluded.%s)'%(
+                quote(key),
+                preparer.format_table(table),
+                quote(key),
+                quote(key)
+            ) for key in update
+        )
+    sql = 'INSERT INTO %s (%s) VALUES (%s) ON CONFLICT (%s) DO %s'%(
+        preparer.format_table(table),
+        ', '.join(quote(key) for key in keys),
+        ', '.join(':%s'%key for key in keys),
+        ', '.join(quote(key) for key in conflict_keys),
+        action
+    )
+    return _text_statement(table, keys, sql)
+
+def _mysql_upsert(
+    table: Table,
+    keys: Sequence[str],
+    conflict_keys: Sequence[str],
+    overwrite: bool,
+    preparer: Any
+) -> ClauseElement:
+    statement = mysql_insert(table)
+    update = [key for key in keys if key not in conflict_keys]
+    if not update:
+        return statement.on_duplicate_key_update({
+            conflict_keys[0]: table.c[conflict_keys[0]]
+        })
+    return statement.on_duplicate_key_update({
+        key: statement.inserted[key] if overwrite \
+        else func.coalesce(table.c[key], statement.inserted[key]) \
+        for key in update
+    })
+
+def _mssql_upsert(
+    table: Table,
+    keys: Sequence[str],
+    conflict_keys: Sequence[str],
+    overwrite: bool,
+    preparer: Any
+) -> ClauseElement:
+    update = [key for key in keys if key not in conflict_keys]
+    def quote(key: str) -> str:
+        return preparer.quote(table.c[key].name)
+    sql = 'MERGE INTO %s WITH (HOLDLOCK) AS target ' \
+        'USING (VALUES (%s)) AS source (%s) ON %s'%(
+        preparer.format_table(table),
+        ', '.join(':%s'%key for key in keys),
+        ', '.join(quote(key) for key in keys),
+        ' AND '.join(
+            'target.%s = source.%s'%(quote(key), quote(key)) for key in conflict_keys
+        )
+    )
+    if update:
+        sql += ' WHEN MATCHED THEN UPDATE SET %s'%', '.join(
+            'target.%s = source.%s'%(quote(key), quote(key)) if overwrite \
+            else 'target.%s = COALESCE(target.%s, source.%s)'%(
+                quote(key),
+                quote(key),
+                quote(key)
+            ) for key in update
+        )
+    sql += ' WHEN NOT MATCHED THEN INSERT (%s) VALUES (%s);'%(
+        ', '.join(quote(key) for key in keys),
+        ', '.join('source.%s'%quote(key) for key in keys)
+    )
+    return _text_statement(table, keys, sql)
+
+_UPSERT_BUILDERS = dict(
+    postgresql=_postgresql_upsert,
+    sqlite=_sqlite_upsert,
+    mysql=_mysql_upsert,
+    mssql=_mssql_upsert
+)
+
+def upsert_statement(
+    dialect: Dialect,
+    table: Table,
+    keys: Sequence[str],
+    conflict_keys: Sequence[str],
+    overwrite: bool = True
+) -> ClauseElement:
+    """
+    Args:
+        dialect         => dialect to build statement for
+        table           => table to upsert into
+        keys            => column keys of rows to upsert (including conflict_keys)
+        conflict_keys   => column keys identifying existing rows
+        overwrite       => whether to overwrite values of existing rows
+    Returns:
+        Statement inserting a row of keys into table, or updating the existing row
+        with the same conflict_keys, compiled to the dialect's native form:
+            1) PostgreSQL, SQLite -> INSERT ... ON CONFLICT DO UPDATE
+            2) MySQL -> INSERT ... ON DUPLICATE KEY UPDATE
+            3) MSSQL -> MERGE
+        Mirroring BaseTableTemplate.populate_fields, if overwrite is True existing
+        values are replaced, otherwise only existing NULL values are filled in.
+        Rows consisting only of conflict_keys are skipped if they exist.
+    Preconditions:
+        conflict_keys is a subset of keys and matches a primary key or unique
+        constraint/index of table (which MySQL uses implicitly)
+        SQLite is version 3.24 or later
+    """
+    builder = _UPSERT_BUILDERS.get(dialect.name)
+    if builder is None:
+        raise NotImplementedError('Upsert is not supported for dialect %s'%dialect.name)
+    return builder(table, keys, conflict_keys, overwrite, dialect.identifier_preparer)
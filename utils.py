@@ -22,14 +22,83 @@
 ## SOFTWARE.
 
 #pylint: disable=W0613,E0102,R0901
-from typing import Any
+from typing import Optional, Any, Callable, Iterable, Iterator, List, Tuple, NamedTuple
+from datetime import timedelta
+from itertools import islice
 
 from sqlalchemy.types import String, Text, NVARCHAR
-from sqlalchemy.schema import Table, Column, MetaData, DDLElement
+from sqlalchemy.schema import Table, Column, MetaData, Index, DDLElement, CreateIndex
 from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.engine import Engine, Connection
 from sqlalchemy.engine.interfaces import Compiled
-from sqlalchemy.sql.expression import ClauseElement, FromClause
-from sqlalchemy.event import listen
+from sqlalchemy.sql.expression import ClauseElement, FromClause, select, func, text, \
+    exists, and_
+from sqlalchemy.event import listen, contains, remove
+from sqlalchemy.orm import scoped_session
+
+INCREMENTAL_REFRESH_LOOKBACK = timedelta(minutes=5)
+
+class BulkInsertResult(NamedTuple):
+    """Summary of a bulk insert performed by DBManager.add_many or loader.load."""
+    rows: int
+    batches: int
+    commits: int
+    elapsed: float
+
+    @property
+    def rows_per_second(self) -> float:
+        """Insert throughput in rows per second."""
+        if self.elapsed <= 0:
+            return float(self.rows)
+        return self.rows / self.elapsed
+
+
+def chunked(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """
+    Args:
+        iterable    => iterable to split into chunks
+        size        => maximum number of items per chunk
+    Returns:
+        Iterator of lists containing at most size items from iterable,
+        in order.  The final chunk may be smaller than size.
+    Preconditions:
+        size is greater than 0
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+def unscoped_sessionmaker(session_factory: Any) -> Any:
+    """
+    Args:
+        session_factory => sessionmaker or scoped_session
+    Returns:
+        The sessionmaker underlying session_factory if it is a scoped_session,
+        otherwise session_factory, i.e. to install session event listeners on.
+    Preconditions:
+        N/A
+    """
+    if isinstance(session_factory, scoped_session):
+        return session_factory.session_factory
+    return session_factory
+
+def remove_listeners(listeners: List[Tuple[Any, str, Callable[..., None]]]) -> None:
+    """
+    Args:
+        listeners   => list of (target, identifier, listener) triples installed
+                       with sqlalchemy.event.listen
+    Procedure:
+        Remove each listener in listeners that is still installed, emptying
+        listeners.
+    Preconditions:
+        N/A
+    """
+    while listeners:
+        target, identifier, listener = listeners.pop()
+        if contains(target, identifier, listener):
+            remove(target, identifier, listener)
 
 def DialectSpecificText() -> String:    #pylint: disable=C0103
     """
@@ -121,6 +190,17 @@ def generate_view_create_expression(
         compiler.sql_compiler.process(element.selectable, literal_binds=True)
     )
 
+@compiles(CreateViewExpression, 'sqlite')
+def generate_sqlite_view_create_expression(
+    element: CreateViewExpression,
+    compiler: Compiled,
+    **kwargs: Any
+) -> str:
+    return 'CREATE VIEW IF NOT EXISTS %s AS %s'%(
+        element.name,
+        compiler.sql_compiler.process(element.selectable, literal_binds=True)
+    )
+
 
 class CreateMaterializedViewExpression(CreateViewExpression):
     """Class to allow easy creation of materialized views
@@ -135,20 +215,44 @@ def generate_mview_create_expression(
     compiler: Compiled,
     **kwargs: Any
 ) -> str:
-    return 'CREATE OR REPLACE VIEW %s AS %s'%(
-        element.name,
-        compiler.process(element.selectable, literal_binds=True)
-    )
+    return generate_view_create_expression(element, compiler, **kwargs)
+
+@compiles(CreateMaterializedViewExpression, 'sqlite')
+def generate_sqlite_mview_create_expression(
+    element: CreateMaterializedViewExpression,
+    compiler: Compiled,
+    **kwargs: Any
+) -> str:
+    return generate_sqlite_view_create_expression(element, compiler, **kwargs)
 
 @compiles(CreateMaterializedViewExpression, 'postgresql')
-def generate_mview_create_expression(
+def generate_postgresql_mview_create_expression(
     element: CreateMaterializedViewExpression,
     compiler: Compiled,
     **kwargs: Any
 ) -> str:
-    return 'CREATE OR REPLACE MATERIALIZED VIEW %s AS %s'%(
+    return 'CREATE MATERIALIZED VIEW IF NOT EXISTS %s AS %s'%(
         element.name,
-        compiler.process(element.selectable, literal_binds=True)
+        compiler.sql_compiler.process(element.selectable, literal_binds=True)
+    )
+
+
+class RefreshMaterializedViewExpression(DDLElement):
+    """Class to allow refreshing of materialized views in PostgreSQL."""
+    def __init__(self, name: str, concurrently: bool = False) -> None:
+        self.name = name
+        self.concurrently = concurrently
+
+
+@compiles(RefreshMaterializedViewExpression, 'postgresql')
+def generate_mview_refresh_expression(
+    element: RefreshMaterializedViewExpression,
+    compiler: Compiled,
+    **kwargs: Any
+) -> str:
+    return 'REFRESH MATERIALIZED VIEW %s%s'%(
+        'CONCURRENTLY ' if element.concurrently else '',
+        element.name
     )
 
 
@@ -180,18 +284,128 @@ def generate_mview_drop_expression(
     return 'DROP VIEW IF EXISTS %s'%(element.name)
 
 @compiles(DropMaterializedViewExpression, 'postgresql')
-def generate_mview_drop_expression(
+def generate_postgresql_mview_drop_expression(
     element: DropMaterializedViewExpression,
     compiler: Compiled,
     **kwargs: Any
 ) -> str:
     return 'DROP MATERIALIZED VIEW IF EXISTS %s'%(element.name)
 
+def _create_materialized_view(
+    target: MetaData,
+    connection: Connection,
+    **kwargs: Any
+) -> None:
+    """
+    Args:
+        target      => metadata being created
+        connection  => connection creating metadata
+    Procedure:
+        Create the materialized views registered on target (see: create_view) that
+        do not exist yet, along with any indexes declared on them
+        (see: create_view_index).  On PostgreSQL
+        these are materialized views, and on other dialects emulated materialized
+        views are created as tables populated from their selectables, while the
+        rest fall back to standard views.
+    Preconditions:
+        N/A
+    """
+    for view in target.info.get('materialized_views', list()):
+        selectable = view.info['selectable']
+        if connection.dialect.name == 'postgresql':
+            created = connection.execute(
+                text('SELECT 1 FROM pg_matviews WHERE matviewname = :name'),
+                name=view.name
+            ).scalar() is not None
+            if not created:
+                connection.execute(
+                    CreateMaterializedViewExpression(view.name, selectable)
+                )
+                for index in view.indexes:
+                    connection.execute(CreateIndex(index))
+        elif view.info['emulated']:
+            if not connection.dialect.has_table(connection, view.name):
+                view.create(connection)
+                _populate_emulated_view(view, connection)
+        else:
+            connection.execute(CreateMaterializedViewExpression(view.name, selectable))
+
+def _drop_materialized_view(
+    target: MetaData,
+    connection: Connection,
+    **kwargs: Any
+) -> None:
+    """
+    Args:
+        target      => metadata being dropped
+        connection  => connection dropping metadata
+    Procedure:
+        Drop the materialized views registered on target (see: _create_materialized_view).
+    Preconditions:
+        N/A
+    """
+    for view in target.info.get('materialized_views', list()):
+        if connection.dialect.name != 'postgresql' and view.info['emulated']:
+            view.drop(connection, checkfirst=True)
+        else:
+            connection.execute(DropMaterializedViewExpression(view.name))
+
+def _populate_emulated_view(
+    view: Table,
+    connection: Connection,
+    incremental: bool = False
+) -> int:
+    """
+    Args:
+        view        => emulated materialized view (table) to populate
+        connection  => connection to populate view with
+        incremental => whether to only insert rows missing from view with created_at
+                       no older than INCREMENTAL_REFRESH_LOOKBACK before the newest
+                       created_at already in view (instead of replacing all rows)
+    Returns:
+        Number of rows inserted into view from its selectable.
+        NOTE:
+            Incremental refreshes look back from the newest created_at, and skip rows
+            already in view by primary key, because timestamps are not unique (i.e.
+            SQLite's CURRENT_TIMESTAMP has one second precision) and rows can commit
+            after rows with newer timestamps (i.e. PostgreSQL's NOW() is the start
+            of the transaction).
+    Preconditions:
+        If incremental is True, view has a created_at column and a primary key
+    """
+    selectable = view.info['selectable'].alias()
+    query = select([selectable])
+    if incremental:
+        if 'created_at' not in view.c:
+            raise ValueError('Cannot incrementally refresh view %s without a %s column'%(
+                view.name,
+                'created_at'
+            ))
+        primary_key = list(view.primary_key.columns)
+        if not primary_key:
+            raise ValueError(
+                'Cannot incrementally refresh view %s without a primary key'%view.name
+            )
+        last_refresh = connection.execute(select([func.max(view.c.created_at)])).scalar()
+        if last_refresh is not None:
+            query = query.where(and_(
+                selectable.c.created_at >= last_refresh - INCREMENTAL_REFRESH_LOOKBACK,
+                ~exists().where(and_(*(
+                    column == selectable.c[column.name] for column in primary_key
+                )))
+            ))
+    else:
+        connection.execute(view.delete())
+    return connection.execute(
+        view.insert().from_select([column.name for column in selectable.c], query)
+    ).rowcount
+
 def create_view(
     name: str,
     selectable: FromClause,
     metadata: MetaData,
-    materialized: bool = False
+    materialized: bool = False,
+    emulate: bool = False
 ) -> Table:
     """
     Args:
@@ -199,12 +413,16 @@ def create_view(
         selectable      => query to create view as
         metadata        => metadata to listen for events on
         materialized    => whether to create standard or materialized view
+        emulate         => whether to emulate materialized views on non-postgresql
+                           backends with a table populated from selectable
     Returns:
         Table object bound to temporary MetaData object with columns as
         columns returned from selectable (essentially creates table as view).
         NOTE:
             For non-postgresql backends, creating a materialized view
-            will result in a standard view, which cannot be indexed.
+            will result in a standard view, which cannot be indexed, unless
+            emulate is True.  Materialized views (emulated or not) can be indexed
+            (see: create_view_index) and refreshed (see: refresh_view).
     Preconditions:
         N/A
     """
@@ -214,15 +432,84 @@ def create_view(
         tbl.append_column(
             Column(column.name, column.type, primary_key=column.primary_key)
         )
-    listen(
-        metadata,
-        'after_create',
-        (CreateMaterializedViewExpression(name, selectable) \
-        if materialized else CreateViewExpression(name, selectable))
-    )
-    listen(
-        metadata,
-        'before_drop',
-        DropMaterializedViewExpression(name) if materialized else DropViewExpression(name)
+    tbl.info.update(
+        selectable=selectable,
+        materialized=materialized,
+        emulated=materialized and emulate
     )
+    if materialized:
+        if 'materialized_views' not in metadata.info:
+            metadata.info['materialized_views'] = list()
+            listen(metadata, 'after_create', _create_materialized_view)
+            listen(metadata, 'before_drop', _drop_materialized_view)
+        metadata.info['materialized_views'].append(tbl)
+    else:
+        listen(metadata, 'after_create', CreateViewExpression(name, selectable))
+        listen(metadata, 'before_drop', DropViewExpression(name))
     return tbl
+
+def create_view_index(
+    view: Table,
+    name: str,
+    *columns: str,
+    unique: bool = False
+) -> Index:
+    """
+    Args:
+        view    => materialized view returned by create_view
+        name    => name of index to create
+        columns => names of columns of view to index
+        unique  => whether to create a unique index
+    Returns:
+        Index on columns of view, created along with view.
+        NOTE:
+            On PostgreSQL, a unique index allows the view to be refreshed
+            concurrently (see: refresh_view).  Indexes on views that fall back
+            to standard views are ignored.
+    Preconditions:
+        view is a materialized view (created with materialized=True)
+        index must be declared before the metadata of view is created
+    """
+    if not view.info.get('materialized'):
+        raise ValueError(
+            'Cannot create index %s on non-materialized view %s'%(name, view.name)
+        )
+    return Index(name, *(view.c[column] for column in columns), unique=unique)
+
+def refresh_view(
+    view: Table,
+    engine: Engine,
+    concurrently: Optional[bool] = None,
+    incremental: bool = False
+) -> None:
+    """
+    Args:
+        view            => view returned by create_view
+        engine          => engine to refresh view with
+        concurrently    => whether to refresh a PostgreSQL materialized view without
+                           locking out reads (if None, refreshes concurrently when view
+                           has a unique index, which PostgreSQL requires to do so)
+        incremental     => whether to only insert rows missing since the last refresh
+                           into an emulated materialized view, based on created_at
+                           and the view's primary key
+    Procedure:
+        Refresh view in a single transaction.  PostgreSQL materialized views are
+        refreshed with REFRESH MATERIALIZED VIEW [CONCURRENTLY], and emulated
+        materialized views are repopulated from their selectable (optionally only
+        with missing rows whose created_at is within INCREMENTAL_REFRESH_LOOKBACK
+        of the newest already in view, which assumes the underlying data is
+        append-only).  Standard views are always up to date, so refreshing them
+        does nothing.
+    Preconditions:
+        view was created with create_view
+        If incremental is True, view has a created_at column and a primary key
+    """
+    if not view.info.get('materialized'):
+        return
+    with engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            if concurrently is None:
+                concurrently = any(index.unique for index in view.indexes)
+            connection.execute(RefreshMaterializedViewExpression(view.name, concurrently))
+        elif view.info['emulated']:
+            _populate_emulated_view(view, connection, incremental)
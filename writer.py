@@ -0,0 +1,361 @@
+## -*- coding: UTF8 -*-
+## writer.py
+##
+## Copyright (c) 2019 analyzeDFIR
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+
+from typing import Optional, Any, Iterable, List, NamedTuple
+from concurrent.futures import Future
+from queue import Queue, Empty
+from threading import Thread, Lock
+from time import monotonic, sleep
+
+from sqlalchemy.exc import DBAPIError
+
+_RETRYABLE_MESSAGES = ('database is locked', 'database is busy', 'deadlock')
+_RETRYABLE_CODES = ('40001', '40P01', 1205, 1213)
+_STOP = object()
+
+
+class _Submission(NamedTuple):
+    """Records submitted to a GroupCommitWriter by a single producer."""
+    model: Any
+    records: List[Any]
+    future: Future
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """
+    Args:
+        exc => exception raised while writing to the database
+    Returns:
+        Whether exc is a transient lock or deadlock error, i.e. SQLite's
+        'database is locked', PostgreSQL serialization failures and deadlocks
+        (SQLSTATE 40001/40P01), or MySQL lock wait timeouts and deadlocks
+        (errors 1205/1213), after which the transaction can be retried.
+    Preconditions:
+        N/A
+    """
+    if not isinstance(exc, DBAPIError):
+        return False
+    orig = exc.orig
+    if getattr(orig, 'pgcode', None) in _RETRYABLE_CODES:
+        return True
+    if orig is not None and orig.args and orig.args[0] in _RETRYABLE_CODES:
+        return True
+    message = str(orig).lower()
+    return any(retryable in message for retryable in _RETRYABLE_MESSAGES)
+
+
+class GroupCommitWriter: #pylint: disable=R0902
+    """Writer thread that coalesces records submitted by many producers into
+    a single transaction per time window (max_delay) or size threshold
+    (max_batch_size), rather than each producer committing (and syncing)
+    its own tiny transaction.  Transactions failing with lock or deadlock
+    errors are retried with exponential backoff.  Each submission returns a
+    Future that resolves to the number of rows written once the transaction
+    containing them has committed, or to the error that prevented it.  If a
+    group fails with a non-retryable error, its submissions are retried one
+    transaction each so that a single bad submission does not fail the others.
+    """
+
+    def __init__(self,
+        manager: 'DBManager',
+        max_batch_size: int = 10000,
+        max_delay: float = 0.05,
+        max_retries: int = 5,
+        backoff: float = 0.05,
+        max_pending: int = 0
+    ) -> None:
+        self.manager = manager
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.__queue = Queue(maxsize=max_pending)
+        self.__thread = None
+        self.__lock = Lock()
+        self.__closed = False
+
+    @property
+    def manager(self) -> 'DBManager':
+        """Getter for manager."""
+        return self.__manager
+
+    @manager.setter
+    def manager(self, value: 'DBManager') -> None:
+        """Setter for manager."""
+        self.__manager = value
+
+    @property
+    def max_batch_size(self) -> int:
+        """Getter for max_batch_size."""
+        return self.__max_batch_size
+
+    @max_batch_size.setter
+    def max_batch_size(self, value: int) -> None:
+        """Setter for max_batch_size."""
+        self.__max_batch_size = value
+
+    @property
+    def max_delay(self) -> float:
+        """Getter for max_delay."""
+        return self.__max_delay
+
+    @max_delay.setter
+    def max_delay(self, value: float) -> None:
+        """Setter for max_delay."""
+        self.__max_delay = value
+
+    @property
+    def max_retries(self) -> int:
+        """Getter for max_retries."""
+        return self.__max_retries
+
+    @max_retries.setter
+    def max_retries(self, value: int) -> None:
+        """Setter for max_retries."""
+        self.__max_retries = value
+
+    @property
+    def backoff(self) -> float:
+        """Getter for backoff."""
+        return self.__backoff
+
+    @backoff.setter
+    def backoff(self, value: float) -> None:
+        """Setter for backoff."""
+        self.__backoff = value
+
+    @property
+    def running(self) -> bool:
+        """Whether the writer thread is running."""
+        return self.__thread is not None and self.__thread.is_alive()
+
+    @property
+    def pending(self) -> int:
+        """Approximate number of submissions waiting to be written."""
+        return self.__queue.qsize()
+
+    def start(self) -> 'GroupCommitWriter':
+        """
+        Args:
+            N/A
+        Procedure:
+            Start the writer thread if it is not already running.
+        Preconditions:
+            self.manager has been initialized (see: DBManager.initialize)
+        """
+        with self.__lock:
+            if not self.running:
+                self.__closed = False
+                self.__thread = Thread(
+                    target=self.__run,
+                    name='GroupCommitWriter',
+                    daemon=True
+                )
+                self.__thread.start()
+        return self
+
+    def submit(self, model: Any, records: Iterable[Any]) -> Future:
+        """
+        Args:
+            model   => model of table to insert records into
+            records => iterable of ORM instances of model and/or dicts mapping
+                       column names to values (see: DBManager.add_many)
+        Returns:
+            Future resolving to the number of rows written once the transaction
+            containing records has committed.
+            NOTE:
+                Blocks if max_pending submissions are already waiting.
+        Preconditions:
+            self.running is True, and the writer is not being closed
+        """
+        future = Future()
+        submission = _Submission(model, list(records), future)
+        with self.__lock:
+            if self.__closed or not self.running:
+                raise RuntimeError('GroupCommitWriter is not running')
+            self.__queue.put(submission)
+        return future
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Args:
+            timeout => maximum number of seconds to wait for the writer thread
+        Procedure:
+            Stop accepting submissions, then write all pending submissions and
+            stop the writer thread.
+        Preconditions:
+            N/A
+        """
+        with self.__lock:
+            if self.__closed or not self.running:
+                return
+            self.__closed = True
+            self.__queue.put(_STOP)
+        self.__thread.join(timeout)
+
+    def __enter__(self) -> 'GroupCommitWriter':
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __run(self) -> None:
+        """
+        Args:
+            N/A
+        Procedure:
+            Writer thread entry point.  Run the writer loop, then fail the futures
+            of every submission still queued (or being written, if the loop failed
+            with an unexpected error) rather than leaving them unresolved.
+        Preconditions:
+            N/A
+        """
+        group = list()  # type: List[_Submission]
+        error = RuntimeError('GroupCommitWriter is closed')    # type: BaseException
+        try:
+            self.__loop(group)
+            group.clear()
+        except Exception as exc:   #pylint: disable=W0703
+            error = exc
+        finally:
+            while not self.__lock.acquire(timeout=0.01): #pylint: disable=R1732
+                self.__drain(group)
+            self.__closed = True
+            self.__lock.release()
+            self.__drain(group)
+            for submission in group:
+                if not submission.future.done():
+                    submission.future.set_exception(error)
+
+    def __drain(self, group: List[_Submission]) -> None:
+        """
+        Args:
+            group   => list to collect the queued submissions in
+        Procedure:
+            Remove all queued submissions (unblocking producers waiting for room
+            in the queue), collecting them in group.
+        Preconditions:
+            N/A
+        """
+        while True:
+            try:
+                submission = self.__queue.get_nowait()
+            except Empty:
+                return
+            if submission is not _STOP:
+                group.append(submission)
+
+    def __loop(self, group: List[_Submission]) -> None:
+        """
+        Args:
+            group   => list to collect the submissions being written in
+        Procedure:
+            Writer thread loop.  Wait for a submission, then collect further
+            submissions until max_batch_size records have been collected or
+            max_delay seconds have passed, and write them in one transaction.
+            Submissions whose futures were cancelled before being collected are
+            dropped.
+        Preconditions:
+            N/A
+        """
+        stopping = False
+        while not stopping:
+            group.clear()
+            submission = self.__queue.get()
+            if submission is _STOP:
+                break
+            if submission.future.set_running_or_notify_cancel():
+                group.append(submission)
+            size = len(group[0].records) if group else 0
+            deadline = monotonic() + self.max_delay
+            while size < self.max_batch_size:
+                timeout = deadline - monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    submission = self.__queue.get(timeout=timeout)
+                except Empty:
+                    break
+                if submission is _STOP:
+                    stopping = True
+                    break
+                if submission.future.set_running_or_notify_cancel():
+                    group.append(submission)
+                    size += len(submission.records)
+            if not group:
+                continue
+            error = self.__write(group)
+            if error is not None and len(group) > 1:
+                for submission in group:
+                    self.__resolve([submission], self.__write([submission]))
+            else:
+                self.__resolve(group, error)
+
+    def __write(self, group: List[_Submission]) -> Optional[BaseException]:
+        """
+        Args:
+            group   => submissions to write in a single transaction
+        Returns:
+            None if the transaction committed, otherwise the (non-retryable,
+            or final retryable) error that caused it to be rolled back.
+        Preconditions:
+            N/A
+        """
+        attempt = 0
+        while True:
+            session = self.manager.create_session(persist=False)
+            try:
+                for submission in group:
+                    self.manager.add_many(
+                        submission.model,
+                        submission.records,
+                        session=session
+                    )
+                self.manager.commit(session)
+                return None
+            except Exception as exc: #pylint: disable=W0703
+                self.manager.rollback(session)
+                if attempt >= self.max_retries or not is_retryable_error(exc):
+                    return exc
+            finally:
+                self.manager.close_session(session)
+            sleep(self.backoff * 2**attempt)
+            attempt += 1
+
+    @staticmethod
+    def __resolve(group: List[_Submission], error: Optional[BaseException]) -> None:
+        """
+        Args:
+            group   => submissions to resolve futures of
+            error   => error to resolve futures with, or None if written
+        Procedure:
+            Resolve the futures of group with the number of rows written for
+            each submission, or error.
+        Preconditions:
+            N/A
+        """
+        for submission in group:
+            if error is None:
+                submission.future.set_result(len(submission.records))
+            else:
+                submission.future.set_exception(error)